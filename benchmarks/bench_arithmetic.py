@@ -0,0 +1,75 @@
+"""Measures per-opcode throughput of the arithmetic and comparison opcodes.
+
+Each case runs a counting loop whose body evaluates one binary operator many
+times, then subtracts the cost of an otherwise identical loop body without the
+operator. Run from the repository root with `python benchmarks/bench_arithmetic.py`.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+import vm  # noqa: E402
+
+ITERATIONS = 2000
+OPS_PER_ITERATION = 20
+
+CASES = {
+    "OP_ADD": "a + b",
+    "OP_SUBTRACT": "a - b",
+    "OP_MULTIPLY": "a * b",
+    "OP_DIVIDE": "a / b",
+    "OP_GREATER": "a > b",
+    "OP_LESS": "a < b",
+}
+
+
+def make_source(expression):
+    # type: (str) -> str
+    """Builds a loop evaluating expression OPS_PER_ITERATION times per pass."""
+    body = "        x = {};\n".format(expression) * OPS_PER_ITERATION
+
+    return """\
+{
+    let a = 3;
+    let b = 7;
+    let x = 0;
+
+    for (let i = 0; i < %d; i = i + 1) {
+%s    }
+}""" % (ITERATIONS, body)
+
+
+def time_source(source, repeat=3):
+    # type: (str, int) -> float
+    """Returns the best wall-clock time of interpreting source."""
+    best = None
+
+    for _ in range(repeat):
+        emulator = vm.VM()
+        start = time.perf_counter()
+        emulator.interpret(source, 0, False)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def main():
+    baseline = time_source(make_source("a"))
+    operations = ITERATIONS * OPS_PER_ITERATION
+
+    print("{:14s} {:>14s} {:>12s}".format("opcode", "ops/sec", "ns/op"))
+
+    for name, expression in CASES.items():
+        elapsed = max(time_source(make_source(expression)) - baseline, 1e-9)
+        print("{:14s} {:>14,.0f} {:>12.1f}".format(
+            name,
+            operations / elapsed,
+            elapsed / operations * 1e9,
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Measures compile throughput on a generated source, in tokens, lines and
+megabytes of source per second. Scanning alone is timed separately, so the
+share of compile time spent in the parser and code generation can be read off
+the difference, both one token at a time as the parser does and in bulk into
+a token stream.
+
+Run from the repository root with `python benchmarks/bench_compile.py`, with
+an optional number of lines to generate.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+import chunk  # noqa: E402
+import compiler  # noqa: E402
+import scanner  # noqa: E402
+import tokens  # noqa: E402
+
+LINES = 50000
+REPEATS = 3
+
+BLOCK = """\
+fun f{0}(a, b) {{
+    let c = a * 2 + b / 3 - (a - b);
+    if (c > 10 and a < b or !(a == b)) {{
+        c = c + 1;
+    }}
+    return c;
+}}
+let v{0} = f{0}({0}, {0} + 1);
+"""
+
+
+def make_source(lines):
+    # type: (int) -> str
+    """Returns a source of about the given number of lines, repeating a block
+    of function declarations, expressions and calls."""
+    blocks = max(1, lines // BLOCK.count("\n"))
+    return "".join(BLOCK.format(i) for i in range(blocks))
+
+
+def count_tokens(source):
+    # type: (str) -> int
+    """Scans source to the end, returning the number of tokens."""
+    reader = scanner.Scanner(source)
+    count = 0
+
+    while reader.scan_token().token_type != scanner.TokenType.TOKEN_EOF:
+        count += 1
+
+    return count + 1
+
+
+def best_time(function, source):
+    # type: (Callable[[str], Any], str) -> float
+    """Returns the fastest of REPEATS runs of function on source, in seconds."""
+    best = float("inf")
+
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function(source)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def compile_source(source):
+    # type: (str) -> value.ObjectFunction
+    """Compiles source into a fresh chunk."""
+    function = compiler.compile(source, chunk.Chunk(), 0)
+    assert function is not None
+
+    return function
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else LINES
+    source = make_source(lines)
+    lines = source.count("\n")
+    token_count = count_tokens(source)
+
+    scan_time = best_time(count_tokens, source)
+    tokenize_time = best_time(tokens.tokenize, source)
+    compile_time = best_time(compile_source, source)
+
+    print("{} lines, {} tokens".format(lines, token_count))
+    print("{:>8s} {:>9s} {:>12s} {:>12s} {:>8s}".format(
+        "stage", "seconds", "tokens/sec", "lines/sec", "MB/sec"))
+
+    for stage, seconds in [("scan", scan_time), ("tokenize", tokenize_time), ("compile", compile_time)]:
+        print("{:>8s} {:>9.3f} {:>12,.0f} {:>12,.0f} {:>8.2f}".format(
+            stage,
+            seconds,
+            token_count / seconds,
+            lines / seconds,
+            len(source) / seconds / 1e6,
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Runs the same scripts on the stack and register engines, comparing the
+instructions dispatched and the best run time.
+
+Stack dispatches are counted by wrapping the opcode handlers, and register
+dispatches by counting the fetches of the interpreter loop from the code of
+each function. Run from the repository root with
+`python benchmarks/bench_engines.py`.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+import vm  # noqa: E402
+
+from bench_superinstructions import SCRIPTS  # noqa: E402
+
+REPEATS = 3
+
+
+class CountedCode(list):
+    """Register code counting each instruction fetched."""
+    count = 0
+
+    def __getitem__(self, index):
+        CountedCode.count += 1
+        return list.__getitem__(self, index)
+
+
+def count_dispatches(source, engine):
+    # type: (str, str) -> int
+    """Returns the number of instructions dispatched running source."""
+    emulator = vm.VM()
+    emulator.expose = False
+
+    if engine == "stack":
+        count = [0]
+
+        def counted(handler):
+            # type: (Callable) -> Callable
+            """Wraps an opcode handler to count its calls."""
+            def handle(frame):
+                count[0] += 1
+                return handler(frame)
+
+            return handle
+
+        emulator.dispatch = [counted(handler) for handler in emulator.dispatch]
+        emulator.interpret(source)
+
+        return count[0]
+
+    # Functions are translated on their first call, so each is wrapped as it
+    # is translated
+    registers = emulator.registers
+    get_function = registers.get_function
+
+    def counted_function(function):
+        # type: (value.ObjectFunction) -> register.RegisterFunction
+        """Translates function with counted code."""
+        register_function = get_function(function)
+
+        if type(register_function.code) is not CountedCode:
+            register_function.code = CountedCode(register_function.code)
+
+        return register_function
+
+    registers.get_function = counted_function
+    CountedCode.count = 0
+    emulator.interpret(source, engine="register")
+
+    return CountedCode.count
+
+
+def best_time(source, engine):
+    # type: (str, str) -> float
+    """Returns the best time to compile and run source."""
+    best = float("inf")
+
+    for _ in range(REPEATS):
+        emulator = vm.VM()
+        emulator.expose = False
+
+        start = time.perf_counter()
+        emulator.interpret(source, engine=engine)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main():
+    print("{:12s} {:>9s} {:>11s} {:>11s} {:>8s} {:>8s}".format(
+        "script", "engine", "dispatches", "reduction", "ms", "speedup"))
+
+    for name, source in SCRIPTS.items():
+        base_count = count_dispatches(source, "stack")
+        base_time = best_time(source, "stack")
+        count = count_dispatches(source, "register")
+        best = best_time(source, "register")
+
+        print("{:12s} {:>9s} {:>11,d} {:>11s} {:>8.1f} {:>8s}".format(
+            name, "stack", base_count, "-", base_time * 1e3, "-"))
+        print("{:12s} {:>9s} {:>11,d} {:>10.1f}% {:>8.1f} {:>7.2f}x".format(
+            name, "register", count, (1 - count / base_count) * 100, best * 1e3, base_time / best))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Measures FNV-1a string hashing, for single strings from 8 bytes to 1 MB and
+for bulk hashing of many strings, with and without one 1 MB string among them.
+
+Run from the repository root with `python benchmarks/bench_hashing.py`. The bulk
+case uses NumPy when it is installed.
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+import value  # noqa: E402
+
+SIZES = [8, 64, 512, 4096, 32768, 262144, 1048576]
+BULK_COUNTS = [64, 1024, 16384]
+BULK_LENGTH = 24
+
+
+def best_of(function, repeat=3):
+    # type: (Callable[[], Any], int) -> float
+    """Returns the best wall-clock time of calling function."""
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def random_chars(length):
+    # type: (int) -> str
+    """Returns random ASCII letters of the given length."""
+    return "".join(random.choice(string.ascii_letters) for _ in range(length))
+
+
+def main():
+    print("single string")
+    print("{:>10s} {:>12s} {:>12s}".format("bytes", "usec", "MB/s"))
+
+    for size in SIZES:
+        chars = random_chars(size)
+        elapsed = best_of(lambda: value.hash_string(chars, size))
+        print("{:>10d} {:>12.1f} {:>12.2f}".format(size, elapsed * 1e6, size / elapsed / 1e6))
+
+    print("\nbulk ({} bytes each, numpy {})".format(
+        BULK_LENGTH,
+        "available" if value.numpy is not None else "not installed",
+    ))
+    print("{:>10s} {:>12s} {:>12s}".format("strings", "loop usec", "bulk usec"))
+
+    for count in BULK_COUNTS:
+        chars_list = [random_chars(BULK_LENGTH) for _ in range(count)]
+        loop = best_of(lambda: [value.hash_string(chars, len(chars)) for chars in chars_list])
+        bulk = best_of(lambda: value.hash_strings(chars_list))
+        print("{:>10d} {:>12.1f} {:>12.1f}".format(count, loop * 1e6, bulk * 1e6))
+
+    print("\nbulk with one {} byte string".format(SIZES[-1]))
+    print("{:>10s} {:>12s} {:>12s}".format("strings", "loop usec", "bulk usec"))
+
+    for count in BULK_COUNTS:
+        chars_list = [random_chars(BULK_LENGTH) for _ in range(count)] + [random_chars(SIZES[-1])]
+        loop = best_of(lambda: [value.hash_string(chars, len(chars)) for chars in chars_list])
+        bulk = best_of(lambda: value.hash_strings(chars_list))
+        print("{:>10d} {:>12.1f} {:>12.1f}".format(count, loop * 1e6, bulk * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Compares recompiling a generated source from scratch with recompiling it
+through incremental.IncrementalCompiler after small edits: changing a number
+in the middle, inserting a line at the top, which shifts the lines of every
+declaration, and appending a declaration at the end.
+
+Run from the repository root with `python benchmarks/bench_incremental.py`,
+with an optional number of lines to generate.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+import chunk  # noqa: E402
+import compiler  # noqa: E402
+import incremental  # noqa: E402
+
+LINES = 20000
+
+BLOCK = """\
+fun f{0}(a, b) {{
+    let c = a * 2 + b / 3 - (a - b);
+    if (c > 10 and a < b or !(a == b)) {{
+        c = c + 1;
+    }}
+    return c;
+}}
+let v{0} = f{0}({0}, {0} + 1);
+"""
+
+
+def make_source(lines):
+    # type: (int) -> str
+    """Returns a source of about the given number of lines."""
+    blocks = max(1, lines // BLOCK.count("\n"))
+    return "".join(BLOCK.format(i) for i in range(blocks))
+
+
+def timed(function, *args):
+    # type: (Callable, Any) -> Tuple[Any, float]
+    """Returns the result of calling function and the time taken in ms."""
+    start = time.perf_counter()
+    result = function(*args)
+
+    return result, (time.perf_counter() - start) * 1e3
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else LINES
+    source = make_source(lines)
+
+    _, full_time = timed(compiler.compile, source, chunk.Chunk(), 0)
+
+    session = incremental.IncrementalCompiler()
+    _, initial_time = timed(session.update, source)
+
+    middle = source.index("f{0}({0}, {0} + 1)".format(lines // 16))
+    number = source.index("2", middle)
+
+    edits = [
+        ("change number", (number, number + 1, "3")),
+        ("insert line", (0, 0, "let first = 0;\n")),
+        ("append line", (len(source) + 15, len(source) + 15, "print first;\n")),
+    ]
+
+    print("{} lines, {} declarations".format(source.count("\n"), len(session.functions)))
+    print("{:>14s} {:>10s} {:>9s}".format("edit", "ms", "compiled"))
+    print("{:>14s} {:>10.1f} {:>9s}".format("full compile", full_time, "-"))
+    print("{:>14s} {:>10.1f} {:>9d}".format("initial", initial_time, session.compiled_count))
+
+    for label, edit in edits:
+        _, edit_time = timed(session.edit, *edit)
+        print("{:>14s} {:>10.1f} {:>9d}".format(label, edit_time, session.compiled_count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Counts the instructions dispatched by the VM for a few scripts compiled
+with and without the peephole pass of optimize.optimize_chunk, along with
+the size of the code and the best run time.
+
+Run from the repository root with `python benchmarks/bench_peephole.py`.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+import chunk  # noqa: E402
+import compiler  # noqa: E402
+import value  # noqa: E402
+import vm  # noqa: E402
+
+REPEATS = 3
+
+CASES = {
+    "comparisons": """
+let count = 0;
+for (let i = 0; i < 5000; i = i + 1) {
+    if (i <= 2500 and i != 100 and i >= 10) count = count + 1;
+}
+""",
+    "scopes": """
+for (let i = 0; i < 3000; i = i + 1) {
+    let a = i;
+    let b = a + 1;
+    {
+        let c = a * b;
+        let d = c - a;
+        let e = d / 2;
+    }
+}
+""",
+    "conditions": """
+fun classify(n) {
+    if (n < 10 or n > 90 or n == 50) {
+        if (n != 0) return 1;
+    } else {
+        if (n >= 40 and n <= 60) return 2;
+    }
+    return 0;
+}
+
+let total = 0;
+for (let i = 0; i < 2000; i = i + 1) total = total + classify(i - i / 100 * 100);
+""",
+}
+
+
+def code_size(function):
+    # type: (value.ObjectFunction) -> int
+    """Returns the bytes of code of function and the functions nested in it."""
+    size = function.bytecode.count
+
+    for constant in function.bytecode.constants.values:
+        if value.is_function(constant):
+            size += code_size(constant)
+
+    return size
+
+
+def run_counted(source, peephole):
+    # type: (str, bool) -> Tuple[int, int, float]
+    """Returns the code size, the number of instructions dispatched and the
+    best run time of source."""
+    best = float("inf")
+
+    for _ in range(REPEATS):
+        emulator = vm.VM()
+        emulator.expose = False
+        function = compiler.compile(source, chunk.Chunk(), 0, emulator.strings, peephole=peephole)
+
+        start = time.perf_counter()
+        emulator.interpret_function(function)
+        best = min(best, time.perf_counter() - start)
+
+    # Counted in a separate run, so the count does not slow the timed runs
+    emulator = vm.VM()
+    emulator.expose = False
+    function = compiler.compile(source, chunk.Chunk(), 0, emulator.strings, peephole=peephole)
+    count = [0]
+
+    def counted(handler):
+        # type: (Callable) -> Callable
+        """Wraps an opcode handler to count its calls."""
+        def handle(frame):
+            count[0] += 1
+            return handler(frame)
+
+        return handle
+
+    emulator.dispatch = [counted(handler) for handler in emulator.dispatch]
+    emulator.interpret_function(function)
+
+    return code_size(function), count[0], best
+
+
+def main():
+    print("{:12s} {:>9s} {:>6s} {:>11s} {:>11s} {:>8s} {:>8s}".format(
+        "script", "pass", "bytes", "dispatches", "reduction", "ms", "speedup"))
+
+    for name, source in CASES.items():
+        base_size, base_count, base_time = run_counted(source, False)
+        size, count, best = run_counted(source, True)
+
+        print("{:12s} {:>9s} {:>6d} {:>11,d} {:>11s} {:>8.1f} {:>8s}".format(
+            name, "none", base_size, base_count, "-", base_time * 1e3, "-"))
+        print("{:12s} {:>9s} {:>6d} {:>11,d} {:>10.1f}% {:>8.1f} {:>7.2f}x".format(
+            name,
+            "peephole",
+            size,
+            count,
+            (1 - count / base_count) * 100,
+            best * 1e3,
+            base_time / best,
+        ))
+
+
+if __name__ == "__main__":
+    main()
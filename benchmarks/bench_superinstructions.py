@@ -0,0 +1,113 @@
+"""Profiles a few training scripts, chooses superinstructions from the
+profile and compares the instructions dispatched and the best run time of
+some scripts with and without them. The scripts include ones not in the
+training set, to show how a profile carries over.
+
+Run from the repository root with `python benchmarks/bench_superinstructions.py`.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+import chunk  # noqa: E402
+import compiler  # noqa: E402
+import superinstructions  # noqa: E402
+import vm  # noqa: E402
+
+from bench_peephole import CASES  # noqa: E402
+
+REPEATS = 3
+
+TRAINING = ["comparisons", "scopes", "conditions"]
+
+SCRIPTS = dict(CASES, **{
+    "fib": """
+fun fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+fib(18);
+""",
+    "sum": """
+let total = 0;
+for (let i = 0; i < 20000; i = i + 1) {
+    let x = i * 2 + 1;
+    if (x > 100 and x < 30000) total = total + x;
+}
+""",
+})
+
+
+def record(sources):
+    # type: (List[str]) -> superinstructions.Profile
+    """Returns the profile of running each of sources."""
+    profile = superinstructions.Profile()
+
+    for source in sources:
+        emulator = vm.VM()
+        emulator.expose = False
+        emulator.profile = profile
+        emulator.interpret(source)
+
+    return profile
+
+
+def run_counted(source, fused):
+    # type: (str, Optional[superinstructions.SuperinstructionSet]) -> Tuple[int, float]
+    """Returns the number of instructions dispatched and the best run time of
+    source."""
+    best = float("inf")
+
+    for _ in range(REPEATS):
+        emulator = vm.VM(fused)
+        emulator.expose = False
+        function = compiler.compile(source, chunk.Chunk(), 0, emulator.strings, superinstructions=fused)
+
+        start = time.perf_counter()
+        emulator.interpret_function(function)
+        best = min(best, time.perf_counter() - start)
+
+    # Counted in a separate run, so the count does not slow the timed runs
+    emulator = vm.VM(fused)
+    emulator.expose = False
+    function = compiler.compile(source, chunk.Chunk(), 0, emulator.strings, superinstructions=fused)
+    count = [0]
+
+    def counted(handler):
+        # type: (Callable) -> Callable
+        """Wraps an opcode handler to count its calls."""
+        def handle(frame):
+            count[0] += 1
+            return handler(frame)
+
+        return handle
+
+    emulator.dispatch = [handler and counted(handler) for handler in emulator.dispatch]
+    emulator.interpret_function(function)
+
+    return count[0], best
+
+
+def main():
+    fused = superinstructions.SuperinstructionSet.from_profile(record([CASES[name] for name in TRAINING]))
+
+    print("{} superinstructions from {}".format(len(fused.sequences), ", ".join(TRAINING)))
+
+    for opcode in range(fused.first_opcode, fused.first_opcode + len(fused.sequences)):
+        print("  {}".format(fused.name(opcode)))
+
+    print()
+    print("{:12s} {:>6s} {:>11s} {:>11s} {:>8s} {:>8s}".format(
+        "script", "set", "dispatches", "reduction", "ms", "speedup"))
+
+    for name, source in SCRIPTS.items():
+        base_count, base_time = run_counted(source, None)
+        count, best = run_counted(source, fused)
+
+        print("{:12s} {:>6s} {:>11,d} {:>11s} {:>8.1f} {:>8s}".format(
+            name, "none", base_count, "-", base_time * 1e3, "-"))
+        print("{:12s} {:>6s} {:>11,d} {:>10.1f}% {:>8.1f} {:>7.2f}x".format(
+            name, "fused", count, (1 - count / base_count) * 100, best * 1e3, base_time / best))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Compares Table probing strategies across load factors and under a
+delete-heavy workload, reporting lookup time alongside the probe statistics
+from Table.stats().
+
+Run from the repository root with `python benchmarks/bench_table.py`.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+import table  # noqa: E402
+import value  # noqa: E402
+
+CAPACITY = 1 << 14
+LOAD_FACTORS = [0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95]
+CHURN_ROUNDS = 5
+CHURN_LOAD = 0.7
+
+
+def make_keys(count, strings, prefix="key"):
+    # type: (int, table.Table, str) -> List[value.ObjectString]
+    """Returns count distinct interned keys."""
+    keys = []
+
+    for i in range(count):
+        chars = "{}{}".format(prefix, i)
+        keys.append(value.copy_string(chars, len(chars), strings))
+
+    return keys
+
+
+def make_table(strategy):
+    # type: (table.ProbeStrategy) -> table.Table
+    """Returns an empty table of CAPACITY slots that will not resize."""
+    hash_table = table.Table(strategy, max_load=1.0)
+    hash_table.adjust_capacity(CAPACITY)
+    hash_table.resize_count = 0
+
+    return hash_table
+
+
+def time_lookups(hash_table, keys):
+    # type: (table.Table, List[value.ObjectString]) -> float
+    """Returns nanoseconds per table_get over keys."""
+    start = time.perf_counter()
+
+    for key in keys:
+        hash_table.table_get(key)
+
+    return (time.perf_counter() - start) / len(keys) * 1e9
+
+
+def report(label, strategy, hash_table, hits, misses):
+    # type: (str, table.ProbeStrategy, table.Table, List[Any], List[Any]) -> None
+    """Prints one row of results."""
+    stats = hash_table.stats()
+
+    print("{:>8s} {:>18s} {:>9.1f} {:>9.1f} {:>7.2f} {:>5d} {:>10.3f}".format(
+        label,
+        strategy.name,
+        time_lookups(hash_table, hits),
+        time_lookups(hash_table, misses),
+        stats.average_probe_length,
+        stats.max_probe_length,
+        stats.tombstone_ratio,
+    ))
+
+
+def main():
+    random.seed(0)
+    strings = table.Table()
+    keys = make_keys(CAPACITY, strings)
+    absent = make_keys(CAPACITY // 4, strings, prefix="absent")
+
+    print("{:>8s} {:>18s} {:>9s} {:>9s} {:>7s} {:>5s} {:>10s}".format(
+        "load", "strategy", "hit ns", "miss ns", "avg", "max", "tombstones"))
+
+    for load in LOAD_FACTORS:
+        live = keys[:int(CAPACITY * load)]
+
+        for strategy in table.ProbeStrategy:
+            hash_table = make_table(strategy)
+
+            for key in live:
+                hash_table.table_set(key, None)
+
+            report("{:.2f}".format(load), strategy, hash_table, live, absent)
+
+    print("\ndelete-heavy: {} rounds replacing half the keys at load {}".format(
+        CHURN_ROUNDS, CHURN_LOAD))
+
+    for strategy in table.ProbeStrategy:
+        hash_table = make_table(strategy)
+        pool = list(keys)
+        random.shuffle(pool)
+        live = pool[:int(CAPACITY * CHURN_LOAD)]
+        spare = pool[len(live):]
+
+        for key in live:
+            hash_table.table_set(key, None)
+
+        for _ in range(CHURN_ROUNDS):
+            random.shuffle(live)
+            half = len(live) // 2
+
+            for key in live[:half]:
+                hash_table.table_delete(key)
+
+            spare, live = live[:half], live[half:] + spare[:half]
+
+            for key in live[-half:]:
+                hash_table.table_set(key, None)
+
+        report("churn", strategy, hash_table, live, absent)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Compares serial tokenize with tokenize_parallel on a generated source, for
+a range of worker counts.
+
+Run from the repository root with `python benchmarks/bench_tokenize.py`, with
+an optional size of source to generate in MB.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+import tokens  # noqa: E402
+
+SIZE_MB = 8
+
+BLOCK = """\
+// generated record {0}
+let name{0} = "record {0}";
+let values{0} = {0} * 2 + 1.5 - ({0} / 3);
+let note{0} = "first line
+second line";
+"""
+
+
+def make_source(size):
+    # type: (int) -> str
+    """Returns a source of at least size bytes, with multi-line strings and
+    comments so that chunk boundaries need repair."""
+    blocks = []
+    total = 0
+    index = 0
+
+    while total < size:
+        block = BLOCK.format(index)
+        blocks.append(block)
+        total += len(block)
+        index += 1
+
+    return "".join(blocks)
+
+
+def main():
+    size = float(sys.argv[1]) if len(sys.argv) > 1 else SIZE_MB
+    source = make_source(int(size * 1e6))
+
+    start = time.perf_counter()
+    expected = tokens.tokenize(source)
+    serial_time = time.perf_counter() - start
+
+    print("{:.1f} MB, {} tokens, {} CPUs".format(len(source) / 1e6, expected.count, os.cpu_count()))
+    print("{:>8s} {:>9s} {:>8s} {:>8s}".format("workers", "seconds", "MB/sec", "speedup"))
+    print("{:>8s} {:>9.3f} {:>8.2f} {:>8.2f}".format("serial", serial_time, len(source) / serial_time / 1e6, 1.0))
+
+    for workers in [2, 4, 8]:
+        start = time.perf_counter()
+        stream = tokens.tokenize_parallel(source, workers, min_size=0)
+        parallel_time = time.perf_counter() - start
+
+        assert stream.count == expected.count and stream.starts == expected.starts
+
+        print("{:>8d} {:>9.3f} {:>8.2f} {:>8.2f}".format(
+            workers,
+            parallel_time,
+            len(source) / parallel_time / 1e6,
+            serial_time / parallel_time,
+        ))
+
+
+if __name__ == "__main__":
+    main()
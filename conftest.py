@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Tests import modules flat, as the modules in src import each other, so that
+# each module is loaded once.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "src"))
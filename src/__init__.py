@@ -1,4 +1,7 @@
 import os
 import sys
 
-sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+# Prepend so that flat imports such as `import chunk` resolve to this package
+# rather than to standard library modules of the same name.
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
@@ -1,83 +1,268 @@
-from enum import Enum
+import array
+import bisect
+import math
+from enum import Enum, IntEnum
 
-import memory
 import value
 
 
-class OpCode(Enum):
-    OP_CONSTANT = "OP_CONSTANT"
-    OP_NIL = "OP_NIL"
-    OP_TRUE = "OP_TRUE"
-    OP_FALSE = "OP_FALSE"
-    OP_POP = "OP_POP"
-    OP_GET_LOCAL = "OP_GET_LOCAL"
-    OP_SET_LOCAL = "OP_SET_LOCAL"
-    OP_GET_GLOBAL = "OP_GET_GLOBAL"
-    OP_DEFINE_GLOBAL = "OP_DEFINE_GLOBAL"
-    OP_SET_GLOBAL = "OP_SET_GLOBAL"
-    OP_EQUAL = "OP_EQUAL"
-    OP_GREATER = "OP_GREATER"
-    OP_LESS = "OP_LESS"
-    OP_ADD = "OP_ADD"
-    OP_SUBTRACT = "OP_SUBTRACT"
-    OP_MULTIPLY = "OP_MULTIPLY"
-    OP_DIVIDE = "OP_DIVIDE"
-    OP_NOT = "OP_NOT"
-    OP_NEGATE = "OP_NEGATE"
-    OP_PRINT = "OP_PRINT"
-    OP_JUMP = "OP_JUMP"
-    OP_JUMP_IF_FALSE = "OP_JUMP_IF_FALSE"
-    OP_LOOP = "OP_LOOP"
-    OP_CALL = "OP_CALL"
-    OP_RETURN = "OP_RETURN"
+class OpCode(IntEnum):
+    OP_CONSTANT = 0
+    OP_NIL = 1
+    OP_TRUE = 2
+    OP_FALSE = 3
+    OP_POP = 4
+    OP_GET_LOCAL = 5
+    OP_SET_LOCAL = 6
+    OP_GET_GLOBAL = 7
+    OP_DEFINE_GLOBAL = 8
+    OP_SET_GLOBAL = 9
+    OP_EQUAL = 10
+    OP_GREATER = 11
+    OP_LESS = 12
+    OP_ADD = 13
+    OP_SUBTRACT = 14
+    OP_MULTIPLY = 15
+    OP_DIVIDE = 16
+    OP_NOT = 17
+    OP_NEGATE = 18
+    OP_PRINT = 19
+    OP_JUMP = 20
+    OP_JUMP_IF_FALSE = 21
+    OP_LOOP = 22
+    OP_CALL = 23
+    OP_RETURN = 24
+    OP_CONSTANT_LONG = 25
+    OP_GET_GLOBAL_LONG = 26
+    OP_DEFINE_GLOBAL_LONG = 27
+    OP_SET_GLOBAL_LONG = 28
+    OP_JUMP_LONG = 29
+    OP_JUMP_IF_FALSE_LONG = 30
+    OP_LOOP_LONG = 31
+    OP_LESS_EQUAL = 32
+    OP_GREATER_EQUAL = 33
+    OP_NOT_EQUAL = 34
+    OP_POPN = 35
+
+
+class OperandType(Enum):
+    OPERAND_NONE = "OPERAND_NONE"
+    OPERAND_BYTE = "OPERAND_BYTE"
+    OPERAND_CONSTANT = "OPERAND_CONSTANT"
+    OPERAND_JUMP = "OPERAND_JUMP"
+    OPERAND_LOOP = "OPERAND_LOOP"
+    OPERAND_CONSTANT_LONG = "OPERAND_CONSTANT_LONG"
+    OPERAND_JUMP_LONG = "OPERAND_JUMP_LONG"
+    OPERAND_LOOP_LONG = "OPERAND_LOOP_LONG"
+
+
+# yapf: disable
+operand_map = {
+    OpCode.OP_CONSTANT:      OperandType.OPERAND_CONSTANT,
+    OpCode.OP_GET_LOCAL:     OperandType.OPERAND_BYTE,
+    OpCode.OP_SET_LOCAL:     OperandType.OPERAND_BYTE,
+    OpCode.OP_GET_GLOBAL:    OperandType.OPERAND_CONSTANT,
+    OpCode.OP_DEFINE_GLOBAL: OperandType.OPERAND_CONSTANT,
+    OpCode.OP_SET_GLOBAL:    OperandType.OPERAND_CONSTANT,
+    OpCode.OP_JUMP:          OperandType.OPERAND_JUMP,
+    OpCode.OP_JUMP_IF_FALSE: OperandType.OPERAND_JUMP,
+    OpCode.OP_LOOP:          OperandType.OPERAND_LOOP,
+    OpCode.OP_CALL:          OperandType.OPERAND_BYTE,
+    OpCode.OP_POPN:          OperandType.OPERAND_BYTE,
+
+    OpCode.OP_CONSTANT_LONG:      OperandType.OPERAND_CONSTANT_LONG,
+    OpCode.OP_GET_GLOBAL_LONG:    OperandType.OPERAND_CONSTANT_LONG,
+    OpCode.OP_DEFINE_GLOBAL_LONG: OperandType.OPERAND_CONSTANT_LONG,
+    OpCode.OP_SET_GLOBAL_LONG:    OperandType.OPERAND_CONSTANT_LONG,
+    OpCode.OP_JUMP_LONG:          OperandType.OPERAND_JUMP_LONG,
+    OpCode.OP_JUMP_IF_FALSE_LONG: OperandType.OPERAND_JUMP_LONG,
+    OpCode.OP_LOOP_LONG:          OperandType.OPERAND_LOOP_LONG,
+}
+
+# Wide variant of each instruction whose operand may not fit. Wide constant
+# instructions take a three byte index. Wide jumps keep their two operand bytes,
+# which index Chunk.long_jumps, so a jump can be widened when it is patched
+# without moving any code.
+long_opcode_map = {
+    OpCode.OP_CONSTANT:      OpCode.OP_CONSTANT_LONG,
+    OpCode.OP_GET_GLOBAL:    OpCode.OP_GET_GLOBAL_LONG,
+    OpCode.OP_DEFINE_GLOBAL: OpCode.OP_DEFINE_GLOBAL_LONG,
+    OpCode.OP_SET_GLOBAL:    OpCode.OP_SET_GLOBAL_LONG,
+    OpCode.OP_JUMP:          OpCode.OP_JUMP_LONG,
+    OpCode.OP_JUMP_IF_FALSE: OpCode.OP_JUMP_IF_FALSE_LONG,
+    OpCode.OP_LOOP:          OpCode.OP_LOOP_LONG,
+}
+
+# Bytes of operand following the opcode
+operand_size_map = {
+    OperandType.OPERAND_NONE:          0,
+    OperandType.OPERAND_BYTE:          1,
+    OperandType.OPERAND_CONSTANT:      1,
+    OperandType.OPERAND_JUMP:          2,
+    OperandType.OPERAND_LOOP:          2,
+    OperandType.OPERAND_CONSTANT_LONG: 3,
+    OperandType.OPERAND_JUMP_LONG:     2,
+    OperandType.OPERAND_LOOP_LONG:     2,
+}
+# yapf: enable
+
+# Indexed directly by the integer opcode, in the same way as the handler table
+# built by vm.VM, so the disassembler decodes instructions in constant time.
+operand_table = [operand_map.get(opcode, OperandType.OPERAND_NONE) for opcode in OpCode]
 
 
 class Chunk():
     def __init__(self):
         #
-        """
+        """Bytecode for one function. Opcodes and operands are stored as bytes
+        in a bytearray. Line numbers are run-length encoded, as one entry per
+        run of bytes from the same line, since they are only read when
+        reporting errors or disassembling.
         """
         self.count = 0
-        self.capacity = 0
-        self.code = None
-        self.lines = None
+        self.code = bytearray()
+        self.line_starts = array.array("I")
+        self.line_numbers = array.array("I")
         self.constants = value.ValueArray()
+        self.frozen = False
+
+        # Offsets of jumps too far for two bytes, see long_opcode_map
+        self.long_jumps = array.array("I")
+
+        # Index of each constant added so far, so identical constants share
+        # one slot of the constant pool
+        self.constant_indices = {}
+
+        # Set the code was rewritten with, see superinstructions
+        self.superinstructions = None
 
     def free_chunk(self):
         #
         """
         """
-        self.code = memory.free_array(self.code, self.capacity)
-        self.lines = memory.free_array(self.lines, self.capacity)
+        self.code = bytearray()
+        self.line_starts = array.array("I")
+        self.line_numbers = array.array("I")
         self.constants.free_value_array()
         self.count = 0
-        self.capacity = 0
+        self.frozen = False
+        self.long_jumps = array.array("I")
+        self.constant_indices = {}
+        self.superinstructions = None
 
     def write_chunk(self, byte, line):
         #
         """
         """
-        if self.capacity < self.count + 1:
-            old_capacity = self.capacity
-            self.capacity = memory.grow_capacity(old_capacity)
-            self.code = memory.grow_array(
-                self.code,
-                old_capacity,
-                self.capacity,
-            )
-            self.lines = memory.grow_array(
-                self.lines,
-                old_capacity,
-                self.capacity,
-            )
-
-        self.code[self.count] = byte
-        self.lines[self.count] = line
+        assert not self.frozen, "Cannot write to a frozen chunk."
+
+        self.code.append(byte)
+
+        if not self.line_numbers or self.line_numbers[-1] != line:
+            self.line_starts.append(self.count)
+            self.line_numbers.append(line)
+
         self.count += 1
 
+    def get_line(self, offset):
+        # type: (int) -> Optional[int]
+        """Returns the source line of the byte at offset by binary search over
+        the line runs, or None if line information was stripped or no code
+        has been written up to offset."""
+        if self.line_starts is None:
+            return None
+
+        run = bisect.bisect_right(self.line_starts, offset) - 1
+
+        if run < 0:
+            return None
+
+        return self.line_numbers[run]
+
+    def checkpoint(self):
+        # type: () -> Tuple[int, int, int]
+        """Returns the sizes of the code, the constant pool and the wide jump
+        offsets, for restore."""
+        return self.count, self.constants.count, len(self.long_jumps)
+
+    def restore(self, checkpoint):
+        # type: (Tuple[int, int, int]) -> None
+        """Drops the code, constants and wide jumps added since checkpoint, for
+        code the compiler replaces, such as operands folded into a constant."""
+        assert not self.frozen, "Cannot write to a frozen chunk."
+
+        count, constant_count, long_jump_count = checkpoint
+
+        del self.code[count:]
+        self.count = count
+        del self.long_jumps[long_jump_count:]
+
+        run = bisect.bisect_left(self.line_starts, count)
+        del self.line_starts[run:]
+        del self.line_numbers[run:]
+
+        for index in range(constant_count, self.constants.count):
+            del self.constant_indices[constant_key(self.constants.values[index])]
+            self.constants.values[index] = None
+
+        self.constants.count = constant_count
+
     def add_constant(self, value):
         #
+        """Adds value to the constant pool, returning the index of an identical
+        constant instead if the pool already holds one.
         """
+        key = constant_key(value)
+        index = self.constant_indices.get(key)
+
+        if index is None:
+            self.constants.write_value_array(value)
+            index = self.constants.count - 1
+            self.constant_indices[key] = index
+
+        return index
+
+    def add_long_jump(self, offset):
+        # type: (int) -> int
+        """Records the offset of a wide jump, returning its index."""
+        self.long_jumps.append(offset)
+        return len(self.long_jumps) - 1
+
+    def shift_lines(self, delta):
+        # type: (int) -> None
+        """Moves every line number by delta, for code whose source moved after
+        lines were inserted or removed above it."""
+        if self.line_numbers is not None:
+            self.line_numbers = array.array("I", [line + delta for line in self.line_numbers])
+
+    def freeze(self, strip_lines=False):
+        # type: (bool) -> None
+        """Ends compilation of the chunk. Code becomes immutable bytes, which
+        can be shared without copying through memoryview, and the constant
+        pool is trimmed to a tuple of its values. With strip_lines, line
+        information is dropped, for bytecode that is cached or run in
+        production where the smaller chunk matters more than error lines.
         """
-        self.constants.write_value_array(value)
-        return self.constants.count - 1
+        if self.frozen:
+            return None
+
+        self.code = bytes(self.code)
+        self.constants.values = tuple(self.constants.values or ())[:self.constants.count]
+        self.constants.capacity = self.constants.count
+        self.constant_indices = None
+        self.frozen = True
+
+        if strip_lines:
+            self.line_starts = None
+            self.line_numbers = None
+
+
+def constant_key(val):
+    # type: (value.Value) -> Tuple[Any, ...]
+    """Key under which identical constants compare equal. Numbers also record
+    their sign, so that 0 and -0 stay distinct. Objects such as interned
+    strings compare by identity."""
+    if type(val) is float:
+        return (float, val, math.copysign(1.0, val))
+
+    return (type(val), val)
@@ -1,62 +1,22 @@
 import sys
-from enum import Enum
-from typing import Any
+from enum import Enum, IntEnum
+from typing import Any, Callable, Iterator, Optional, Tuple, Union
 
 import chunk
 import debug
+import fold
+import optimize
 import scanner
+import table
 import value
 
-UINT8_MAX = 256
-UINT16_MAX = 65536
+UINT8_MAX = 255
+UINT16_MAX = 65535
+UINT24_MAX = 16777215
 UINT8_COUNT = UINT8_MAX + 1
 
 # yapf: disable
-rule_map = {
-    "TOKEN_LEFT_PAREN":    ["grouping", "call",   "PREC_CALL"],
-    "TOKEN_RIGHT_PAREN":   [None,       None,     "PREC_NONE"],
-    "TOKEN_LEFT_BRACE":    [None,       None,     "PREC_NONE"],
-    "TOKEN_RIGHT_BRACE":   [None,       None,     "PREC_NONE"],
-    "TOKEN_COMMA":         [None,       None,     "PREC_NONE"],
-    "TOKEN_DOT":           [None,       None,     "PREC_NONE"],
-    "TOKEN_MINUS":         ["unary",    "binary", "PREC_TERM"],
-    "TOKEN_PLUS":          [None,       "binary", "PREC_TERM"],
-    "TOKEN_SEMICOLON":     [None,       None,     "PREC_NONE"],
-    "TOKEN_SLASH":         [None,       "binary", "PREC_FACTOR"],
-    "TOKEN_STAR":          [None,       "binary", "PREC_FACTOR"],
-    "TOKEN_BANG":          ["unary",    None,     "PREC_NONE"],
-    "TOKEN_BANG_EQUAL":    [None,       "binary", "PREC_EQUALITY"],
-    "TOKEN_EQUAL":         [None,       None,     "PREC_NONE"],
-    "TOKEN_EQUAL_EQUAL":   [None,       "binary", "PREC_EQUALITY"],
-    "TOKEN_GREATER":       [None,       "binary", "PREC_COMPARISON"],
-    "TOKEN_GREATER_EQUAL": [None,       "binary", "PREC_COMPARISON"],
-    "TOKEN_LESS":          [None,       "binary", "PREC_COMPARISON"],
-    "TOKEN_LESS_EQUAL":    [None,       "binary", "PREC_COMPARISON"],
-    "TOKEN_IDENTIFIER":    ["variable", None,     "PREC_NONE"],
-    "TOKEN_STRING":        ["string",   None,     "PREC_NONE"],
-    "TOKEN_NUMBER":        ["number",   None,     "PREC_NONE"],
-    "TOKEN_AND":           [None,       "and_op", "PREC_AND"],
-    "TOKEN_CLASS":         [None,       None,     "PREC_NONE"],
-    "TOKEN_ELSE":          [None,       None,     "PREC_NONE"],
-    "TOKEN_FALSE":         ["literal",  None,     "PREC_NONE"],
-    "TOKEN_FOR":           [None,       None,     "PREC_NONE"],
-    "TOKEN_FUN":           [None,       None,     "PREC_NONE"],
-    "TOKEN_IF":            [None,       None,     "PREC_NONE"],
-    "TOKEN_NIL":           ["literal",  None,     "PREC_NONE"],
-    "TOKEN_OR":            [None,       "or_op",  "PREC_OR"],
-    "TOKEN_PRINT":         [None,       None,     "PREC_NONE"],
-    "TOKEN_RETURN":        [None,       None,     "PREC_NONE"],
-    "TOKEN_SUPER":         [None,       None,     "PREC_NONE"],
-    "TOKEN_THIS":          [None,       None,     "PREC_NONE"],
-    "TOKEN_TRUE":          ["literal",  None,     "PREC_NONE"],
-    "TOKEN_VAR":           [None,       None,     "PREC_NONE"],
-    "TOKEN_WHILE":         [None,       None,     "PREC_NONE"],
-    "TOKEN_ERROR":         [None,       None,     "PREC_NONE"],
-    "TOKEN_EOF":           [None,       None,     "PREC_NONE"],
-}
-
-
-class Precedence(Enum):
+class Precedence(IntEnum):
     PREC_NONE = 1
     PREC_ASSIGNMENT = 2  # =
     PREC_OR = 3          # or
@@ -68,14 +28,63 @@ class Precedence(Enum):
     PREC_UNARY = 9       # ! -
     PREC_CALL = 10       # . ()
     PREC_PRIMARY = 11
+
+
+# Prefix and infix rules name Parser methods, and are resolved once into
+# rule_table after Parser is defined
+rule_map = {
+    scanner.TokenType.TOKEN_LEFT_PAREN:    ["grouping", "call",   Precedence.PREC_CALL],
+    scanner.TokenType.TOKEN_RIGHT_PAREN:   [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_LEFT_BRACE:    [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_RIGHT_BRACE:   [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_COMMA:         [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_DOT:           [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_MINUS:         ["unary",    "binary", Precedence.PREC_TERM],
+    scanner.TokenType.TOKEN_PLUS:          [None,       "binary", Precedence.PREC_TERM],
+    scanner.TokenType.TOKEN_SEMICOLON:     [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_SLASH:         [None,       "binary", Precedence.PREC_FACTOR],
+    scanner.TokenType.TOKEN_STAR:          [None,       "binary", Precedence.PREC_FACTOR],
+    scanner.TokenType.TOKEN_BANG:          ["unary",    None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_BANG_EQUAL:    [None,       "binary", Precedence.PREC_EQUALITY],
+    scanner.TokenType.TOKEN_EQUAL:         [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_EQUAL_EQUAL:   [None,       "binary", Precedence.PREC_EQUALITY],
+    scanner.TokenType.TOKEN_GREATER:       [None,       "binary", Precedence.PREC_COMPARISON],
+    scanner.TokenType.TOKEN_GREATER_EQUAL: [None,       "binary", Precedence.PREC_COMPARISON],
+    scanner.TokenType.TOKEN_LESS:          [None,       "binary", Precedence.PREC_COMPARISON],
+    scanner.TokenType.TOKEN_LESS_EQUAL:    [None,       "binary", Precedence.PREC_COMPARISON],
+    scanner.TokenType.TOKEN_IDENTIFIER:    ["variable", None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_STRING:        ["string",   None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_NUMBER:        ["number",   None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_AND:           [None,       "and_op", Precedence.PREC_AND],
+    scanner.TokenType.TOKEN_CLASS:         [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_ELSE:          [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_FALSE:         ["literal",  None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_FOR:           [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_FUN:           [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_IF:            [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_NIL:           ["literal",  None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_OR:            [None,       "or_op",  Precedence.PREC_OR],
+    scanner.TokenType.TOKEN_PRINT:         [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_RETURN:        [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_SUPER:         [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_THIS:          [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_TRUE:          ["literal",  None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_VAR:           [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_WHILE:         [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_ERROR:         [None,       None,     Precedence.PREC_NONE],
+    scanner.TokenType.TOKEN_EOF:           [None,       None,     Precedence.PREC_NONE],
+}
 # yapf: enable
 
 
 class ParseRule():
+    __slots__ = ("prefix", "infix", "precedence")
+
     def __init__(self, prefix, infix, precedence):
-        #
-        """
-        """
+        # type: (Optional[Callable], Optional[Callable], int) -> None
+        """Prefix and infix are unbound Parser methods, called with the parser
+        as first argument. Precedence is held as a plain int so comparisons in
+        parse_precedence avoid going through the enum."""
         self.prefix = prefix
         self.infix = infix
         self.precedence = precedence
@@ -89,6 +98,12 @@ class Local():
         self.name = scanner.Token()
         self.depth = 0
 
+        # Offset of the instruction pushing the function, for a local
+        # declared by fun, and the offsets of the code reading or assigning
+        # the local, see Parser.end_scope
+        self.function = None  # type: Optional[int]
+        self.uses = []  # type: List[int]
+
 
 class FunctionType(Enum):
     TYPE_FUNCTION = "TYPE_FUNCTION"
@@ -103,28 +118,35 @@ class Compiler():
         self.enclosing = enclosing
         self.function = None
         self.function_type = function_type
-        self.locals = [Local() for _ in range(UINT8_COUNT)]  # type: List[Local]
+        # Grown on demand up to UINT8_COUNT, as most functions have few locals
+        self.locals = [Local()]  # type: List[Local]
         self.local_count = 0
         self.scope_depth = 0
 
+        # Offsets of the instructions pushing local functions that are never
+        # used, see Parser.drop_functions
+        self.unused_functions = []  # type: List[int]
+
         # Initialization of bytecode to avoid circular dependency
         self.function = value.new_function()
         self.function.bytecode = chunk.Chunk()
 
         self.local = self.locals[self.local_count]
         self.local_count += 1
-        self.local.name.start = ""
+        self.local.name.start = 0
         self.local.name.length = 0
 
 
 class Parser():
-    def __init__(self, reader, composer, bytecode, debug_level):
-        # type: (scanner.Scanner, Compiler, chunk.Chunk, bool) -> None
-        """
+    def __init__(self, reader, composer, bytecode, debug_level, strings=None, strip_lines=False,
+                 peephole=True, superinstructions=None, dead_code=True, whole_script=False):
+        # type: (scanner.Scanner, Compiler, chunk.Chunk, bool, table.Table, bool, bool, Optional[superinstructions.SuperinstructionSet], bool, bool) -> None
+        """Rules that nest statements or expressions are generators run on an
+        explicit stack, see run_steps, so deeply nested blocks, functions and
+        expressions do not grow the Python stack.
         """
         self.reader = reader
         self.composer = composer
-        self.enclosing = composer
         self.bytecode = bytecode  # referred to in text as compiling_chunk
         self.current = None  # type: scanner.Token
         self.previous = None  # type: scanner.Token
@@ -132,6 +154,36 @@ class Parser():
         self.panic_mode = False
         self.debug_level = debug_level
 
+        # Whether scanning the current token reported a lexer error, see
+        # compile_declarations
+        self.scan_error = False
+
+        # Intern table shared with the VM, so constants are interned strings
+        self.strings = strings if strings is not None else table.Table()
+
+        # Drop line information from finished chunks, see Chunk.freeze
+        self.strip_lines = strip_lines
+
+        # Rewrite finished chunks with optimize.optimize_chunk, then with a
+        # superinstructions.SuperinstructionSet if given
+        self.peephole = peephole
+        self.superinstructions = superinstructions
+
+        # Leave out code that never runs and functions that are never used,
+        # see drop_functions. With whole_script, the source is the whole
+        # program, so global functions it never uses can be dropped too,
+        # which is not the case for a line of the REPL
+        self.dead_code = dead_code
+        self.whole_script = whole_script
+
+        # Names of the globals used by each function compiled, by id of the
+        # function, including those used by functions nested in it
+        self.global_uses = {}  # type: Dict[int, Set[str]]
+
+        # Chunk checkpoint where the left operand of the infix rule being
+        # parsed starts, see emit_binary
+        self.operand_start = (0, 0, 0)
+
     def current_chunk(self):
         #
         """
@@ -154,8 +206,7 @@ class Parser():
         elif token.token_type == scanner.TokenType.TOKEN_ERROR:
             pass
         else:
-            current_token = self.reader.source[token.start:(token.start + token.length)]
-            print("at {}".format(current_token), end="")
+            print("at {}".format(self.reader.lexeme(token)), end="")
 
         print(": {}".format(message))
         self.had_error = True
@@ -177,6 +228,7 @@ class Parser():
         """
         """
         self.previous = self.current
+        had_error = self.had_error
 
         while True:
             self.current = self.reader.scan_token()
@@ -187,7 +239,9 @@ class Parser():
             if self.current.token_type != scanner.TokenType.TOKEN_ERROR:
                 break
 
-            self.error_at_current(self.current.start)
+            self.error_at_current(self.reader.error_message)
+
+        self.scan_error = self.had_error and not had_error
 
     def consume(self, token_type, message):
         # type: (scanner.TokenType, str) -> None
@@ -232,12 +286,14 @@ class Parser():
         #
         """
         """
-        self.emit_byte(chunk.OpCode.OP_LOOP)
-
-        offset = self.current_chunk().count - loop_start + 2
+        # +3 to include the loop instruction itself
+        offset = self.current_chunk().count - loop_start + 3
 
         if offset > UINT16_MAX:
-            self.error("Loop body too large.")
+            self.emit_byte(chunk.OpCode.OP_LOOP_LONG)
+            offset = self.add_long_jump(offset)
+        else:
+            self.emit_byte(chunk.OpCode.OP_LOOP)
 
         self.emit_byte((offset >> 8) & 0xff)
         self.emit_byte(offset & 0xff)
@@ -259,36 +315,78 @@ class Parser():
         self.emit_byte(chunk.OpCode.OP_NIL)
         self.emit_byte(chunk.OpCode.OP_RETURN)
 
+    def add_long_jump(self, offset):
+        # type: (int) -> int
+        """Records a jump offset too large for two bytes in the chunk, returning
+        the index that the wide jump instruction takes as operand."""
+        index = self.current_chunk().add_long_jump(offset)
+
+        if index > UINT16_MAX:
+            self.error("Too many long jumps in one chunk.")
+            return 0
+
+        return index
+
     def make_constant(self, val):
         #
         """
         """
         constant = self.current_chunk().add_constant(val)
 
-        if constant > UINT8_MAX:
+        if constant > UINT24_MAX:
             self.error("Too many constants in one chunk.")
-            return None
+            return 0
 
         return constant
 
+    def emit_constant_op(self, op, index):
+        # type: (chunk.OpCode, int) -> None
+        """Emits instruction taking a constant index, switching to the wide
+        variant of the instruction if index does not fit in one byte."""
+        if index <= UINT8_MAX:
+            self.emit_bytes(op, index)
+            return None
+
+        self.emit_byte(chunk.long_opcode_map[op])
+        self.emit_byte((index >> 16) & 0xff)
+        self.emit_byte((index >> 8) & 0xff)
+        self.emit_byte(index & 0xff)
+
     def emit_constant(self, val):
         #
         """
         """
-        self.emit_bytes(chunk.OpCode.OP_CONSTANT, self.make_constant(val))
+        self.emit_constant_op(chunk.OpCode.OP_CONSTANT, self.make_constant(val))
+
+    def emit_literal(self, val):
+        # type: (value.Value) -> None
+        """Emits the instruction pushing val, which is nil, a boolean, a number
+        or a string."""
+        if val is None:
+            self.emit_byte(chunk.OpCode.OP_NIL)
+        elif val is True:
+            self.emit_byte(chunk.OpCode.OP_TRUE)
+        elif val is False:
+            self.emit_byte(chunk.OpCode.OP_FALSE)
+        else:
+            self.emit_constant(val)
 
     def patch_jump(self, offset):
         #
-        """
+        """Writes the distance to the current end of chunk into the jump at
+        offset. Distances over two bytes are recorded in the chunk instead, and
+        the jump is switched to its wide variant.
         """
         # -2 to adust for the bytecode for the jump offset itself
         jump = self.current_chunk().count - offset - 2
+        code = self.current_chunk().code
 
         if jump > UINT16_MAX:
-            self.error("Too much code to jump over")
+            code[offset - 1] = chunk.long_opcode_map[code[offset - 1]]
+            jump = self.add_long_jump(jump)
 
-        self.current_chunk().code[offset] = jump >> 8 & 0xff
-        self.current_chunk().code[offset + 1] = jump & 0xff
+        code[offset] = jump >> 8 & 0xff
+        code[offset + 1] = jump & 0xff
 
     def end_compiler(self):
         #
@@ -297,13 +395,140 @@ class Parser():
         self.emit_return()
         function = self.composer.function
 
+        # Rewriting the chunk may widen more jumps than it can hold
+        try:
+            if self.dead_code and not self.had_error:
+                self.drop_functions(function)
+
+            if self.peephole and not self.had_error:
+                optimize.optimize_chunk(function.bytecode)
+
+            if self.superinstructions is not None and not self.had_error:
+                self.superinstructions.rewrite_chunk(function.bytecode)
+        except ValueError as error:
+            self.error(str(error))
+
+        function.bytecode.freeze(self.strip_lines)
+
         if self.debug_level >= 1 and not self.had_error:
             function_name = function.name or "<script>"
             debug.disassemble_chunk(self.current_chunk(), function_name)
 
-        self.composer = self.enclosing
+        self.composer = self.composer.enclosing
         return function
 
+    def discard(self, checkpoint):
+        # type: (Tuple[int, int, int]) -> None
+        """Drops the code compiled since checkpoint, which never runs, along
+        with the uses of locals and the local functions recorded in it."""
+        self.current_chunk().restore(checkpoint)
+        count = checkpoint[0]
+        composer = self.composer
+
+        composer.unused_functions = [offset for offset in composer.unused_functions if offset < count]
+
+        for local in composer.locals[:composer.local_count]:
+            if local.uses and local.uses[-1] >= count:
+                local.uses = [offset for offset in local.uses if offset < count]
+
+            if local.function is not None and local.function >= count:
+                local.function = None
+
+    def constant_condition(self, condition):
+        # type: (Tuple[int, int, int]) -> Tuple[bool, bool]
+        """Returns whether the condition compiled since checkpoint condition is
+        a literal, such as false or a folded 1 > 2, and whether it is truthy.
+        Without dead_code, conditions are never taken as literals."""
+        if not self.dead_code:
+            return False, False
+
+        is_literal, val = fold.read_literal(self.current_chunk(), condition[0], self.current_chunk().count)
+        return is_literal, is_literal and not value.is_falsey(val)
+
+    def drop_functions(self, function):
+        # type: (value.ObjectFunction) -> None
+        """Removes the functions declared in function that are never used.
+        Local functions are replaced by nil, which keeps their slot. With
+        whole_script, global functions that nothing else in the script uses
+        are removed along with their definition, see unused_globals."""
+        bytecode = function.bytecode
+        replacements = {offset: chunk.OpCode.OP_NIL for offset in self.composer.unused_functions}
+
+        if self.whole_script and self.composer.function_type == FunctionType.TYPE_SCRIPT:
+            for offset in self.unused_globals(bytecode):
+                replacements[offset] = None
+
+        if replacements:
+            for instruction in optimize.decode(bytecode):
+                if instruction.offset in replacements:
+                    # The function is freed, with the functions nested in it
+                    index = optimize.constant_index(instruction)
+                    del bytecode.constant_indices[chunk.constant_key(bytecode.constants.values[index])]
+                    bytecode.constants.values[index] = None
+
+            optimize.replace_instructions(bytecode, replacements)
+
+        if self.whole_script:
+            uses = optimize.global_uses(bytecode)
+
+            for index in range(bytecode.constants.count):
+                constant = bytecode.constants.values[index]
+
+                if value.is_function(constant):
+                    uses |= self.global_uses[id(constant)]
+
+            self.global_uses[id(function)] = uses
+
+    def unused_globals(self, bytecode):
+        # type: (chunk.Chunk) -> List[int]
+        """Returns the offsets of the definitions of global functions in the
+        script bytecode that no code outside the function itself uses, each
+        an OP_CONSTANT and OP_DEFINE_GLOBAL pair. Functions only used by
+        unused functions are unused too."""
+        instructions = optimize.decode(bytecode)
+        constants = bytecode.constants.values
+        definitions = {}
+
+        for push, define in zip(instructions, instructions[1:]):
+            if (push.opcode in (chunk.OpCode.OP_CONSTANT, chunk.OpCode.OP_CONSTANT_LONG)
+                    and define.opcode in (chunk.OpCode.OP_DEFINE_GLOBAL, chunk.OpCode.OP_DEFINE_GLOBAL_LONG)
+                    and value.is_function(constants[optimize.constant_index(push)])):
+                function = constants[optimize.constant_index(push)]
+                definitions[id(function)] = (push, define, constants[optimize.constant_index(define)].chars)
+
+        # Uses by the script itself and by the functions it does not define,
+        # such as functions local to a top-level block
+        script_uses = optimize.global_uses(bytecode)
+
+        for index in range(bytecode.constants.count):
+            if value.is_function(constants[index]) and id(constants[index]) not in definitions:
+                script_uses |= self.global_uses[id(constants[index])]
+
+        used = {key: True for key in definitions}
+
+        while True:
+            uses = set(script_uses)
+
+            for key, (_, _, name) in definitions.items():
+                if used[key]:
+                    uses |= self.global_uses[key] - {name}
+
+            unused = [key for key, (_, _, name) in definitions.items() if used[key] and name not in uses]
+
+            if not unused:
+                break
+
+            for key in unused:
+                used[key] = False
+
+        offsets = []
+
+        for key, (push, define, _) in definitions.items():
+            if not used[key]:
+                offsets += [push.offset, define.offset]
+
+        return offsets
+
     def begin_scope(self):
         #
         """
@@ -319,6 +544,11 @@ class Parser():
         while (self.composer.local_count > 0
                and self.composer.locals[self.composer.local_count - 1].depth >
                self.composer.scope_depth):
+            local = self.composer.locals[self.composer.local_count - 1]
+
+            if self.dead_code and local.function is not None and not local.uses:
+                self.composer.unused_functions.append(local.function)
+
             self.emit_byte(chunk.OpCode.OP_POP)
             self.composer.local_count -= 1
 
@@ -326,19 +556,17 @@ class Parser():
         #
         """
         """
-        chars = name.source[:name.length]
-        obj_val = value.obj_val(value.copy_string(chars, name.length))
-        return self.make_constant(obj_val)
+        chars = self.reader.lexeme(name)
+        return self.make_constant(value.copy_string(chars, name.length, self.strings))
 
-    @staticmethod
-    def identifiers_equal(a, b):
+    def identifiers_equal(self, a, b):
         #
         """
         """
-        if not a or not b or a.length != b.length:
+        if a.length != b.length:
             return False
 
-        return a.source == b.source
+        return self.reader.lexeme(a) == self.reader.lexeme(b)
 
     def resolve_local(self, name):
         #
@@ -369,11 +597,16 @@ class Parser():
             self.error("Too many local variables in function.")
             return None
 
+        if self.composer.local_count == len(self.composer.locals):
+            self.composer.locals.append(Local())
+
         local = self.composer.locals[self.composer.local_count]
         self.composer.local_count += 1
 
         local.name = name
         local.depth = -1
+        local.function = None
+        local.uses = []
 
     def declare_variable(self):
         #
@@ -435,17 +668,17 @@ class Parser():
             self.mark_initialized()
             return None
 
-        self.emit_bytes(chunk.OpCode.OP_DEFINE_GLOBAL, global_var)
+        self.emit_constant_op(chunk.OpCode.OP_DEFINE_GLOBAL, global_var)
 
     def argument_list(self):
-        # type: () -> int
-        """
-        """
+        # type: () -> Iterator[Iterator]
+        """Parses the arguments of a call and emits the call, yielding each
+        argument to run_steps."""
         arg_count = 0
 
         if not self.check(scanner.TokenType.TOKEN_RIGHT_PAREN):
             while True:
-                self.expression()
+                yield self.parse_precedence(Precedence.PREC_ASSIGNMENT)
 
                 if arg_count == 255:
                     self.error("Cannot have more than 255 arguments.")
@@ -456,32 +689,47 @@ class Parser():
                     break
 
         self.consume(scanner.TokenType.TOKEN_RIGHT_PAREN, "Expect ')' after arguments.")
-        return arg_count
+        self.emit_bytes(chunk.OpCode.OP_CALL, arg_count)
 
     def and_op(self, can_assign):
-        #
+        # type: (bool) -> Iterator[Iterator]
         """
         """
         end_jump = self.emit_jump(chunk.OpCode.OP_JUMP_IF_FALSE)
 
         self.emit_byte(chunk.OpCode.OP_POP)
-        self.parse_precedence(Precedence.PREC_AND)
+        yield self.parse_precedence(Precedence.PREC_AND)
 
         self.patch_jump(end_jump)
 
     def binary(self, can_assign):
-        #
+        # type: (bool) -> Iterator[Iterator]
         """
         """
-        # Remember the operator
         operator_type = self.previous.token_type
-
-        # Compile the right operand.
+        left_start = self.operand_start
+        right_start = self.current_chunk().checkpoint()
         rule = self.get_rule(operator_type)
 
-        # Get precedence which has 1 priority level above precedence of current rule
-        precedence = Precedence(rule.precedence.value + 1)
-        self.parse_precedence(precedence)
+        yield self.parse_precedence(rule.precedence + 1)
+        self.emit_binary(operator_type, left_start, right_start)
+
+    def emit_binary(self, operator_type, left_start, right_start):
+        # type: (scanner.TokenType, Tuple[int, int, int], Tuple[int, int, int]) -> None
+        """Emits the instructions for binary operator_type, once both operands
+        are compiled from chunk checkpoints left_start and right_start. If both
+        operands are literals, they are replaced by the folded result."""
+        bytecode = self.current_chunk()
+        is_left_literal, a = fold.read_literal(bytecode, left_start[0], right_start[0])
+        is_right_literal, b = fold.read_literal(bytecode, right_start[0], bytecode.count)
+
+        if is_left_literal and is_right_literal:
+            result = fold.fold_binary(operator_type, a, b, self.strings)
+
+            if result is not None:
+                bytecode.restore(left_start)
+                self.emit_literal(result)
+                return None
 
         if operator_type == scanner.TokenType.TOKEN_BANG_EQUAL:
             self.emit_bytes(chunk.OpCode.OP_EQUAL, chunk.OpCode.OP_NOT)
@@ -505,11 +753,10 @@ class Parser():
             self.emit_byte(chunk.OpCode.OP_DIVIDE)
 
     def call(self, can_assign):
-        # type: (bool) -> None
+        # type: (bool) -> Iterator[Iterator]
         """
         """
-        arg_count = self.argument_list()
-        self.emit_bytes(chunk.OpCode.OP_CALL, arg_count)
+        yield self.argument_list()
 
     def literal(self, can_assign):
         #
@@ -523,10 +770,10 @@ class Parser():
             self.emit_byte(chunk.OpCode.OP_TRUE)
 
     def grouping(self, can_assign):
-        #
+        # type: (bool) -> Iterator[Iterator]
         """
         """
-        self.expression()
+        yield self.parse_precedence(Precedence.PREC_ASSIGNMENT)
         self.consume(
             scanner.TokenType.TOKEN_RIGHT_PAREN,
             "Expect ')' after expression.",
@@ -536,11 +783,11 @@ class Parser():
         #
         """
         """
-        val = float(self.previous.source)
-        self.emit_constant(value.number_val(val))
+        val = float(self.reader.lexeme(self.previous))
+        self.emit_constant(val)
 
     def or_op(self, can_assign):
-        #
+        # type: (bool) -> Iterator[Iterator]
         """
         """
         else_jump = self.emit_jump(chunk.OpCode.OP_JUMP_IF_FALSE)
@@ -549,139 +796,180 @@ class Parser():
         self.patch_jump(else_jump)
         self.emit_byte(chunk.OpCode.OP_POP)
 
-        self.parse_precedence(Precedence.PREC_OR)
+        yield self.parse_precedence(Precedence.PREC_OR)
         self.patch_jump(end_jump)
 
     def string(self, can_assign):
         # type: () -> None
-        """Extracts relevant section from string, wraps in a ObjectString, wraps
-        in a Value and append to the stack."""
-        # Start from position after quote
-        chars = self.previous.source[1:self.previous.length - 1]
+        """Extracts relevant section from string, wraps in a ObjectString and
+        append to the stack."""
+        # Strip the quotes. Length is taken from the characters, since token
+        # lengths are in bytes when scanning a StreamScanner
+        chars = self.reader.lexeme(self.previous)[1:-1]
+        val = value.copy_string(chars, len(chars), self.strings)
+
+        self.emit_constant(val)
+
+    def variable_ops(self, name):
+        # type: (scanner.Token) -> Tuple[int, chunk.OpCode, chunk.OpCode]
+        """Resolves variable name, returning its slot or constant and the
+        instructions to get and set it."""
+        arg = self.resolve_local(name)
 
-        # End from position before quote and end of string token
-        val = value.copy_string(chars, self.previous.length - 2)
+        if arg != -1:
+            self.composer.locals[arg].uses.append(self.current_chunk().count)
+            return arg, chunk.OpCode.OP_GET_LOCAL, chunk.OpCode.OP_SET_LOCAL
 
-        self.emit_constant(value.obj_val(val))
+        arg = self.identifier_constant(name)
+        return arg, chunk.OpCode.OP_GET_GLOBAL, chunk.OpCode.OP_SET_GLOBAL
 
-    def named_variable(self, name, can_assign):
-        #
+    def emit_variable(self, op, arg):
+        # type: (chunk.OpCode, int) -> None
         """
         """
-        arg = self.resolve_local(name)
-
-        if arg != -1:
-            get_op = chunk.OpCode.OP_GET_LOCAL
-            set_op = chunk.OpCode.OP_SET_LOCAL
-        else:
-            arg = self.identifier_constant(name)
-            get_op = chunk.OpCode.OP_GET_GLOBAL
-            set_op = chunk.OpCode.OP_SET_GLOBAL
-
-        if can_assign and self.match(scanner.TokenType.TOKEN_EQUAL):
-            self.expression()
-            self.emit_bytes(set_op, arg)
+        if op in chunk.long_opcode_map:
+            self.emit_constant_op(op, arg)
         else:
-            self.emit_bytes(get_op, arg)
+            self.emit_bytes(op, arg)
 
     def variable(self, can_assign):
-        # type: (bool) -> None
+        # type: (bool) -> Iterator[Iterator]
         """
         """
-        self.named_variable(self.previous, can_assign)
+        arg, get_op, set_op = self.variable_ops(self.previous)
+
+        if can_assign and self.match(scanner.TokenType.TOKEN_EQUAL):
+            yield self.parse_precedence(Precedence.PREC_ASSIGNMENT)
+            self.emit_variable(set_op, arg)
+        else:
+            self.emit_variable(get_op, arg)
 
     def unary(self, can_assign):
-        #
+        # type: (bool) -> Iterator[Iterator]
         """
         """
         operator_type = self.previous.token_type
+        operand_start = self.current_chunk().checkpoint()
+
+        yield self.parse_precedence(Precedence.PREC_UNARY)
+        self.emit_unary(operator_type, operand_start)
+
+    def emit_unary(self, operator_type, operand_start):
+        # type: (scanner.TokenType, Tuple[int, int, int]) -> None
+        """Emits the instruction for unary operator_type after its operand,
+        compiled from chunk checkpoint operand_start, folding a literal
+        operand."""
+        bytecode = self.current_chunk()
+        is_literal, a = fold.read_literal(bytecode, operand_start[0], bytecode.count)
 
-        # Compile the operand
-        self.parse_precedence(Precedence.PREC_UNARY)
+        if is_literal:
+            result = fold.fold_unary(operator_type, a)
+
+            if result is not None:
+                bytecode.restore(operand_start)
+                self.emit_literal(result)
+                return None
 
-        # Emit the operator instruction
         if operator_type == scanner.TokenType.TOKEN_BANG:
             self.emit_byte(chunk.OpCode.OP_NOT)
         elif operator_type == scanner.TokenType.TOKEN_MINUS:
             self.emit_byte(chunk.OpCode.OP_NEGATE)
 
     def parse_precedence(self, precedence):
-        #
-        """
-        """
+        # type: (int) -> Iterator[Iterator]
+        """Parses an expression of at least precedence. Rules that parse
+        nested expressions are generators, which yield each nested expression
+        to run_steps, and the others return None."""
+        rules = rule_table
+
         self.advance()
-        prefix_rule = self.get_rule(self.previous.token_type).prefix
+        prefix_rule = rules[self.previous.token_type].prefix
 
         if prefix_rule is None:
             self.error("Expect expression")
             return None
 
-        can_assign = precedence.value <= Precedence.PREC_ASSIGNMENT.value
-        prefix_rule(can_assign)
+        can_assign = precedence <= Precedence.PREC_ASSIGNMENT
+        start = self.current_chunk().checkpoint()
+        steps = prefix_rule(self, can_assign)
 
-        while precedence.value <= self.get_rule(self.current.token_type).precedence.value:
-            self.advance()
+        if steps is not None:
+            yield steps
 
-            infix_rule = self.get_rule(self.previous.token_type).infix
-            infix_rule(can_assign)
+        # Infix rules all parse a right operand
+        while precedence <= rules[self.current.token_type].precedence:
+            self.advance()
+            self.operand_start = start
+            yield rules[self.previous.token_type].infix(self, can_assign)
 
         # Error if '=' not consumed as part of expression
         if can_assign and self.match(scanner.TokenType.TOKEN_EQUAL):
             self.error("Invalid assignment target.")
 
+    def run_steps(self, steps):
+        # type: (Iterator[Iterator]) -> None
+        """Runs a parsing generator on an explicit stack. A generator yields
+        another generator to have it run to completion before it resumes, in
+        place of a recursive call, so the depth of nesting is bounded by
+        memory rather than by the Python recursion limit."""
+        stack = [steps]
+        push = stack.append
+        pop = stack.pop
+
+        while stack:
+            child = next(stack[-1], None)
+
+            if child is None:
+                pop()
+            else:
+                push(child)
+
     def get_rule(self, token_type):
         # type: (TokenType) -> ParseRule
-        """Custom function to convert TokenType to ParseRule. This allows the
-        rule_map to consist of strings, which are then replaced by respective
-        classes in the conversion process.
-        """
-        type_map = {
-            "and_op": self.and_op,
-            "binary": self.binary,
-            "call": self.call,
-            "grouping": self.grouping,
-            "literal": self.literal,
-            "number": self.number,
-            "or_op": self.or_op,
-            "string": self.string,
-            "unary": self.unary,
-            "variable": self.variable,
-        }
-
-        rule = rule_map[token_type.name]
-
-        return ParseRule(
-            prefix=type_map.get(rule[0], None),
-            infix=type_map.get(rule[1], None),
-            precedence=Precedence[rule[2]],
-        )
+        """
+        """
+        return rule_table[token_type]
 
     def expression(self):
         #
         """
         """
-        self.parse_precedence(Precedence.PREC_ASSIGNMENT)
+        self.run_steps(self.parse_precedence(Precedence.PREC_ASSIGNMENT))
 
     def block(self):
-        #
+        # type: () -> Iterator[Iterator]
         """
         """
+        # Code after a return never runs, and is only compiled for errors
+        unreachable = None
+
         while (not self.check(scanner.TokenType.TOKEN_RIGHT_BRACE)
                and not self.check(scanner.TokenType.TOKEN_EOF)):
-            self.declaration()
+            returns = self.dead_code and unreachable is None and self.check(scanner.TokenType.TOKEN_RETURN)
+            yield self.declaration()
+
+            if returns:
+                unreachable = self.current_chunk().checkpoint()
+
+        if unreachable is not None:
+            self.discard(unreachable)
 
         self.consume(scanner.TokenType.TOKEN_RIGHT_BRACE, "Expect '}' after block.")
 
     def function(self, function_type):
-        #
+        # type: (FunctionType) -> Iterator[Iterator]
         """
         """
-        composer = Compiler(function_type, self.enclosing)
+        composer = Compiler(function_type, self.composer)
 
         if function_type != FunctionType.TYPE_SCRIPT:
-            composer.function.name = value.copy_string(self.previous.source, self.previous.length)
+            composer.function.name = value.copy_string(
+                self.reader.lexeme(self.previous),
+                self.previous.length,
+                self.strings,
+            )
 
-        self.enclosing = composer
+        self.composer = composer
         self.begin_scope()
 
         # Compile the parameter list.
@@ -704,20 +992,25 @@ class Parser():
 
         # The body
         self.consume(scanner.TokenType.TOKEN_LEFT_BRACE, "Expect '{' before function body.")
-        self.block()
+        yield self.block()
 
         # Create the function object.
         function = self.end_compiler()
-        self.emit_bytes(chunk.OpCode.OP_CONSTANT, self.make_constant(value.obj_val(function)))
+        self.emit_constant(function)
 
     def fun_declaration(self):
-        #
+        # type: () -> Iterator[Iterator]
         """
         """
         global_fun = self.parse_variable("Expect function name.")
+        start = self.current_chunk().count
 
         self.mark_initialized()
-        self.function(FunctionType.TYPE_FUNCTION)
+        yield self.function(FunctionType.TYPE_FUNCTION)
+
+        if self.composer.scope_depth > 0:
+            self.composer.locals[self.composer.local_count - 1].function = start
+
         self.define_variable(global_fun)
 
     def var_declaration(self):
@@ -744,7 +1037,7 @@ class Parser():
         self.emit_byte(chunk.OpCode.OP_POP)
 
     def for_statement(self):
-        #
+        # type: () -> Iterator[Iterator]
         """
         """
         self.begin_scope()
@@ -763,14 +1056,23 @@ class Parser():
 
         # Exit clause with condition expression
         exit_jump = -1
+        never_runs = False
 
         if not self.match(scanner.TokenType.TOKEN_SEMICOLON):
+            condition = self.current_chunk().checkpoint()
             self.expression()
             self.consume(scanner.TokenType.TOKEN_SEMICOLON, "Expect ';' after loop condition.")
 
-            # Jump out of loop if the condition is false
-            exit_jump = self.emit_jump(chunk.OpCode.OP_JUMP_IF_FALSE)
-            self.emit_byte(chunk.OpCode.OP_POP)
+            # A literal condition is either never tested or never true
+            is_literal, truthy = self.constant_condition(condition)
+
+            if is_literal:
+                self.discard(condition)
+                never_runs = not truthy
+            else:
+                # Jump out of loop if the condition is false
+                exit_jump = self.emit_jump(chunk.OpCode.OP_JUMP_IF_FALSE)
+                self.emit_byte(chunk.OpCode.OP_POP)
 
         # Increment clause
         if not self.match(scanner.TokenType.TOKEN_RIGHT_PAREN):
@@ -785,26 +1087,50 @@ class Parser():
             loop_start = increment_start
             self.patch_jump(body_jump)
 
-        self.statement()
+        yield self.statement()
         self.emit_loop(loop_start)
 
         if exit_jump != -1:
             self.patch_jump(exit_jump)
             self.emit_byte(chunk.OpCode.OP_POP)
 
+        if never_runs:
+            self.discard(condition)
+
         self.end_scope()
 
     def if_statement(self):
-        #
+        # type: () -> Iterator[Iterator]
         """
         """
         self.consume(scanner.TokenType.TOKEN_LEFT_PAREN, "Expect '(' after 'if'")
+        condition = self.current_chunk().checkpoint()
         self.expression()
         self.consume(scanner.TokenType.TOKEN_RIGHT_PAREN, "Expect ')' after 'if'")
 
+        # With a literal condition, only the branch taken is kept
+        is_literal, truthy = self.constant_condition(condition)
+
+        if is_literal:
+            self.discard(condition)
+            branch = self.current_chunk().checkpoint()
+            yield self.statement()
+
+            if not truthy:
+                self.discard(branch)
+
+            if self.match(scanner.TokenType.TOKEN_ELSE):
+                branch = self.current_chunk().checkpoint()
+                yield self.statement()
+
+                if truthy:
+                    self.discard(branch)
+
+            return None
+
         then_jump = self.emit_jump(chunk.OpCode.OP_JUMP_IF_FALSE)
         self.emit_byte(chunk.OpCode.OP_POP)
-        self.statement()
+        yield self.statement()
 
         else_jump = self.emit_jump(chunk.OpCode.OP_JUMP)
 
@@ -812,7 +1138,7 @@ class Parser():
         self.emit_byte(chunk.OpCode.OP_POP)
 
         if self.match(scanner.TokenType.TOKEN_ELSE):
-            self.statement()
+            yield self.statement()
 
         self.patch_jump(else_jump)
 
@@ -828,7 +1154,7 @@ class Parser():
         #
         """
         """
-        if self.enclosing.function_type == FunctionType.TYPE_SCRIPT:
+        if self.composer.function_type == FunctionType.TYPE_SCRIPT:
             self.error("Cannot return from top-level code.")
 
         if self.match(scanner.TokenType.TOKEN_SEMICOLON):
@@ -839,19 +1165,34 @@ class Parser():
             self.emit_byte(chunk.OpCode.OP_RETURN)
 
     def while_statement(self):
-        #
+        # type: () -> Iterator[Iterator]
         """
         """
         loop_start = self.current_chunk().count
+        condition = self.current_chunk().checkpoint()
 
         self.consume(scanner.TokenType.TOKEN_LEFT_PAREN, "Expect '(' after 'if'")
         self.expression()
         self.consume(scanner.TokenType.TOKEN_RIGHT_PAREN, "Expect ')' after 'if'")
 
+        # A literal condition is either never tested or never true
+        is_literal, truthy = self.constant_condition(condition)
+
+        if is_literal:
+            self.discard(condition)
+            yield self.statement()
+
+            if truthy:
+                self.emit_loop(loop_start)
+            else:
+                self.discard(condition)
+
+            return None
+
         exit_jump = self.emit_jump(chunk.OpCode.OP_JUMP_IF_FALSE)
 
         self.emit_byte(chunk.OpCode.OP_POP)
-        self.statement()
+        yield self.statement()
 
         self.emit_loop(loop_start)
 
@@ -874,45 +1215,67 @@ class Parser():
             self.advance()
 
     def declaration(self):
-        #
+        # type: () -> Iterator[Iterator]
         """
         """
         if self.match(scanner.TokenType.TOKEN_FUN):
-            self.fun_declaration()
+            yield self.fun_declaration()
         elif self.match(scanner.TokenType.TOKEN_VAR):
             self.var_declaration()
         else:
-            self.statement()
+            yield self.statement()
 
         if self.panic_mode:
             self.synchronize()
 
     def statement(self):
-        #
+        # type: () -> Iterator[Iterator]
         """
         """
         if self.match(scanner.TokenType.TOKEN_PRINT):
             self.print_statement()
         elif self.match(scanner.TokenType.TOKEN_FOR):
-            self.for_statement()
+            yield self.for_statement()
         elif self.match(scanner.TokenType.TOKEN_IF):
-            self.if_statement()
+            yield self.if_statement()
         elif self.match(scanner.TokenType.TOKEN_RETURN):
             self.return_statement()
         elif self.match(scanner.TokenType.TOKEN_WHILE):
-            self.while_statement()
+            yield self.while_statement()
         elif self.match(scanner.TokenType.TOKEN_LEFT_BRACE):
             self.begin_scope()
-            self.block()
+            yield self.block()
             self.end_scope()
         else:
             self.expression_statement()
 
 
-def compile(source, bytecode, debug_level):
-    # type: (str, chunk.Chunk, bool) -> value.ObjectFunction
-    """KIV change this to Compiler class with method compile."""
-    reader = scanner.Scanner(source)
+# Built once from rule_map, so get_rule is a single dict lookup by TokenType
+rule_table = {
+    token_type: ParseRule(
+        prefix=getattr(Parser, prefix) if prefix is not None else None,
+        infix=getattr(Parser, infix) if infix is not None else None,
+        precedence=int(precedence),
+    )
+    for token_type, (prefix, infix, precedence) in rule_map.items()
+}
+
+def compile(source, bytecode, debug_level, strings=None, strip_lines=False, peephole=True,
+            superinstructions=None, dead_code=True, whole_script=False):
+    # type: (Union[str, scanner.Scanner], chunk.Chunk, bool, table.Table, bool, bool, Optional[superinstructions.SuperinstructionSet], bool, bool) -> value.ObjectFunction
+    """KIV change this to Compiler class with method compile. String constants
+    are interned in strings, which is normally the intern table of the VM.
+    With strip_lines, chunks keep no line information. Source is either the
+    text to compile or a Scanner already over it, such as a StreamScanner.
+    Without peephole, chunks are left as emitted, see optimize. Code is
+    rewritten with superinstructions if given, which must be the same set as
+    the VM running it was created with. Without dead_code, code that never
+    runs is compiled all the same, and with whole_script, source is taken to
+    be the whole program, see Parser.drop_functions."""
+    if isinstance(source, scanner.Scanner):
+        reader = source
+    else:
+        reader = scanner.Scanner(source)
     composer = Compiler(FunctionType.TYPE_SCRIPT, None)
 
     parser = Parser(
@@ -920,6 +1283,12 @@ def compile(source, bytecode, debug_level):
         composer=composer,
         bytecode=bytecode,
         debug_level=debug_level,
+        strings=strings,
+        strip_lines=strip_lines,
+        peephole=peephole,
+        superinstructions=superinstructions,
+        dead_code=dead_code,
+        whole_script=whole_script,
     )
 
     if parser.debug_level >= 2:
@@ -928,7 +1297,7 @@ def compile(source, bytecode, debug_level):
     parser.advance()
 
     while not parser.match(scanner.TokenType.TOKEN_EOF):
-        parser.declaration()
+        parser.run_steps(parser.declaration())
 
     function = parser.end_compiler()
 
@@ -936,3 +1305,48 @@ def compile(source, bytecode, debug_level):
         return None
 
     return function
+
+
+def compile_declarations(reader, debug_level=0, strings=None, strip_lines=False):
+    # type: (scanner.Scanner, int, table.Table, bool) -> Iterator[Tuple[value.ObjectFunction, scanner.Token, scanner.Token, bool, bool]]
+    """Compiles each top-level declaration from the position of reader into a
+    script function of its own. Yields the function, the first and last token
+    of the declaration, whether it had a compile error and whether scanning
+    the token after it had a lexer error. A lexer error before a declaration
+    counts against that declaration, and one after the last declaration is
+    yielded with an empty function. Top-level variables are globals resolved
+    by name, so running the functions in order is the same as running the
+    whole script."""
+    parser = Parser(
+        reader=reader,
+        composer=None,
+        bytecode=None,
+        debug_level=debug_level,
+        strings=strings,
+        strip_lines=strip_lines,
+    )
+
+    parser.advance()
+    pending = parser.scan_error
+
+    while not parser.check(scanner.TokenType.TOKEN_EOF):
+        parser.composer = Compiler(FunctionType.TYPE_SCRIPT, None)
+        parser.had_error = False
+        first = parser.current
+
+        parser.run_steps(parser.declaration())
+        function = parser.end_compiler()
+
+        # The token after the declaration is scanned as part of it, but an
+        # error scanning it belongs to the next declaration
+        had_error = pending or (parser.had_error and not parser.scan_error)
+        pending = parser.scan_error
+
+        yield function, first, parser.previous, had_error, pending
+
+    if pending:
+        parser.composer = Compiler(FunctionType.TYPE_SCRIPT, None)
+        parser.previous = parser.current
+        parser.had_error = True
+
+        yield parser.end_compiler(), parser.current, parser.current, True, False
@@ -7,7 +7,7 @@ def disassemble_chunk(bytecode, name):
     """
     """
     if isinstance(name, value.ObjectString):
-        name = "".join(name.chars)
+        name = value.as_cstring(name)
 
     print("\n== {} ==".format(name))
 
@@ -30,6 +30,18 @@ def constant_instruction(name, bytecode, offset):
     return offset + 2
 
 
+def constant_long_instruction(name, bytecode, offset):
+    #
+    """
+    """
+    code = bytecode.code
+    constant = code[offset + 1] << 16 | code[offset + 2] << 8 | code[offset + 3]
+    val = convert_value(bytecode.constants.values[constant])
+
+    print("{:16s} {:4d} '{}'".format(name, constant, val))
+    return offset + 4
+
+
 def simple_instruction(name, offset):
     #
     """
@@ -59,84 +71,95 @@ def jump_instruction(name, sign, bytecode, offset):
     return offset + 3
 
 
+def long_jump_instruction(name, sign, bytecode, offset):
+    #
+    """Wide jumps hold the index of their offset in Chunk.long_jumps.
+    """
+    index = bytecode.code[offset + 1] << 8 | bytecode.code[offset + 2]
+    jump = bytecode.long_jumps[index]
+
+    print("{:16s} {:4d} -> {}".format(name, offset, offset + 3 + sign * jump))
+    return offset + 3
+
+
 def disassemble_instruction(bytecode, offset):
     #
     """
     """
     print("{:04d}".format(offset), end=" ")
 
-    if offset > 0 and bytecode.lines[offset] == bytecode.lines[offset - 1]:
+    line = bytecode.get_line(offset)
+
+    if line is None:
+        print("   ?", end=" ")
+    elif offset > 0 and line == bytecode.get_line(offset - 1):
         print("   |", end=" ")
     else:
-        print("{:4d}".format(bytecode.lines[offset]), end=" ")
+        print("{:4d}".format(line), end=" ")
 
     instruction = bytecode.code[offset]
 
-    if instruction == chunk.OpCode.OP_CONSTANT:
-        return constant_instruction("OP_CONSTANT", bytecode, offset)
-    elif instruction == chunk.OpCode.OP_NIL:
-        return simple_instruction("OP_NIL", offset)
-    elif instruction == chunk.OpCode.OP_TRUE:
-        return simple_instruction("OP_TRUE", offset)
-    elif instruction == chunk.OpCode.OP_FALSE:
-        return simple_instruction("OP_FALSE", offset)
-    elif instruction == chunk.OpCode.OP_POP:
-        return simple_instruction("OP_POP", offset)
-    elif instruction == chunk.OpCode.OP_GET_LOCAL:
-        return byte_instruction("OP_GET_LOCAL", bytecode, offset)
-    elif instruction == chunk.OpCode.OP_SET_LOCAL:
-        return byte_instruction("OP_SET_LOCAL", bytecode, offset)
-    elif instruction == chunk.OpCode.OP_GET_GLOBAL:
-        return constant_instruction("OP_GET_GLOBAL", bytecode, offset)
-    elif instruction == chunk.OpCode.OP_DEFINE_GLOBAL:
-        return constant_instruction("OP_DEFINE_GLOBAL", bytecode, offset)
-    elif instruction == chunk.OpCode.OP_SET_GLOBAL:
-        return constant_instruction("OP_SET_GLOBAL", bytecode, offset)
-    elif instruction == chunk.OpCode.OP_EQUAL:
-        return simple_instruction("OP_EQUAL", offset)
-    elif instruction == chunk.OpCode.OP_GREATER:
-        return simple_instruction("OP_GREATER", offset)
-    elif instruction == chunk.OpCode.OP_LESS:
-        return simple_instruction("OP_LESS", offset)
-    elif instruction == chunk.OpCode.OP_ADD:
-        return simple_instruction("OP_ADD", offset)
-    elif instruction == chunk.OpCode.OP_SUBTRACT:
-        return simple_instruction("OP_SUBTRACT", offset)
-    elif instruction == chunk.OpCode.OP_MULTIPLY:
-        return simple_instruction("OP_MULTIPLY", offset)
-    elif instruction == chunk.OpCode.OP_DIVIDE:
-        return simple_instruction("OP_DIVIDE", offset)
-    elif instruction == chunk.OpCode.OP_NEGATE:
-        return simple_instruction("OP_NEGATE", offset)
-    elif instruction == chunk.OpCode.OP_PRINT:
-        return simple_instruction("OP_PRINT", offset)
-    elif instruction == chunk.OpCode.OP_NOT:
-        return simple_instruction("OP_NOT", offset)
-    elif instruction == chunk.OpCode.OP_JUMP:
-        return jump_instruction("OP_JUMP", 1, bytecode, offset)
-    elif instruction == chunk.OpCode.OP_JUMP_IF_FALSE:
-        return jump_instruction("OP_JUMP_IF_FALSE", 1, bytecode, offset)
-    elif instruction == chunk.OpCode.OP_LOOP:
-        return jump_instruction("OP_LOOP", -1, bytecode, offset)
-    elif instruction == chunk.OpCode.OP_CALL:
-        return byte_instruction("OP_CALL", bytecode, offset)
-    elif instruction == chunk.OpCode.OP_RETURN:
-        return simple_instruction("OP_RETURN", offset)
-
-    print("Unknown opcode {}".format(instruction))
-    return offset + 1
+    if instruction >= len(chunk.operand_table) and bytecode.superinstructions is not None:
+        return superinstruction(bytecode, offset)
+
+    if instruction >= len(chunk.operand_table):
+        print("Unknown opcode {}".format(instruction))
+        return offset + 1
+
+    name = chunk.OpCode(instruction).name
+    operand_type = chunk.operand_table[instruction]
+
+    if operand_type == chunk.OperandType.OPERAND_CONSTANT:
+        return constant_instruction(name, bytecode, offset)
+    elif operand_type == chunk.OperandType.OPERAND_BYTE:
+        return byte_instruction(name, bytecode, offset)
+    elif operand_type == chunk.OperandType.OPERAND_JUMP:
+        return jump_instruction(name, 1, bytecode, offset)
+    elif operand_type == chunk.OperandType.OPERAND_LOOP:
+        return jump_instruction(name, -1, bytecode, offset)
+    elif operand_type == chunk.OperandType.OPERAND_CONSTANT_LONG:
+        return constant_long_instruction(name, bytecode, offset)
+    elif operand_type == chunk.OperandType.OPERAND_JUMP_LONG:
+        return long_jump_instruction(name, 1, bytecode, offset)
+    elif operand_type == chunk.OperandType.OPERAND_LOOP_LONG:
+        return long_jump_instruction(name, -1, bytecode, offset)
+
+    return simple_instruction(name, offset)
+
+
+def superinstruction(bytecode, offset):
+    #
+    """Shows the operands of each instruction a superinstruction replaces,
+    with the target of a final jump.
+    """
+    fused = bytecode.superinstructions
+    instruction = bytecode.code[offset]
+    operands = []
+    position = offset + 1
+
+    for component in fused.sequence(instruction):
+        size = chunk.operand_size_map[chunk.operand_table[component]]
+
+        if component in (chunk.OpCode.OP_JUMP, chunk.OpCode.OP_JUMP_IF_FALSE):
+            jump = bytecode.code[position] << 8 | bytecode.code[position + 1]
+            operands.append("-> {}".format(position + 2 + jump))
+        elif component == chunk.OpCode.OP_LOOP:
+            jump = bytecode.code[position] << 8 | bytecode.code[position + 1]
+            operands.append("-> {}".format(position + 2 - jump))
+        elif size == 1:
+            operands.append("{}".format(bytecode.code[position]))
+
+        position += size
+
+    print("{} {}".format(fused.name(instruction), " ".join(operands)).rstrip())
+    return position
 
 
 def convert_value(val):
     #
     """
     """
-    if isinstance(val, value.Value):
-        if val.is_function():
-            return val.as_function_name()
-        elif val.is_string():
-            return "".join(val.as_cstring())
-
-        return val.value_as
+    if value.is_obj(val):
+        return value.format_value(val)
 
     return val
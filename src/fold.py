@@ -0,0 +1,84 @@
+from typing import Optional, Tuple
+
+import chunk
+import scanner
+import table
+import value
+
+# Instructions that push a literal without an operand
+literal_opcode_map = {
+    chunk.OpCode.OP_NIL: None,
+    chunk.OpCode.OP_TRUE: True,
+    chunk.OpCode.OP_FALSE: False,
+}
+
+
+def read_literal(bytecode, start, end):
+    # type: (chunk.Chunk, int, int) -> Tuple[bool, value.Value]
+    """Returns whether the code of bytecode from start to end is a single
+    instruction pushing a literal, and the value of the literal."""
+    code = bytecode.code
+    size = end - start
+
+    if size == 1 and code[start] in literal_opcode_map:
+        return True, literal_opcode_map[code[start]]
+
+    if size == 2 and code[start] == chunk.OpCode.OP_CONSTANT:
+        index = code[start + 1]
+    elif size == 4 and code[start] == chunk.OpCode.OP_CONSTANT_LONG:
+        index = (code[start + 1] << 16) | (code[start + 2] << 8) | code[start + 3]
+    else:
+        return False, None
+
+    return True, bytecode.constants.values[index]
+
+
+def fold_binary(operator_type, a, b, strings):
+    # type: (scanner.TokenType, value.Value, value.Value, table.Table) -> Optional[value.Value]
+    """Evaluates binary operator_type on literals a and b as the VM would, see
+    compiler.Parser.emit_binary. Returns None if the VM would raise a runtime
+    error instead, which is left for the VM to report. No operator evaluates
+    to nil, so None is never a folded result."""
+    if operator_type == scanner.TokenType.TOKEN_EQUAL_EQUAL:
+        return value.values_equal(a, b)
+    elif operator_type == scanner.TokenType.TOKEN_BANG_EQUAL:
+        return not value.values_equal(a, b)
+
+    if operator_type == scanner.TokenType.TOKEN_PLUS and value.is_string(a) and value.is_string(b):
+        chars = a.chars + b.chars
+        return value.copy_string(chars, len(chars), strings)
+
+    if not value.is_number(a) or not value.is_number(b):
+        return None
+
+    # Greater and less equal are compiled as the negated opposite comparison,
+    # which differs from Python for NaN
+    if operator_type == scanner.TokenType.TOKEN_GREATER:
+        return a > b
+    elif operator_type == scanner.TokenType.TOKEN_GREATER_EQUAL:
+        return not a < b
+    elif operator_type == scanner.TokenType.TOKEN_LESS:
+        return a < b
+    elif operator_type == scanner.TokenType.TOKEN_LESS_EQUAL:
+        return not a > b
+    elif operator_type == scanner.TokenType.TOKEN_PLUS:
+        return a + b
+    elif operator_type == scanner.TokenType.TOKEN_MINUS:
+        return a - b
+    elif operator_type == scanner.TokenType.TOKEN_STAR:
+        return a * b
+    elif operator_type == scanner.TokenType.TOKEN_SLASH and b != 0:
+        return a / b
+
+    return None
+
+
+def fold_unary(operator_type, a):
+    # type: (scanner.TokenType, value.Value) -> Optional[value.Value]
+    """Same as fold_binary, for unary operator_type."""
+    if operator_type == scanner.TokenType.TOKEN_BANG:
+        return value.is_falsey(a)
+    elif operator_type == scanner.TokenType.TOKEN_MINUS and value.is_number(a):
+        return -a
+
+    return None
@@ -0,0 +1,210 @@
+import array
+import bisect
+
+import chunk
+import compiler
+import scanner
+import table
+import value
+
+# Bytes of the linked script that call the function in one constant slot. The
+# wide constant instruction is always used so that every call has the same
+# size, and the code for the first n calls is the same for any script.
+CALL_SIZE = 7
+call_code = bytearray()
+
+
+class IncrementalCompiler():
+    def __init__(self, strings=None, debug_level=0, strip_lines=False):
+        # type: (Optional[table.Table], int, bool) -> None
+        """Compiles a source that is edited repeatedly, as in an editor or
+        REPL, recompiling only the top-level declarations an edit touches.
+
+        Each top-level declaration is compiled into a script function of its
+        own, see compiler.compile_declarations. The end offset and line of each
+        declaration are kept as scanner checkpoints, so after an edit scanning
+        resumes from the end of the last declaration before it. Declarations
+        are recompiled until the next one starts where an old declaration
+        started, past the edit, after which the old functions are reused, with
+        their line numbers shifted if the edit added or removed lines.
+
+        Compile errors are printed when the declaration holding them is
+        compiled, and not again while it is left unchanged, unless an edit
+        before it reaches it. A lexer error between declarations counts
+        against the declaration after it.
+        """
+        self.source = ""
+        self.strings = strings if strings is not None else table.Table()
+        self.debug_level = debug_level
+        self.strip_lines = strip_lines
+
+        # One entry per top-level declaration, in source order
+        self.starts = []  # type: List[int]
+        self.ends = []  # type: List[int]
+        self.lines = []  # type: List[int]
+        self.functions = []  # type: List[value.ObjectFunction]
+        self.errors = []  # type: List[bool]
+
+        # Declarations compiled by the last edit
+        self.compiled_count = 0
+
+    def update(self, source):
+        # type: (str) -> Optional[value.ObjectFunction]
+        """Replaces the whole source, recompiling only the part between the
+        common prefix and suffix of the old and new source."""
+        prefix, suffix = common_affixes(self.source, source)
+        return self.edit(prefix, len(self.source) - suffix, source[prefix:len(source) - suffix])
+
+    def edit(self, start, end, text):
+        # type: (int, int, str) -> Optional[value.ObjectFunction]
+        """Replaces the characters from start to end of the source with text.
+        Returns the script function for the new source, or None if it has a
+        compile error."""
+        old = self.source
+        new = old[:start] + text + old[end:]
+        delta = len(text) - (end - start)
+        line_delta = text.count("\n") - old.count("\n", start, end)
+
+        # Resume from the end of the last declaration that ends before the
+        # edit. A declaration ending right at start is recompiled, as the edit
+        # may extend it, such as by adding an else branch.
+        first = bisect.bisect_left(self.ends, start)
+
+        reader = scanner.Scanner(new)
+
+        if first > 0:
+            reader.restore((self.ends[first - 1], self.lines[first - 1]))
+
+        starts = []
+        ends = []
+        lines = []
+        functions = []
+        errors = []
+        resume = len(self.ends)
+
+        for function, first_token, last_token, had_error, scan_error in compiler.compile_declarations(
+                reader, self.debug_level, self.strings, self.strip_lines):
+            starts.append(first_token.start)
+            ends.append(last_token.start + last_token.length)
+            lines.append(last_token.line)
+            functions.append(function)
+            errors.append(had_error)
+
+            # The parser has already scanned the token after the declaration.
+            # Past the edit, a declaration starting where an old one started
+            # means the rest of the source scans and parses as before, unless
+            # scanning up to it hit a lexer error, which the next declaration
+            # has to be recompiled to record. A declaration with an error is
+            # recompiled too, as its error may have been a lexer error before
+            # it that the edit removed.
+            following_start = reader.start
+
+            if following_start >= start + len(text) and not scan_error:
+                index = bisect.bisect_left(self.starts, following_start - delta)
+
+                if (index < len(self.starts) and self.starts[index] == following_start - delta
+                        and not self.errors[index]):
+                    resume = index
+                    break
+
+        if line_delta != 0:
+            for function in self.functions[resume:]:
+                shift_function_lines(function, line_delta)
+
+        self.source = new
+        self.starts = self.starts[:first] + starts + [offset + delta for offset in self.starts[resume:]]
+        self.ends = self.ends[:first] + ends + [offset + delta for offset in self.ends[resume:]]
+        self.lines = self.lines[:first] + lines + [line + line_delta for line in self.lines[resume:]]
+        self.functions = self.functions[:first] + functions + self.functions[resume:]
+        self.errors = self.errors[:first] + errors + self.errors[resume:]
+        self.compiled_count = len(functions)
+
+        if any(self.errors):
+            return None
+
+        return self.link()
+
+    def link(self):
+        # type: () -> value.ObjectFunction
+        """Returns a script function that calls the function of each top-level
+        declaration in turn. The chunk is filled in directly rather than
+        through write_chunk, so linking stays cheap next to an edit touching
+        one declaration of thousands."""
+        count = len(self.functions)
+        size = count * CALL_SIZE
+
+        while len(call_code) < size:
+            index = len(call_code) // CALL_SIZE
+            call_code.extend([
+                chunk.OpCode.OP_CONSTANT_LONG,
+                (index >> 16) & 0xff,
+                (index >> 8) & 0xff,
+                index & 0xff,
+                chunk.OpCode.OP_CALL,
+                0,
+                chunk.OpCode.OP_POP,
+            ])
+
+        bytecode = chunk.Chunk()
+        bytecode.code = call_code[:size] + bytes([chunk.OpCode.OP_NIL, chunk.OpCode.OP_RETURN])
+        bytecode.count = len(bytecode.code)
+
+        # One line run per call, then one for the final return
+        bytecode.line_starts = array.array("I", range(0, size + 1, CALL_SIZE))
+        bytecode.line_numbers = array.array("I", self.lines)
+        bytecode.line_numbers.append(self.lines[-1] if self.lines else 1)
+
+        bytecode.constants.values = list(self.functions)
+        bytecode.constants.count = count
+        bytecode.constants.capacity = count
+        bytecode.freeze(self.strip_lines)
+
+        script = value.new_function()
+        script.bytecode = bytecode
+
+        return script
+
+
+def shift_function_lines(function, delta):
+    # type: (value.ObjectFunction, int) -> None
+    """Shifts the line numbers of function and the functions nested in it."""
+    stack = [function]
+
+    while stack:
+        function = stack.pop()
+        function.bytecode.shift_lines(delta)
+
+        for constant in function.bytecode.constants.values:
+            if value.is_function(constant):
+                stack.append(constant)
+
+
+def common_affixes(old, new):
+    # type: (str, str) -> Tuple[int, int]
+    """Returns the lengths of the longest common prefix and suffix of old and
+    new, not overlapping in either. Found by binary search over slice
+    comparisons, which run in C."""
+    limit = min(len(old), len(new))
+
+    low, high = 0, limit
+
+    while low < high:
+        middle = (low + high + 1) // 2
+
+        if old[:middle] == new[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+
+    prefix = low
+    low, high = 0, limit - prefix
+
+    while low < high:
+        middle = (low + high + 1) // 2
+
+        if old[len(old) - middle:] == new[len(new) - middle:]:
+            low = middle
+        else:
+            high = middle - 1
+
+    return prefix, low
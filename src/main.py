@@ -2,6 +2,9 @@ import sys
 
 import chunk
 import debug
+import scanner
+import superinstructions
+import value
 import vm
 
 
@@ -15,8 +18,13 @@ def main():
         run_file(sys.argv[1])
     elif size == 3:
         run_file(sys.argv[1], sys.argv[2])
+    elif size == 4:
+        run_file(sys.argv[1], sys.argv[2], sys.argv[3])
+    elif size == 5:
+        # A profile of - runs without superinstructions
+        run_file(sys.argv[1], sys.argv[2], None if sys.argv[3] == "-" else sys.argv[3], sys.argv[4])
     else:
-        print("Usage: clox [path]")
+        print("Usage: clox [path] [debug level] [profile|-] [stack|register]")
         exit_with_code(64)
 
 
@@ -46,16 +54,25 @@ def repl():
     emulator.free_vm()
 
 
-def run_file(path, debug_level=0):
-    #
-    """
+def run_file(path, debug_level=0, profile=None, engine="stack"):
+    # type: (str, int, Optional[str], str) -> None
+    """Runs the script at path. With profile, the path of a profile recorded
+    by superinstructions.py, the script runs with the superinstructions the
+    profile shows to pay off. Engine is "stack" or "register", see
+    vm.VM.interpret, and superinstructions only apply to the stack engine.
     """
-    emulator = vm.VM()
+    fused = None
+
+    if profile is not None:
+        fused = superinstructions.SuperinstructionSet.from_profile(superinstructions.Profile.load(profile))
 
-    with open(path, "r") as f:
-        source = f.read()
+    emulator = vm.VM(fused)
 
-    result = emulator.interpret(source, int(debug_level), True)
+    # Scan the mapped file rather than reading it into memory, so the size of
+    # the script is not limited by memory. The file is the whole program, so
+    # functions it never calls are left out
+    with scanner.StreamScanner(path) as reader:
+        result = emulator.interpret(reader, int(debug_level), True, whole_script=True, engine=engine)
 
     if result == vm.InterpretResult.INTERPRET_COMPILE_ERROR:
         exit_with_code(65)
@@ -72,7 +89,7 @@ def interpret(source, expected):
     """
     emulator = vm.VM()
     result = emulator.interpret(source, 0, False)
-    actual = "".join(emulator.result.value_as.chars).rstrip("\0")
+    actual = value.format_value(emulator.result)
     emulator.free_vm()
 
     return result, actual == expected
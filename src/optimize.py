@@ -0,0 +1,322 @@
+import array
+import bisect
+
+import chunk
+import compiler
+
+# Instruction pairs replaced by a single instruction
+fused_pair_map = {
+    (chunk.OpCode.OP_GREATER, chunk.OpCode.OP_NOT): chunk.OpCode.OP_LESS_EQUAL,
+    (chunk.OpCode.OP_LESS, chunk.OpCode.OP_NOT): chunk.OpCode.OP_GREATER_EQUAL,
+    (chunk.OpCode.OP_EQUAL, chunk.OpCode.OP_NOT): chunk.OpCode.OP_NOT_EQUAL,
+}
+
+# Instructions that may be merged into the instruction before them
+merged_opcodes = {opcode for _, opcode in fused_pair_map} | {chunk.OpCode.OP_POP}
+
+# Narrow variant of each jump, the reverse of chunk.long_opcode_map
+short_jump_map = {
+    chunk.OpCode.OP_JUMP: chunk.OpCode.OP_JUMP,
+    chunk.OpCode.OP_JUMP_IF_FALSE: chunk.OpCode.OP_JUMP_IF_FALSE,
+    chunk.OpCode.OP_LOOP: chunk.OpCode.OP_LOOP,
+    chunk.OpCode.OP_JUMP_LONG: chunk.OpCode.OP_JUMP,
+    chunk.OpCode.OP_JUMP_IF_FALSE_LONG: chunk.OpCode.OP_JUMP_IF_FALSE,
+    chunk.OpCode.OP_LOOP_LONG: chunk.OpCode.OP_LOOP,
+}
+
+# Jumps taken whatever is on the stack
+unconditional_jumps = {
+    chunk.OpCode.OP_JUMP,
+    chunk.OpCode.OP_LOOP,
+}
+
+# Instructions using a global by name
+global_opcodes = {
+    chunk.OpCode.OP_GET_GLOBAL,
+    chunk.OpCode.OP_SET_GLOBAL,
+    chunk.OpCode.OP_GET_GLOBAL_LONG,
+    chunk.OpCode.OP_SET_GLOBAL_LONG,
+}
+
+# Indexed by the integer opcode, as chunk.operand_table, so decoding does not
+# hash an enum per instruction
+operand_sizes = [chunk.operand_size_map[operand_type] for operand_type in chunk.operand_table]
+jump_operands = [
+    operand_type in (chunk.OperandType.OPERAND_JUMP, chunk.OperandType.OPERAND_LOOP,
+                     chunk.OperandType.OPERAND_JUMP_LONG, chunk.OperandType.OPERAND_LOOP_LONG)
+    for operand_type in chunk.operand_table
+]
+
+
+class Instruction():
+    __slots__ = ("offset", "opcode", "operand", "target", "line", "jump")
+
+    def __init__(self, offset, opcode, operand, target, line, jump=None):
+        # type: (int, int, bytes, Optional[int], Optional[int], Optional[int]) -> None
+        """One decoded instruction. Jumps hold the offset they jump to in
+        target, rather than a distance in their operand, so that code can be
+        removed before they are encoded again. Jump is the narrow jump opcode
+        whose distance makes up the last two bytes of operand, which is the
+        opcode itself except for superinstructions ending in a jump."""
+        self.offset = offset
+        self.opcode = opcode
+        self.operand = operand
+        self.target = target
+        self.line = line
+        self.jump = jump
+
+
+def optimize_chunk(bytecode):
+    # type: (chunk.Chunk) -> None
+    """Rewrites the code of a finished chunk before it is frozen, in fewer
+    instructions with the same effect:
+
+    - jumps to an unconditional jump go straight to its target, as do
+      conditional jumps to a conditional jump, which tests the same value,
+      as long as conditional jumps still jump forward;
+    - OP_GREATER, OP_LESS or OP_EQUAL followed by OP_NOT becomes one of
+      OP_LESS_EQUAL, OP_GREATER_EQUAL or OP_NOT_EQUAL;
+    - runs of OP_POP, such as at the end of a scope, become one OP_POPN.
+
+    Instructions that are jumped to are never merged into the instruction
+    before them. Line runs are rebuilt from the line of each instruction.
+    """
+    instructions = decode(bytecode)
+    thread_jumps(instructions)
+
+    targets = {instruction.target for instruction in instructions if instruction.target is not None}
+    instructions = fuse(instructions, targets)
+
+    encode(bytecode, instructions)
+
+
+def decode(bytecode):
+    # type: (chunk.Chunk) -> List[Instruction]
+    """Splits the code of bytecode into instructions."""
+    code = bytecode.code
+    count = bytecode.count
+    instructions = []
+    offset = 0
+
+    # Line runs are walked along with the code rather than searched. Without
+    # line information, as after Chunk.freeze with strip_lines, each line is
+    # None
+    line_starts = bytecode.line_starts
+    line_numbers = bytecode.line_numbers
+    run = 0
+    line = None
+
+    while offset < count:
+        if line_starts is not None:
+            while run + 1 < len(line_starts) and line_starts[run + 1] <= offset:
+                run += 1
+
+            line = line_numbers[run]
+
+        opcode = code[offset]
+        size = operand_sizes[opcode]
+        operand = code[offset + 1:offset + 1 + size]
+        target = None
+
+        if jump_operands[opcode]:
+            distance = operand[0] << 8 | operand[1]
+
+            if opcode in chunk.long_opcode_map.values():
+                distance = bytecode.long_jumps[distance]
+
+            opcode = short_jump_map[opcode]
+
+            if opcode == chunk.OpCode.OP_LOOP:
+                target = offset + 3 - distance
+            else:
+                target = offset + 3 + distance
+
+        instructions.append(Instruction(
+            offset, opcode, operand, target, line, opcode if target is not None else None))
+        offset += 1 + size
+
+    return instructions
+
+
+def thread_jumps(instructions):
+    # type: (List[Instruction]) -> None
+    """Points each jump at the end of the chain of jumps it lands on."""
+    jumps = {
+        instruction.offset: instruction
+        for instruction in instructions if instruction.target is not None
+    }
+
+    for instruction in jumps.values():
+        target = instruction.target
+        seen = {instruction.offset}
+
+        while target in jumps and target not in seen:
+            following = jumps[target]
+
+            if instruction.opcode in unconditional_jumps:
+                if following.opcode not in unconditional_jumps:
+                    break
+            elif following.target <= instruction.offset:
+                # There is no conditional jump backwards
+                break
+
+            seen.add(target)
+            target = following.target
+
+        instruction.target = target
+
+
+def fuse(instructions, targets):
+    # type: (List[Instruction], Set[int]) -> List[Instruction]
+    """Merges instruction pairs and runs of pops, see optimize_chunk."""
+    result = [instructions[0]]
+
+    for instruction in instructions[1:]:
+        opcode = instruction.opcode
+
+        if opcode not in merged_opcodes or instruction.offset in targets:
+            result.append(instruction)
+            continue
+
+        last = result[-1]
+        fused = fused_pair_map.get((last.opcode, opcode))
+
+        if fused is not None:
+            last.opcode = fused
+        elif opcode == chunk.OpCode.OP_POP and last.opcode == chunk.OpCode.OP_POP:
+            last.opcode = chunk.OpCode.OP_POPN
+            last.operand = bytes([2])
+        elif (opcode == chunk.OpCode.OP_POP and last.opcode == chunk.OpCode.OP_POPN
+              and last.operand[0] < compiler.UINT8_MAX):
+            last.operand = bytes([last.operand[0] + 1])
+        else:
+            result.append(instruction)
+
+    return result
+
+
+def constant_index(instruction):
+    # type: (Instruction) -> int
+    """Returns the constant index operand of instruction, one byte wide or
+    three for the wide variants."""
+    operand = instruction.operand
+
+    if len(operand) == 1:
+        return operand[0]
+
+    return operand[0] << 16 | operand[1] << 8 | operand[2]
+
+
+def global_uses(bytecode):
+    # type: (chunk.Chunk) -> Set[str]
+    """Returns the names of the globals read or assigned by the code of
+    bytecode, not counting functions nested in it."""
+    constants = bytecode.constants.values
+
+    return {
+        constants[constant_index(instruction)].chars
+        for instruction in decode(bytecode) if instruction.opcode in global_opcodes
+    }
+
+
+def replace_instructions(bytecode, replacements):
+    # type: (chunk.Chunk, Dict[int, Optional[int]]) -> None
+    """Replaces the instruction at each offset of replacements by the given
+    instruction without operand, or removes it if None. Jumps to a removed
+    instruction land on the instruction after it instead."""
+    result = []
+    removed = set()
+
+    for instruction in decode(bytecode):
+        if instruction.offset not in replacements:
+            result.append(instruction)
+        elif replacements[instruction.offset] is None:
+            removed.add(instruction.offset)
+        else:
+            instruction.opcode = replacements[instruction.offset]
+            instruction.operand = b""
+            result.append(instruction)
+
+    if removed:
+        kept = [instruction.offset for instruction in result]
+
+        for instruction in result:
+            if instruction.target in removed:
+                index = bisect.bisect_right(kept, instruction.target)
+                instruction.target = kept[index] if index < len(kept) else bytecode.count
+
+    encode(bytecode, result)
+
+
+def encode(bytecode, instructions):
+    # type: (chunk.Chunk, List[Instruction]) -> None
+    """Writes instructions back into bytecode, with jump distances for the
+    new offsets. Jumps are widened or narrowed to fit their new distance,
+    which leaves their size unchanged. Raises ValueError, leaving bytecode
+    unchanged, if more wide jumps are needed than their operand can index."""
+    offsets = {}
+    offset = 0
+
+    for instruction in instructions:
+        offsets[instruction.offset] = offset
+        offset += 1 + len(instruction.operand)
+
+    offsets[bytecode.count] = offset
+
+    code = bytearray()
+    line_starts = array.array("I")
+    line_numbers = array.array("I")
+    long_jumps = array.array("I")
+
+    line = None
+
+    # Chunks stripped of line information stay stripped
+    stripped = bytecode.line_starts is None
+
+    for instruction in instructions:
+        start = len(code)
+
+        if not stripped and instruction.line != line:
+            line = instruction.line
+            line_starts.append(start)
+            line_numbers.append(line)
+
+        if instruction.target is None:
+            code.append(instruction.opcode)
+            code += instruction.operand
+            continue
+
+        opcode = instruction.opcode
+        jump = instruction.jump
+        target = offsets[instruction.target]
+        end = start + 1 + len(instruction.operand)
+
+        # A threaded unconditional jump may change direction
+        if opcode == jump and jump in unconditional_jumps:
+            jump = chunk.OpCode.OP_LOOP if target < end else chunk.OpCode.OP_JUMP
+            opcode = jump
+
+        if jump == chunk.OpCode.OP_LOOP:
+            distance = end - target
+        else:
+            distance = target - end
+
+        if distance > compiler.UINT16_MAX:
+            assert opcode == jump, "Superinstructions only end in narrow jumps."
+
+            if len(long_jumps) > compiler.UINT16_MAX:
+                raise ValueError("Too many long jumps in one chunk.")
+
+            opcode = chunk.long_opcode_map[opcode]
+            long_jumps.append(distance)
+            distance = len(long_jumps) - 1
+
+        code.append(opcode)
+        code += instruction.operand[:-2]
+        code.extend([(distance >> 8) & 0xff, distance & 0xff])
+
+    bytecode.code = code
+    bytecode.count = len(code)
+    bytecode.line_starts = None if stripped else line_starts
+    bytecode.line_numbers = None if stripped else line_numbers
+    bytecode.long_jumps = long_jumps
@@ -0,0 +1,746 @@
+from enum import IntEnum
+
+import chunk
+import optimize
+import value
+import vm
+
+
+class RegisterOp(IntEnum):
+    OP_MOVE = 0
+    OP_GET_GLOBAL = 1
+    OP_DEFINE_GLOBAL = 2
+    OP_SET_GLOBAL = 3
+    OP_ADD = 4
+    OP_SUBTRACT = 5
+    OP_MULTIPLY = 6
+    OP_DIVIDE = 7
+    OP_EQUAL = 8
+    OP_NOT_EQUAL = 9
+    OP_GREATER = 10
+    OP_LESS = 11
+    OP_GREATER_EQUAL = 12
+    OP_LESS_EQUAL = 13
+    OP_NOT = 14
+    OP_NEGATE = 15
+    OP_PRINT = 16
+
+    # Instructions from OP_JUMP on change the instruction pointer or the
+    # frame, and are run inline by RegisterVM.run
+    OP_JUMP = 17
+    OP_JUMP_IF_FALSE = 18
+    OP_JUMP_IF_LESS = 19
+    OP_JUMP_UNLESS_LESS = 20
+    OP_JUMP_IF_GREATER = 21
+    OP_JUMP_UNLESS_GREATER = 22
+    OP_JUMP_IF_EQUAL = 23
+    OP_JUMP_UNLESS_EQUAL = 24
+    OP_CALL = 25
+    OP_RETURN = 26
+
+
+FIRST_CONTROL = RegisterOp.OP_JUMP
+
+# Each instruction is a tuple (op, a, b, c). These are the operands holding a
+# register index, as opposed to a jump target or a count
+# yapf: disable
+register_operand_map = {
+    RegisterOp.OP_MOVE:             (1, 2),
+    RegisterOp.OP_GET_GLOBAL:       (1, 2),
+    RegisterOp.OP_DEFINE_GLOBAL:    (1, 2),
+    RegisterOp.OP_SET_GLOBAL:       (1, 2),
+    RegisterOp.OP_NOT:              (1, 2),
+    RegisterOp.OP_NEGATE:           (1, 2),
+    RegisterOp.OP_PRINT:            (1,),
+    RegisterOp.OP_JUMP:             (),
+    RegisterOp.OP_JUMP_IF_FALSE:    (2,),
+    RegisterOp.OP_CALL:             (1,),
+    RegisterOp.OP_RETURN:           (1,),
+}
+# yapf: enable
+
+# Stack instructions that become the register instruction of the same name,
+# reading two operands and writing one result
+binary_op_map = {
+    chunk.OpCode.OP_ADD: RegisterOp.OP_ADD,
+    chunk.OpCode.OP_SUBTRACT: RegisterOp.OP_SUBTRACT,
+    chunk.OpCode.OP_MULTIPLY: RegisterOp.OP_MULTIPLY,
+    chunk.OpCode.OP_DIVIDE: RegisterOp.OP_DIVIDE,
+    chunk.OpCode.OP_EQUAL: RegisterOp.OP_EQUAL,
+    chunk.OpCode.OP_NOT_EQUAL: RegisterOp.OP_NOT_EQUAL,
+    chunk.OpCode.OP_GREATER: RegisterOp.OP_GREATER,
+    chunk.OpCode.OP_LESS: RegisterOp.OP_LESS,
+    chunk.OpCode.OP_GREATER_EQUAL: RegisterOp.OP_GREATER_EQUAL,
+    chunk.OpCode.OP_LESS_EQUAL: RegisterOp.OP_LESS_EQUAL,
+}
+
+unary_op_map = {
+    chunk.OpCode.OP_NOT: RegisterOp.OP_NOT,
+    chunk.OpCode.OP_NEGATE: RegisterOp.OP_NEGATE,
+}
+
+# Comparison followed by OP_JUMP_IF_FALSE, replaced by a jump taken when the
+# comparison is false. Greater and less equal are the negated opposite
+# comparison, as in the stack VM
+compare_jump_map = {
+    RegisterOp.OP_LESS: RegisterOp.OP_JUMP_UNLESS_LESS,
+    RegisterOp.OP_GREATER: RegisterOp.OP_JUMP_UNLESS_GREATER,
+    RegisterOp.OP_GREATER_EQUAL: RegisterOp.OP_JUMP_IF_LESS,
+    RegisterOp.OP_LESS_EQUAL: RegisterOp.OP_JUMP_IF_GREATER,
+    RegisterOp.OP_EQUAL: RegisterOp.OP_JUMP_UNLESS_EQUAL,
+    RegisterOp.OP_NOT_EQUAL: RegisterOp.OP_JUMP_IF_EQUAL,
+}
+
+for register_op in list(binary_op_map.values()) + list(compare_jump_map.values()):
+    register_operand_map[register_op] = (1, 2, 3) if register_op < FIRST_CONTROL else (2, 3)
+
+# Literal instructions, pushing the value of a constant register
+literal_opcode_map = {
+    chunk.OpCode.OP_NIL: None,
+    chunk.OpCode.OP_TRUE: True,
+    chunk.OpCode.OP_FALSE: False,
+}
+
+constant_opcodes = {chunk.OpCode.OP_CONSTANT, chunk.OpCode.OP_CONSTANT_LONG}
+
+pop_opcodes = {chunk.OpCode.OP_POP, chunk.OpCode.OP_POPN}
+
+
+class RegisterFunction():
+    __slots__ = ("function", "arity", "code", "lines", "size", "fill")
+
+    def __init__(self, function, code, lines, size, constants):
+        # type: (value.ObjectFunction, List[Tuple[int, int, int, int]], List[int], int, List[value.Value]) -> None
+        """Register code of function. The register file of each call holds
+        size registers for the function and its arguments, locals and
+        temporaries, which follow the layout of the stack slots, and then a
+        register for each constant. Fill is what follows the arguments in a
+        new register file."""
+        self.function = function
+        self.arity = function.arity
+        self.code = code
+        self.lines = lines
+        self.size = size
+        self.fill = [None] * (size - function.arity - 1) + constants
+
+
+class Translator():
+    def __init__(self, function):
+        # type: (value.ObjectFunction) -> None
+        """Translates the stack code of function into register code. Each
+        stack slot becomes the register of the same index. Pushing a local or
+        a constant only records where the value is, so most instructions read
+        their operands straight from the registers of locals and constants,
+        and write their result to its stack slot. A value is only copied into
+        its slot before a jump, a jump target or a call, which expect each
+        value in its slot, or before the local it was read from changes.
+        """
+        self.function = function
+        self.code = []  # type: List[List[int]]
+        self.lines = []  # type: List[int]
+        self.line = 0
+
+        # Register holding each value on the stack, with constant registers
+        # numbered as ~index until the number of stack registers is known
+        self.stack = list(range(function.arity + 1))  # type: List[int]
+        self.size = len(self.stack)
+
+        bytecode = function.bytecode
+        self.constants = [bytecode.constants.values[i] for i in range(bytecode.constants.count)]
+        self.literals = {}  # type: Dict[Any, int]
+
+        # Index of the last instruction when it wrote the top of the stack
+        # and may write to a local instead, see set_local. Any push or pop
+        # clears it, as the top of the stack is then another value
+        self.result = None  # type: Optional[int]
+
+    def emit(self, op, a=0, b=0, c=0):
+        # type: (RegisterOp, int, int, int) -> None
+        """
+        """
+        self.code.append([op, a, b, c])
+        self.lines.append(self.line)
+        self.result = None
+
+    def push(self, register):
+        # type: (int) -> None
+        """
+        """
+        self.stack.append(register)
+        self.size = max(self.size, len(self.stack))
+        self.result = None
+
+    def literal(self, val):
+        # type: (value.Value) -> int
+        """Returns the constant register of nil, true or false."""
+        key = (type(val), val)
+
+        if key not in self.literals:
+            self.constants.append(val)
+            self.literals[key] = ~(len(self.constants) - 1)
+
+        return self.literals[key]
+
+    def materialize(self, slot):
+        # type: (int) -> None
+        """Copies the value of stack slot into its own register."""
+        register = self.stack[slot]
+
+        if register != slot:
+            self.emit(RegisterOp.OP_MOVE, slot, register)
+            self.stack[slot] = slot
+
+    def materialize_all(self, start=0):
+        # type: (int) -> None
+        """
+        """
+        for slot in range(start, len(self.stack)):
+            self.materialize(slot)
+
+    def set_local(self, slot):
+        # type: (int) -> None
+        """Assigns the top of the stack to local slot, which stays on the
+        stack. Values read from the local and still on the stack are copied
+        first."""
+        top = len(self.stack) - 1
+        register = self.stack[top]
+
+        if register == slot:
+            return None
+
+        for other in range(slot + 1, top):
+            if self.stack[other] == slot:
+                self.materialize(other)
+
+        # Copies above leave no result to retarget, as they read the local
+        # before the assignment
+        if self.result is not None and register == top:
+            # The instruction computing the value writes the local instead
+            self.code[self.result][1] = slot
+            self.stack[top] = slot
+        else:
+            self.emit(RegisterOp.OP_MOVE, slot, register)
+
+        self.stack[slot] = slot
+
+    def jump_if_false(self, instruction, following, targets):
+        # type: (optimize.Instruction, Optional[optimize.Instruction], Dict[int, optimize.Instruction]) -> None
+        """Jumps if the top of the stack is falsey. A comparison popped on
+        both paths, as by an if or while statement, becomes a jump on the
+        comparison itself."""
+        top = len(self.stack) - 1
+        last = self.code[self.result] if self.result is not None else None
+
+        if (last is not None and last[0] in compare_jump_map and last[1] == top
+                and self.stack[top] == top
+                and following is not None and following.opcode in pop_opcodes
+                and following.offset not in targets
+                and targets.get(instruction.target) is not None
+                and targets[instruction.target].opcode in pop_opcodes):
+            self.code.pop()
+            self.lines.pop()
+            self.materialize_all()
+            self.emit(compare_jump_map[last[0]], instruction.target, last[2], last[3])
+        else:
+            self.materialize_all()
+            self.emit(RegisterOp.OP_JUMP_IF_FALSE, instruction.target, top)
+
+    def translate(self):
+        # type: () -> RegisterFunction
+        """
+        """
+        bytecode = self.function.bytecode
+        instructions = optimize.decode(bytecode)
+        constants = bytecode.constants.values
+
+        # Instruction at each jump target, None for the end of the code
+        targets = {}  # type: Dict[int, Optional[optimize.Instruction]]
+        by_offset = {instruction.offset: instruction for instruction in instructions}
+
+        for instruction in instructions:
+            if instruction.target is not None:
+                targets[instruction.target] = by_offset.get(instruction.target)
+
+        # Stack depth at each jump target, and register code offset of each
+        # stack code offset
+        depths = {}  # type: Dict[int, int]
+        offsets = {}  # type: Dict[int, int]
+        reachable = True
+
+        for index, instruction in enumerate(instructions):
+            opcode = instruction.opcode
+            self.line = instruction.line
+
+            if not reachable and instruction.offset not in targets:
+                continue
+
+            if instruction.offset in targets:
+                if reachable:
+                    self.materialize_all()
+                    depth = len(self.stack)
+                else:
+                    depth = depths.get(instruction.offset, len(self.stack))
+
+                self.stack = list(range(depth))
+                self.result = None
+                reachable = True
+
+            offsets[instruction.offset] = len(self.code)
+
+            if opcode in constant_opcodes:
+                self.push(~optimize.constant_index(instruction))
+            elif opcode in literal_opcode_map:
+                self.push(self.literal(literal_opcode_map[opcode]))
+            elif opcode == chunk.OpCode.OP_POP:
+                self.stack.pop()
+                self.result = None
+            elif opcode == chunk.OpCode.OP_POPN:
+                del self.stack[len(self.stack) - instruction.operand[0]:]
+                self.result = None
+            elif opcode == chunk.OpCode.OP_GET_LOCAL:
+                self.push(self.stack[instruction.operand[0]])
+            elif opcode == chunk.OpCode.OP_SET_LOCAL:
+                self.set_local(instruction.operand[0])
+            elif opcode in (chunk.OpCode.OP_GET_GLOBAL, chunk.OpCode.OP_GET_GLOBAL_LONG):
+                top = len(self.stack)
+                self.emit(RegisterOp.OP_GET_GLOBAL, top, ~optimize.constant_index(instruction))
+                self.push(top)
+                self.result = len(self.code) - 1
+            elif opcode in (chunk.OpCode.OP_DEFINE_GLOBAL, chunk.OpCode.OP_DEFINE_GLOBAL_LONG):
+                self.emit(RegisterOp.OP_DEFINE_GLOBAL, self.stack.pop(), ~optimize.constant_index(instruction))
+            elif opcode in (chunk.OpCode.OP_SET_GLOBAL, chunk.OpCode.OP_SET_GLOBAL_LONG):
+                self.emit(RegisterOp.OP_SET_GLOBAL, self.stack[-1], ~optimize.constant_index(instruction))
+            elif opcode in binary_op_map:
+                right = self.stack.pop()
+                left = self.stack.pop()
+                top = len(self.stack)
+                self.emit(binary_op_map[opcode], top, left, right)
+                self.push(top)
+                self.result = len(self.code) - 1
+            elif opcode in unary_op_map:
+                operand = self.stack.pop()
+                top = len(self.stack)
+                self.emit(unary_op_map[opcode], top, operand)
+                self.push(top)
+                self.result = len(self.code) - 1
+            elif opcode == chunk.OpCode.OP_PRINT:
+                self.emit(RegisterOp.OP_PRINT, self.stack.pop())
+            elif opcode in (chunk.OpCode.OP_JUMP, chunk.OpCode.OP_LOOP):
+                self.materialize_all()
+                depths.setdefault(instruction.target, len(self.stack))
+                self.emit(RegisterOp.OP_JUMP, instruction.target)
+                reachable = False
+            elif opcode == chunk.OpCode.OP_JUMP_IF_FALSE:
+                following = instructions[index + 1] if index + 1 < len(instructions) else None
+                self.jump_if_false(instruction, following, targets)
+                depths.setdefault(instruction.target, len(self.stack))
+            elif opcode == chunk.OpCode.OP_CALL:
+                arg_count = instruction.operand[0]
+                callee = len(self.stack) - arg_count - 1
+
+                # Arguments are passed in the registers after the callee
+                self.materialize_all(callee)
+                self.emit(RegisterOp.OP_CALL, callee, arg_count)
+                del self.stack[callee + 1:]
+            elif opcode == chunk.OpCode.OP_RETURN:
+                self.emit(RegisterOp.OP_RETURN, self.stack.pop())
+                reachable = False
+            else:
+                raise ValueError("No register instruction for {}.".format(chunk.OpCode(opcode).name))
+
+        offsets[bytecode.count] = len(self.code)
+
+        return self.finish(offsets)
+
+    def finish(self, offsets):
+        # type: (Dict[int, int]) -> RegisterFunction
+        """Numbers the constant registers after the stack registers, and
+        points jumps at register code offsets. Jumps landing on an OP_JUMP go
+        straight to its target."""
+        jumps = []
+
+        for instruction in self.code:
+            op = instruction[0]
+
+            for field in register_operand_map[op]:
+                if instruction[field] < 0:
+                    instruction[field] = self.size + ~instruction[field]
+
+            if op >= FIRST_CONTROL and op not in (RegisterOp.OP_CALL, RegisterOp.OP_RETURN):
+                instruction[1] = offsets[instruction[1]]
+                jumps.append(instruction)
+
+        for instruction in jumps:
+            seen = set()
+
+            while (instruction[1] < len(self.code) and instruction[1] not in seen
+                   and self.code[instruction[1]][0] == RegisterOp.OP_JUMP):
+                seen.add(instruction[1])
+                instruction[1] = self.code[instruction[1]][1]
+
+        code = [(int(instruction[0]),) + tuple(instruction[1:]) for instruction in self.code]
+
+        return RegisterFunction(self.function, code, self.lines, self.size, self.constants)
+
+
+def translate(function):
+    # type: (value.ObjectFunction) -> RegisterFunction
+    """Returns the register code of function, compiled to stack code without
+    superinstructions, see Translator."""
+    return Translator(function).translate()
+
+
+def disassemble(register_function):
+    # type: (RegisterFunction) -> None
+    """Prints the register code of register_function, with registers as rN
+    and constant registers as the constant they hold."""
+    name = register_function.function.name
+    constants = register_function.fill[register_function.size - register_function.arity - 1:]
+
+    print("== {} (registers) ==".format(name.chars if name is not None else "<script>"))
+
+    def operand(register):
+        # type: (int) -> str
+        """
+        """
+        if register >= register_function.size:
+            return value.format_value(constants[register - register_function.size])
+
+        return "r{}".format(register)
+
+    for pc, (op, a, b, c) in enumerate(register_function.code):
+        fields = register_operand_map[op]
+        operands = [operand(x) if i in fields else str(x) for i, x in enumerate((a, b, c), 1)]
+
+        if op >= FIRST_CONTROL and op not in (RegisterOp.OP_CALL, RegisterOp.OP_RETURN):
+            operands[0] = "-> {}".format(a)
+
+        count = 2 if op == RegisterOp.OP_CALL else max(fields + (1,))
+        print("{:04d} {:4d} {:22s} {}".format(
+            pc, register_function.lines[pc], RegisterOp(op).name, " ".join(operands[:count])))
+
+
+class RegisterVM():
+    def __init__(self, emulator):
+        # type: (vm.VM) -> None
+        """Runs scripts compiled to register code on the globals, strings and
+        output of emulator, as VM.interpret does with engine "register".
+        Functions are translated the first time they are called."""
+        self.emulator = emulator
+        self.functions = {}  # type: Dict[value.ObjectFunction, RegisterFunction]
+        self.debug_level = 0
+
+        # Handler for each instruction before FIRST_CONTROL, returning an error
+        # message if the instruction fails
+        self.dispatch = [getattr(self, op.name.lower()) for op in RegisterOp if op < FIRST_CONTROL]
+
+    def get_function(self, function):
+        # type: (value.ObjectFunction) -> RegisterFunction
+        """
+        """
+        register_function = self.functions.get(function)
+
+        if register_function is None:
+            register_function = translate(function)
+            self.functions[function] = register_function
+
+            if self.debug_level >= 1:
+                disassemble(register_function)
+
+        return register_function
+
+    def runtime_error(self, message, line):
+        # type: (str, int) -> None
+        """
+        """
+        if self.emulator.expose:
+            print(message)
+            print("[line {} in script]".format("?" if line is None else line))
+
+    def interpret_function(self, function, debug_level=0):
+        # type: (value.ObjectFunction, int) -> vm.InterpretResult
+        """Runs a script function compiled to stack code."""
+        self.debug_level = debug_level
+        return self.run(self.get_function(function))
+
+    def run(self, script):
+        # type: (RegisterFunction) -> vm.InterpretResult
+        """Runs instructions until the script returns or an instruction fails.
+        Instructions that only read and write registers go through the
+        dispatch table, and jumps, calls and returns are run inline, as they
+        change the frame or the instruction pointer.
+        """
+        dispatch = self.dispatch
+        functions = self.functions
+        frames = []  # type: List[Tuple[RegisterFunction, List[value.Value], int, int]]
+
+        # Plain ints, so the loop does not look up enum members
+        first_control = int(FIRST_CONTROL)
+        op_jump = int(RegisterOp.OP_JUMP)
+        op_jump_if_false = int(RegisterOp.OP_JUMP_IF_FALSE)
+        op_jump_if_less = int(RegisterOp.OP_JUMP_IF_LESS)
+        op_jump_unless_less = int(RegisterOp.OP_JUMP_UNLESS_LESS)
+        op_jump_unless_greater = int(RegisterOp.OP_JUMP_UNLESS_GREATER)
+        op_jump_if_equal = int(RegisterOp.OP_JUMP_IF_EQUAL)
+        op_jump_unless_equal = int(RegisterOp.OP_JUMP_UNLESS_EQUAL)
+        op_call = int(RegisterOp.OP_CALL)
+        frames_max = vm.FRAMES_MAX
+
+        current = script
+        code = script.code
+        registers = [script.function] + script.fill
+        pc = 0
+
+        while True:
+            op, a, b, c = code[pc]
+            pc += 1
+
+            if op < first_control:
+                message = dispatch[op](registers, a, b, c)
+
+                if message is None:
+                    continue
+
+            elif op == op_jump:
+                pc = a
+                continue
+
+            elif op <= op_jump_unless_greater:
+                if op == op_jump_if_false:
+                    val = registers[b]
+
+                    if val is None or val is False:
+                        pc = a
+
+                    continue
+
+                left = registers[b]
+                right = registers[c]
+
+                if type(left) is float and type(right) is float:
+                    if op == op_jump_unless_less:
+                        if not left < right:
+                            pc = a
+                    elif op == op_jump_unless_greater:
+                        if not left > right:
+                            pc = a
+                    elif op == op_jump_if_less:
+                        if left < right:
+                            pc = a
+                    elif left > right:
+                        pc = a
+
+                    continue
+
+                message = "Operands must be numbers."
+
+            elif op <= op_jump_unless_equal:
+                if value.values_equal(registers[b], registers[c]) == (op == op_jump_if_equal):
+                    pc = a
+
+                continue
+
+            elif op == op_call:
+                callee = registers[a]
+
+                if type(callee) is value.ObjectFunction:
+                    function = functions.get(callee) or self.get_function(callee)
+
+                    if b != function.arity:
+                        message = "Expected {} arguments but got {}.".format(function.arity, b)
+                    elif len(frames) == frames_max - 1:
+                        message = "Stack overflow."
+                    else:
+                        frames.append((current, registers, pc, a))
+                        registers = registers[a:a + b + 1] + function.fill
+                        current = function
+                        code = function.code
+                        pc = 0
+                        continue
+
+                elif type(callee) is value.ObjectNative:
+                    registers[a] = callee.function(b, registers[a + 1:a + b + 1])
+                    continue
+
+                else:
+                    message = "Can only call functions and classes."
+
+            else:
+                result = registers[a]
+
+                if not frames:
+                    return vm.InterpretResult.INTERPRET_OK
+
+                current, registers, pc, a = frames.pop()
+                code = current.code
+                registers[a] = result
+                continue
+
+            self.runtime_error(message, current.lines[pc - 1])
+            return vm.InterpretResult.INTERPRET_RUNTIME_ERROR
+
+    def op_move(self, registers, a, b, c):
+        #
+        """
+        """
+        registers[a] = registers[b]
+
+    def op_get_global(self, registers, a, b, c):
+        #
+        """
+        """
+        val = self.emulator.globals.table_get(registers[b], vm.UNDEFINED)
+
+        if val is vm.UNDEFINED:
+            return "Undefined variable '{}'.".format(value.as_cstring(registers[b]))
+
+        registers[a] = val
+
+    def op_define_global(self, registers, a, b, c):
+        #
+        """
+        """
+        self.emulator.globals.table_set(registers[b], registers[a])
+
+    def op_set_global(self, registers, a, b, c):
+        #
+        """
+        """
+        if self.emulator.globals.table_set(registers[b], registers[a]):
+            self.emulator.globals.table_delete(registers[b])
+            return "Undefined variable '{}'.".format(value.as_cstring(registers[b]))
+
+    def op_add(self, registers, a, b, c):
+        #
+        """
+        """
+        left = registers[b]
+        right = registers[c]
+
+        if type(left) is float and type(right) is float:
+            registers[a] = left + right
+        elif type(left) is value.ObjectString and type(right) is value.ObjectString:
+            registers[a] = value.new_rope(left, right)
+        else:
+            return "Operands must be two numbers or two strings."
+
+    def op_subtract(self, registers, a, b, c):
+        #
+        """
+        """
+        left = registers[b]
+        right = registers[c]
+
+        if type(left) is not float or type(right) is not float:
+            return "Operands must be numbers."
+
+        registers[a] = left - right
+
+    def op_multiply(self, registers, a, b, c):
+        #
+        """
+        """
+        left = registers[b]
+        right = registers[c]
+
+        if type(left) is not float or type(right) is not float:
+            return "Operands must be numbers."
+
+        registers[a] = left * right
+
+    def op_divide(self, registers, a, b, c):
+        #
+        """
+        """
+        left = registers[b]
+        right = registers[c]
+
+        if type(left) is not float or type(right) is not float:
+            return "Operands must be numbers."
+
+        registers[a] = left / right
+
+    def op_equal(self, registers, a, b, c):
+        #
+        """
+        """
+        registers[a] = value.values_equal(registers[b], registers[c])
+
+    def op_not_equal(self, registers, a, b, c):
+        #
+        """
+        """
+        registers[a] = not value.values_equal(registers[b], registers[c])
+
+    def op_greater(self, registers, a, b, c):
+        #
+        """
+        """
+        left = registers[b]
+        right = registers[c]
+
+        if type(left) is not float or type(right) is not float:
+            return "Operands must be numbers."
+
+        registers[a] = left > right
+
+    def op_less(self, registers, a, b, c):
+        #
+        """
+        """
+        left = registers[b]
+        right = registers[c]
+
+        if type(left) is not float or type(right) is not float:
+            return "Operands must be numbers."
+
+        registers[a] = left < right
+
+    def op_greater_equal(self, registers, a, b, c):
+        # type: (List[value.Value], int, int, int) -> Optional[str]
+        """Same as OP_LESS negated, as in the stack VM."""
+        left = registers[b]
+        right = registers[c]
+
+        if type(left) is not float or type(right) is not float:
+            return "Operands must be numbers."
+
+        registers[a] = not left < right
+
+    def op_less_equal(self, registers, a, b, c):
+        # type: (List[value.Value], int, int, int) -> Optional[str]
+        """Same as OP_GREATER negated."""
+        left = registers[b]
+        right = registers[c]
+
+        if type(left) is not float or type(right) is not float:
+            return "Operands must be numbers."
+
+        registers[a] = not left > right
+
+    def op_not(self, registers, a, b, c):
+        #
+        """
+        """
+        val = registers[b]
+        registers[a] = val is None or val is False
+
+    def op_negate(self, registers, a, b, c):
+        #
+        """
+        """
+        val = registers[b]
+
+        if type(val) is not float:
+            return "Operand must be a number"
+
+        registers[a] = -val
+
+    def op_print(self, registers, a, b, c):
+        #
+        """
+        """
+        self.emulator.result = registers[a]
+
+        if self.emulator.expose:
+            value.print_value(registers[a])
@@ -1,4 +1,8 @@
+import mmap
+import os
+import re
 from enum import Enum
+from typing import Optional, Tuple
 
 
 class TokenType(Enum):
@@ -52,37 +56,94 @@ class TokenType(Enum):
 
 
 class Token():
-    def __init__(self, token_type=None, start=0, length=0, source=None, line=0):
+    __slots__ = ("token_type", "start", "length", "line")
+
+    def __init__(self, token_type=None, start=0, length=0, line=0):
         # type: (TokenType, int, int, int) -> None
-        """
+        """Tokens hold only offsets into the source, so scanning copies no
+        characters. Use Scanner.lexeme to retrieve the characters of a token.
         """
         self.token_type = token_type
         self.start = start
         self.length = length
-        self.source = source
         self.line = line
 
 
-single_token_map = {
-    "(": TokenType.TOKEN_LEFT_PAREN,
-    ")": TokenType.TOKEN_RIGHT_PAREN,
-    "{": TokenType.TOKEN_LEFT_BRACE,
-    "}": TokenType.TOKEN_RIGHT_BRACE,
-    ";": TokenType.TOKEN_SEMICOLON,
-    ",": TokenType.TOKEN_COMMA,
-    ".": TokenType.TOKEN_DOT,
-    "-": TokenType.TOKEN_MINUS,
-    "+": TokenType.TOKEN_PLUS,
-    "/": TokenType.TOKEN_SLASH,
-    "*": TokenType.TOKEN_STAR,
+# yapf: disable
+operator_map = {
+    "(":  TokenType.TOKEN_LEFT_PAREN,
+    ")":  TokenType.TOKEN_RIGHT_PAREN,
+    "{":  TokenType.TOKEN_LEFT_BRACE,
+    "}":  TokenType.TOKEN_RIGHT_BRACE,
+    ";":  TokenType.TOKEN_SEMICOLON,
+    ",":  TokenType.TOKEN_COMMA,
+    ".":  TokenType.TOKEN_DOT,
+    "-":  TokenType.TOKEN_MINUS,
+    "+":  TokenType.TOKEN_PLUS,
+    "/":  TokenType.TOKEN_SLASH,
+    "*":  TokenType.TOKEN_STAR,
+    "!":  TokenType.TOKEN_BANG,
+    "!=": TokenType.TOKEN_BANG_EQUAL,
+    "=":  TokenType.TOKEN_EQUAL,
+    "==": TokenType.TOKEN_EQUAL_EQUAL,
+    "<":  TokenType.TOKEN_LESS,
+    "<=": TokenType.TOKEN_LESS_EQUAL,
+    ">":  TokenType.TOKEN_GREATER,
+    ">=": TokenType.TOKEN_GREATER_EQUAL,
 }
 
-double_token_map = {
-    "!": (TokenType.TOKEN_BANG_EQUAL, TokenType.TOKEN_BANG),
-    "=": (TokenType.TOKEN_EQUAL_EQUAL, TokenType.TOKEN_EQUAL),
-    "<": (TokenType.TOKEN_LESS_EQUAL, TokenType.TOKEN_LESS),
-    ">": (TokenType.TOKEN_GREATER_EQUAL, TokenType.TOKEN_GREATER),
+keyword_map = {
+    "and":    TokenType.TOKEN_AND,
+    "class":  TokenType.TOKEN_CLASS,
+    "else":   TokenType.TOKEN_ELSE,
+    "false":  TokenType.TOKEN_FALSE,
+    "for":    TokenType.TOKEN_FOR,
+    "fun":    TokenType.TOKEN_FUN,
+    "if":     TokenType.TOKEN_IF,
+    "let":    TokenType.TOKEN_VAR,
+    "nil":    TokenType.TOKEN_NIL,
+    "or":     TokenType.TOKEN_OR,
+    "print":  TokenType.TOKEN_PRINT,
+    "return": TokenType.TOKEN_RETURN,
+    "self":   TokenType.TOKEN_THIS,
+    "super":  TokenType.TOKEN_SUPER,
+    "true":   TokenType.TOKEN_TRUE,
+    "while":  TokenType.TOKEN_WHILE,
 }
+# yapf: enable
+
+# Whitespace and comments before a token, then the token itself as one of
+# these alternatives, which are the numbered groups of token_pattern below.
+# Runs of whitespace, identifiers and digits are consumed by the regex engine
+# rather than one character at a time.
+skip_source = r"[ \t\r\n]*(?://[^\n]*[ \t\r\n]*)*"
+token_sources = [
+    r"[A-Za-z_][A-Za-z0-9_]*",  # identifier or keyword
+    r"[0-9]+(?:\.[0-9]+)?",  # number
+    r'"[^"]*"',  # string
+    r"[!=<>]=?|[-+*/(){};,.]",  # operator
+    r'"',  # unterminated string
+    r"\Z",  # end of source
+    r".",  # unexpected character
+]
+
+token_pattern = re.compile(
+    skip_source + "(?:" + "|".join("({})".format(source) for source in token_sources) + ")",
+    re.DOTALL,
+)
+
+GROUP_IDENTIFIER = 1
+GROUP_NUMBER = 2
+GROUP_STRING = 3
+GROUP_OPERATOR = 4
+GROUP_UNTERMINATED = 5
+GROUP_EOF = 6
+
+# Same pattern and lookup tables over UTF-8 bytes, for StreamScanner
+byte_token_pattern = re.compile(token_pattern.pattern.encode("ascii"), re.DOTALL)
+byte_operator_map = {chars.encode("ascii"): token_type for chars, token_type in operator_map.items()}
+byte_keyword_map = {chars.encode("ascii"): token_type for chars, token_type in keyword_map.items()}
+byte_newline_pattern = re.compile(b"\n")
 
 
 class Scanner():
@@ -95,17 +156,8 @@ class Scanner():
         self.source = source
         self.line = 1
 
-    def is_alpha(self, char):
-        #
-        """
-        """
-        return ((char >= "a" and char <= "z") or (char >= "A" and char <= "Z") or char == "_")
-
-    def is_digit(self, char):
-        #
-        """
-        """
-        return char >= "0" and char <= "9"
+        # Message of the last error token, reported by the compiler
+        self.error_message = None  # type: Optional[str]
 
     def is_at_end(self):
         #
@@ -113,218 +165,158 @@ class Scanner():
         """
         return self.current == len(self.source)
 
-    def advance(self):
-        #
-        """
-        """
-        self.current += 1
-        return self.source[self.current - 1]
-
-    def peek(self):
-        #
-        """
-        """
-        return self.source[self.current]
-
-    def peek_next(self):
-        #
-        """
-        """
-        return self.source[self.current + 1]
-
-    def match(self, expected):
-        #
-        """
-        """
-        if self.is_at_end():
-            return False
-
-        elif self.source[self.current] != expected:
-            return False
+    def checkpoint(self):
+        # type: () -> Tuple[int, int]
+        """Returns the state needed to resume scanning from the current
+        position. Strings are scanned as single tokens, so between tokens the
+        scanner is never inside a string and the position and line suffice."""
+        return self.current, self.line
+
+    def restore(self, checkpoint):
+        # type: (Tuple[int, int]) -> None
+        """Resumes scanning from a checkpoint, which may have been taken on a
+        different version of the source with the same text up to it."""
+        self.current, self.line = checkpoint
+        self.start = self.current
 
-        self.current += 1
-        return True
+    def lexeme(self, token):
+        # type: (Token) -> str
+        """Returns the characters of token."""
+        return self.source[token.start:token.start + token.length]
 
     def make_token(self, token_type):
         #
         """
         """
-        return Token(
-            token_type=token_type,
-            start=self.start,
-            length=self.current - self.start,
-            source=self.source[self.start:self.current],
-            line=self.line,
-        )
+        return Token(token_type, self.start, self.current - self.start, self.line)
 
     def error_token(self, message):
         #
         """
         """
-        print("Error: {}".format(message))
+        self.error_message = message
         return self.make_token(TokenType.TOKEN_ERROR)
 
-    def skip_whitespace(self):
-        #
-        """
+    def scan_token(self):
+        # type: () -> Token
+        """Scans the next token. Lines are counted over the skipped whitespace
+        and inside strings with str.count, so no characters are copied.
         """
-        while True:
-            # Check since not using EOF marker
-            if self.is_at_end():
-                return None
+        source = self.source
+        match = token_pattern.match(source, self.current)
+        group = match.lastindex
+        start, end = match.span(group)
 
-            char = self.peek()
+        if match.start() != start:
+            self.line += source.count("\n", match.start(), start)
 
-            if char in [" ", "\r", "\t"]:
-                self.advance()
-                continue
+        self.start = start
+        self.current = end
 
-            elif char == "\n":
-                self.line += 1
-                self.advance()
-                continue
+        if group == GROUP_IDENTIFIER:
+            token_type = keyword_map.get(source[start:end], TokenType.TOKEN_IDENTIFIER)
+            return Token(token_type, start, end - start, self.line)
 
-            elif char == "/":
-                if self.peek_next() == "/":
-                    while self.peek() != "\n" and not self.is_at_end():
-                        self.advance()
-                    continue
-                else:
-                    return None
+        elif group == GROUP_OPERATOR:
+            return Token(operator_map[source[start:end]], start, end - start, self.line)
 
-            return None
+        elif group == GROUP_NUMBER:
+            return Token(TokenType.TOKEN_NUMBER, start, end - start, self.line)
 
-    def check_keyword(self, start, length, rest, token_type):
-        #
-        """
-        """
-        index = self.start + start
+        elif group == GROUP_STRING:
+            self.line += source.count("\n", start, end)
+            return Token(TokenType.TOKEN_STRING, start, end - start, self.line)
 
-        if ((self.current - self.start == start + length)
-                and (self.source[index:index + length] == rest)):
-            return token_type
+        elif group == GROUP_EOF:
+            return self.make_token(TokenType.TOKEN_EOF)
 
-        return TokenType.TOKEN_IDENTIFIER
+        elif group == GROUP_UNTERMINATED:
+            self.line += source.count("\n", start)
+            self.current = len(source)
+            return self.error_token("Unterminated string.")
 
-    def identifier_type(self):
-        #
-        """
-        """
-        char = self.source[self.start]
-
-        if char == "a":
-            return self.check_keyword(1, 2, "nd", TokenType.TOKEN_AND)
-        elif char == "c":
-            return self.check_keyword(1, 4, "lass", TokenType.TOKEN_CLASS)
-        elif char == "e":
-            return self.check_keyword(1, 3, "lse", TokenType.TOKEN_ELSE)
-        elif char == "i":
-            return self.check_keyword(1, 1, "f", TokenType.TOKEN_IF)
-        elif char == "l":
-            return self.check_keyword(1, 2, "et", TokenType.TOKEN_VAR)
-        elif char == "n":
-            return self.check_keyword(1, 2, "il", TokenType.TOKEN_NIL)
-        elif char == "o":
-            return self.check_keyword(1, 1, "r", TokenType.TOKEN_OR)
-        elif char == "p":
-            return self.check_keyword(1, 4, "rint", TokenType.TOKEN_PRINT)
-        elif char == "r":
-            return self.check_keyword(1, 5, "eturn", TokenType.TOKEN_RETURN)
-        elif char == "t":
-            return self.check_keyword(1, 3, "rue", TokenType.TOKEN_TRUE)
-        elif char == "w":
-            return self.check_keyword(1, 4, "hile", TokenType.TOKEN_WHILE)
-
-        elif char == "f":
-            if self.current - self.start > 1:
-                next_char = self.source[self.start + 1]
-                if next_char == "a":
-                    return self.check_keyword(2, 3, "lse", TokenType.TOKEN_FALSE)
-                if next_char == "o":
-                    return self.check_keyword(2, 1, "r", TokenType.TOKEN_FOR)
-                if next_char == "u":
-                    return self.check_keyword(2, 1, "n", TokenType.TOKEN_FUN)
-
-        elif char == "s":
-            if self.current - self.start > 1:
-                next_char = self.source[self.start + 1]
-                if next_char == "e":
-                    return self.check_keyword(2, 2, "lf", TokenType.TOKEN_THIS)
-                if next_char == "u":
-                    return self.check_keyword(2, 3, "per", TokenType.TOKEN_SUPER)
-
-        return TokenType.TOKEN_IDENTIFIER
-
-    def identifier(self):
-        #
-        """
-        """
-        while self.is_alpha(self.peek()) or self.is_digit(self.peek()):
-            self.advance()
+        return self.error_token("Unexpected character.")
 
-        return self.make_token(self.identifier_type())
 
-    def number(self):
+class StreamScanner(Scanner):
+    def __init__(self, path):
+        # type: (str) -> None
+        """Scanner over a memory-mapped source file, for scripts too large to
+        read into one string. The regex runs directly over the mapped bytes,
+        so pages are read in by the OS as scanning reaches them and can be
+        evicted once passed. Token offsets are byte offsets, and only the
+        characters asked for through lexeme are decoded.
+        """
+        super().__init__(b"")
+        self.file = open(path, "rb")
+
+        # Empty files cannot be mapped
+        if os.fstat(self.file.fileno()).st_size > 0:
+            self.source = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        # type: () -> None
+        """Unmaps and closes the source file. Tokens already scanned keep their
+        offsets, but lexeme can no longer be called."""
+        if isinstance(self.source, mmap.mmap):
+            self.source.close()
+
+        self.source = b""
+        self.file.close()
+
+    def __enter__(self):
         #
         """
         """
-        while self.is_digit(self.peek()):
-            self.advance()
-
-        # Look for a fractional part
-        if self.peek() == "." and self.is_digit(self.peek_next()):
-            # Consume the period
-            self.advance()
-
-            while self.is_digit(self.peek()):
-                self.advance()
+        return self
 
-        return self.make_token(TokenType.TOKEN_NUMBER)
-
-    def string(self):
+    def __exit__(self, *args):
         #
         """
         """
-        while self.peek() != '"' and not self.is_at_end():
-            if self.peek() == "\n":
-                self.line += 1
-            self.advance()
-
-        if self.is_at_end():
-            return error_token("Unterminated string.")
+        self.close()
 
-        # The closing quote
-        self.advance()
-        return self.make_token(TokenType.TOKEN_STRING)
+    def lexeme(self, token):
+        # type: (Token) -> str
+        """Returns the characters of token, decoded from the mapped bytes."""
+        return self.source[token.start:token.start + token.length].decode("UTF-8")
 
     def scan_token(self):
         # type: () -> Token
-        """
-        """
-        self.skip_whitespace()
-        self.start = self.current
+        """Same as Scanner.scan_token over bytes. Lines are counted on a copy
+        of the skipped text, as mmap has no count method."""
+        source = self.source
+        match = byte_token_pattern.match(source, self.current)
+        group = match.lastindex
+        start, end = match.span(group)
 
-        if self.is_at_end():
-            return self.make_token(TokenType.TOKEN_EOF)
+        if match.start() != start:
+            self.line += source[match.start():start].count(b"\n")
 
-        char = self.advance()
+        self.start = start
+        self.current = end
+
+        if group == GROUP_IDENTIFIER:
+            token_type = byte_keyword_map.get(source[start:end], TokenType.TOKEN_IDENTIFIER)
+            return Token(token_type, start, end - start, self.line)
 
-        if self.is_alpha(char):
-            return self.identifier()
+        elif group == GROUP_OPERATOR:
+            return Token(byte_operator_map[source[start:end]], start, end - start, self.line)
 
-        elif self.is_digit(char):
-            return self.number()
+        elif group == GROUP_NUMBER:
+            return Token(TokenType.TOKEN_NUMBER, start, end - start, self.line)
 
-        elif char in single_token_map:
-            return self.make_token(single_token_map[char])
+        elif group == GROUP_STRING:
+            self.line += source[start:end].count(b"\n")
+            return Token(TokenType.TOKEN_STRING, start, end - start, self.line)
 
-        elif char in double_token_map:
-            if self.match("="):
-                return self.make_token(double_token_map[char][0])
-            else:
-                return self.make_token(double_token_map[char][1])
+        elif group == GROUP_EOF:
+            return self.make_token(TokenType.TOKEN_EOF)
 
-        if char == '"':
-            return self.string()
+        elif group == GROUP_UNTERMINATED:
+            # Count without copying, as the rest of the file may be large
+            self.line += sum(1 for _ in byte_newline_pattern.finditer(source, start))
+            self.current = len(source)
+            return self.error_token("Unterminated string.")
 
         return self.error_token("Unexpected character.")
@@ -0,0 +1,364 @@
+import json
+import sys
+
+import chunk
+import optimize
+import scanner
+import vm
+
+PROFILE_VERSION = 1
+
+# Superinstructions take the opcodes from FIRST_OPCODE on, which leaves room
+# for the instructions of chunk.OpCode to grow
+FIRST_OPCODE = 128
+MAX_LENGTH = 4
+
+# Number of superinstructions chosen from a profile, and the share of all
+# dispatches a superinstruction must save to be chosen
+DEFAULT_LIMIT = 32
+DEFAULT_MIN_SHARE = 0.005
+
+# Instructions that may change the instruction pointer or the frame, and so
+# may only be the last instruction of a superinstruction
+ending_opcodes = {
+    chunk.OpCode.OP_JUMP,
+    chunk.OpCode.OP_JUMP_IF_FALSE,
+    chunk.OpCode.OP_LOOP,
+    chunk.OpCode.OP_CALL,
+    chunk.OpCode.OP_RETURN,
+}
+
+# Wide jumps take their distance from the chunk, and are never fused
+excluded_opcodes = {
+    chunk.OpCode.OP_JUMP_LONG,
+    chunk.OpCode.OP_JUMP_IF_FALSE_LONG,
+    chunk.OpCode.OP_LOOP_LONG,
+}
+
+class Profile():
+    def __init__(self):
+        #
+        """Counts how often each sequence of two to MAX_LENGTH instructions
+        runs back to back, recorded by running representative scripts on a VM
+        with VM.profile set. Sequences are tuples of opcodes, and dispatches is
+        the number of instructions run in total. The sequences that save the
+        most dispatches become a SuperinstructionSet.
+        """
+        self.counts = {}  # type: Dict[Tuple[int, ...], int]
+        self.dispatches = 0
+
+        # Instructions run since the last one that did not fall through
+        self.window = []  # type: List[int]
+        self.frame = None  # type: vm.CallFrame
+        self.next_offset = 0
+
+    def record(self, frame, offset, opcode):
+        # type: (vm.CallFrame, int, int) -> None
+        """Counts the instruction at offset, about to run in frame, and each
+        sequence it ends. A sequence only runs back to back if each of its
+        instructions follows the one before in the same frame. A
+        superinstruction is counted as the instructions it replaces, so code
+        compiled with superinstructions gives the same profile."""
+        if frame is not self.frame or offset != self.next_offset:
+            self.window = []
+            self.frame = frame
+
+        if opcode < FIRST_OPCODE:
+            opcodes = (opcode,)
+            size = optimize.operand_sizes[opcode]
+        else:
+            fused = frame.function.bytecode.superinstructions
+            opcodes = fused.sequence(opcode)
+            size = fused.operand_sizes[opcode - fused.first_opcode]
+
+        window = self.window
+
+        for component in opcodes:
+            self.dispatches += 1
+            window.append(component)
+
+            if len(window) > MAX_LENGTH:
+                del window[0]
+
+            for length in range(2, len(window) + 1):
+                sequence = tuple(window[-length:])
+                self.counts[sequence] = self.counts.get(sequence, 0) + 1
+
+        self.next_offset = offset + 1 + size
+
+    def save(self, path):
+        # type: (str) -> None
+        """Writes the counts as JSON, naming opcodes rather than numbering
+        them, so a profile outlives changes to the opcode numbers."""
+        sequences = [{
+            "opcodes": [chunk.OpCode(opcode).name for opcode in sequence],
+            "count": count,
+        } for sequence, count in sorted(self.counts.items(), key=lambda item: -item[1])]
+
+        with open(path, "w") as file:
+            json.dump({
+                "version": PROFILE_VERSION,
+                "dispatches": self.dispatches,
+                "sequences": sequences,
+            }, file, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        # type: (str) -> Profile
+        """Reads a profile written by save. Sequences naming opcodes that no
+        longer exist are skipped."""
+        with open(path) as file:
+            data = json.load(file)
+
+        if data.get("version") != PROFILE_VERSION:
+            raise ValueError("Not a version {} profile.".format(PROFILE_VERSION))
+
+        profile = cls()
+        profile.dispatches = data["dispatches"]
+
+        for entry in data["sequences"]:
+            if all(name in chunk.OpCode.__members__ for name in entry["opcodes"]):
+                sequence = tuple(chunk.OpCode[name] for name in entry["opcodes"])
+                profile.counts[sequence] = entry["count"]
+
+        return profile
+
+
+class SuperinstructionSet():
+    def __init__(self, sequences):
+        # type: (List[Tuple[int, ...]]) -> None
+        """Superinstructions for the given instruction sequences, numbered
+        from FIRST_OPCODE in order. The compiler rewrites finished chunks with
+        them, and the VM builds a handler for each. A superinstruction is
+        encoded as its opcode followed by the operands of each instruction it
+        replaces, read in turn by its handler, see fuse_handlers.
+        """
+        if len(sequences) > 256 - FIRST_OPCODE:
+            raise ValueError("Too many superinstructions.")
+
+        self.first_opcode = FIRST_OPCODE
+        self.sequences = [tuple(sequence) for sequence in sequences]
+        self.opcodes = {sequence: FIRST_OPCODE + i for i, sequence in enumerate(self.sequences)}
+
+        # Bytes of operands of each superinstruction, in opcode order
+        self.operand_sizes = [
+            sum(optimize.operand_sizes[opcode] for opcode in sequence) for sequence in self.sequences
+        ]
+
+    @classmethod
+    def from_profile(cls, profile, limit=DEFAULT_LIMIT, min_share=DEFAULT_MIN_SHARE):
+        # type: (Profile, int, float) -> SuperinstructionSet
+        """Chooses up to limit sequences by the dispatches they save, which is
+        one fewer than their length each time they run, leaving out those
+        saving less than min_share of all dispatches in the profile.
+
+        Sequences are chosen one at a time. Each sequence overlapping one
+        already chosen is mostly run by it instead, so its count drops by the
+        count of the chosen sequence, which keeps a hot loop body from taking
+        the whole set with the shifted windows over it."""
+        counts = {sequence: count for sequence, count in profile.counts.items() if is_fusable(sequence)}
+        threshold = min_share * profile.dispatches
+        sequences = []
+
+        while counts and len(sequences) < limit:
+            chosen = max(counts, key=lambda sequence: counts[sequence] * (len(sequence) - 1))
+            count = counts.pop(chosen)
+
+            if count * (len(chosen) - 1) < threshold:
+                break
+
+            sequences.append(chosen)
+
+            for sequence in counts:
+                if overlaps(chosen, sequence):
+                    counts[sequence] = max(counts[sequence] - count, 0)
+
+        return cls(sequences)
+
+    def sequence(self, opcode):
+        # type: (int) -> Tuple[int, ...]
+        """Returns the instructions superinstruction opcode replaces."""
+        return self.sequences[opcode - self.first_opcode]
+
+    def name(self, opcode):
+        # type: (int) -> str
+        """Returns the name of superinstruction opcode, joined from the names
+        of its instructions."""
+        return "+".join(chunk.OpCode(component).name for component in self.sequence(opcode))
+
+    def make_handlers(self, emulator):
+        # type: (vm.VM) -> List[Callable]
+        """Returns the handler of each superinstruction for emulator, in opcode
+        order, which runs the handlers of the instructions it replaces."""
+        return [
+            fuse_handlers([emulator.dispatch[opcode] for opcode in sequence]) for sequence in self.sequences
+        ]
+
+    def rewrite_chunk(self, bytecode):
+        # type: (chunk.Chunk) -> None
+        """Replaces each sequence of instructions in bytecode that has a
+        superinstruction by that superinstruction, matching the longest
+        sequence first. Sequences that are jumped into are left alone, as are
+        jumps too far for a narrow jump."""
+        instructions = optimize.decode(bytecode)
+        targets = {instruction.target for instruction in instructions if instruction.target is not None}
+        lengths = sorted({len(sequence) for sequence in self.sequences}, reverse=True)
+
+        result = []
+        index = 0
+
+        while index < len(instructions):
+            for length in lengths:
+                components = instructions[index:index + length]
+                opcode = self.opcodes.get(tuple(component.opcode for component in components))
+
+                if opcode is not None and is_straight(components, targets):
+                    break
+            else:
+                result.append(instructions[index])
+                index += 1
+                continue
+
+            first = components[0]
+            last = components[-1]
+
+            result.append(optimize.Instruction(
+                first.offset,
+                opcode,
+                b"".join(bytes(component.operand) for component in components),
+                last.target,
+                first.line,
+                last.jump,
+            ))
+            index += length
+
+        optimize.encode(bytecode, result)
+        bytecode.superinstructions = self
+
+
+def is_fusable(sequence):
+    # type: (Tuple[int, ...]) -> bool
+    """Returns whether sequence can become a superinstruction, which only its
+    last instruction may leave by a jump, call or return."""
+    if any(opcode in excluded_opcodes for opcode in sequence):
+        return False
+
+    return not any(opcode in ending_opcodes for opcode in sequence[:-1])
+
+
+def overlaps(a, b):
+    # type: (Tuple[int, ...], Tuple[int, ...]) -> bool
+    """Returns whether sequence b lies within sequence a, or the two could run
+    as one longer sequence sharing instructions at the end of one and the
+    start of the other."""
+    for start in range(len(a)):
+        if a[start:start + len(b)] == b[:len(a) - start]:
+            return True
+
+    for start in range(1, len(b)):
+        if b[start:] == a[:len(b) - start]:
+            return True
+
+    return False
+
+
+def is_straight(components, targets):
+    # type: (List[optimize.Instruction], Set[int]) -> bool
+    """Returns whether components run one after another whenever the first
+    runs, with no jump into them, and whether a final jump stays narrow.
+    Components must share a line, which runtime errors report."""
+    first = components[0]
+
+    for component in components[1:]:
+        if component.offset in targets or component.line != first.line:
+            return False
+
+    last = components[-1]
+
+    if last.target is None:
+        return True
+
+    # Code only shrinks, so a jump that was narrow stays narrow
+    end = last.offset + 3
+    return abs(last.target - end) <= 0xffff
+
+
+def fuse_handlers(handlers):
+    # type: (List[Callable]) -> Callable
+    """Returns a handler running handlers in turn, stopping at the first to
+    return an InterpretResult. Each handler reads its own operands through
+    frame.ip, which is why a superinstruction keeps the operands of the
+    instructions it replaces in order. Results are never falsy, so the
+    handlers chain with or, one closure for each length up to MAX_LENGTH."""
+    if len(handlers) == 1:
+        return handlers[0]
+
+    if len(handlers) == 2:
+        first, second = handlers
+
+        def handle_two(frame):
+            return first(frame) or second(frame)
+
+        return handle_two
+
+    if len(handlers) == 3:
+        first, second, third = handlers
+
+        def handle_three(frame):
+            return first(frame) or second(frame) or third(frame)
+
+        return handle_three
+
+    if len(handlers) == 4:
+        first, second, third, fourth = handlers
+
+        def handle_four(frame):
+            return first(frame) or second(frame) or third(frame) or fourth(frame)
+
+        return handle_four
+
+    first = handlers[0]
+    rest = fuse_handlers(handlers[1:])
+
+    def handle(frame):
+        return first(frame) or rest(frame)
+
+    return handle
+
+
+def profile_files(paths):
+    # type: (List[str]) -> Profile
+    """Runs each script in paths on a profiling VM, returning the profile of
+    all of them."""
+    profile = Profile()
+
+    for path in paths:
+        emulator = vm.VM()
+        emulator.profile = profile
+        emulator.expose = False
+
+        with scanner.StreamScanner(path) as reader:
+            emulator.interpret(reader)
+
+        emulator.free_vm()
+
+    return profile
+
+
+def main():
+    # Records a profile of the given scripts, for main.run_file
+    if len(sys.argv) < 3:
+        print("Usage: superinstructions.py profile.json script.lox ...")
+        sys.exit(64)
+
+    profile = profile_files(sys.argv[2:])
+    profile.save(sys.argv[1])
+
+    fused = SuperinstructionSet.from_profile(profile)
+
+    for opcode in range(FIRST_OPCODE, FIRST_OPCODE + len(fused.sequences)):
+        print(fused.name(opcode))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,148 +1,441 @@
+from enum import Enum
+
 import memory
-import value
 
 TABLE_MAX_LOAD = 0.75
 
+# Compact once tombstones take up this share of the slots
+TABLE_MAX_TOMBSTONES = 0.25
+
+# Shrink once live keys take up less than this share of the slots
+TABLE_MIN_LOAD = 0.125
+TABLE_MIN_CAPACITY = 8
+
+# Key stored in place of a deleted key, so that probing continues past it.
+# Empty slots hold None instead.
+TOMBSTONE = object()
+
+
+class ProbeStrategy(Enum):
+    PROBE_LINEAR = "PROBE_LINEAR"
+    PROBE_ROBIN_HOOD = "PROBE_ROBIN_HOOD"
 
-class Entry():
-    def __init__(self, key, val):
+
+class TableStats():
+    def __init__(self, count, capacity, average_probe_length, max_probe_length,
+                 tombstone_ratio, resize_count):
         #
+        """Snapshot of the occupancy and probe lengths of a Table. Probe length
+        is the number of slots examined to find a key, so 1 means the key sits
+        in its home slot.
         """
-        """
-        self.key = key
-        self.value = val
+        self.count = count
+        self.capacity = capacity
+        self.average_probe_length = average_probe_length
+        self.max_probe_length = max_probe_length
+        self.tombstone_ratio = tombstone_ratio
+        self.resize_count = resize_count
 
 
 class Table():
-    def __init__(self):
-        #
-        """
+    def __init__(self, strategy=ProbeStrategy.PROBE_LINEAR, max_load=TABLE_MAX_LOAD):
+        # type: (ProbeStrategy, float) -> None
+        """Open-addressing hash table keyed by ObjectString. Keys and values
+        are held in two parallel arrays, and capacity is always a power of two
+        so probing can mask the hash instead of taking a modulo.
+
+        Keys are usually interned and found by identity. Keys that are not,
+        such as concatenations or names compiled with another intern table,
+        are found by comparing characters, see find_entry.
+
+        With PROBE_ROBIN_HOOD, inserts displace keys closer to their home slot
+        and deletes shift later keys back, so probe lengths stay even and no
+        tombstones are left behind.
         """
         self.count = 0
         self.capacity = 0
-        self.entries = None
+        self.keys = None
+        self.values = None
+        self.strategy = strategy
+        self.robin_hood = strategy == ProbeStrategy.PROBE_ROBIN_HOOD
+        self.max_load = max_load
+        self.resize_count = 0
+
+        # Tombstones are included in count, as they lengthen probe sequences
+        self.tombstones = 0
+
+        # Lookups made through find_string, reported for the intern table
+        self.hits = 0
+        self.misses = 0
 
     def free_table(self):
         #
         """
         """
-        self.entries = memory.free_array(self.entries, self.capacity)
+        self.keys = memory.free_array(self.keys, self.capacity)
+        self.values = memory.free_array(self.values, self.capacity)
         self.count = 0
         self.capacity = 0
+        self.tombstones = 0
 
     def find_entry(self, key):
-        # type: (ObjectString) -> Optional[Entry]
-        """Table method to retrieve Entry with matching key."""
-        return find_entry(self.entries, self.capacity, key)
+        # type: (ObjectString) -> int
+        """Table method to retrieve index of the slot for matching key."""
+        return find_entry(self.keys, self.capacity, key)
 
     def adjust_capacity(self, capacity):
         # type: (int) -> None
-        """Change size of table to given capacity."""
-        entries = memory.allocate(capacity)
-
-        for i in range(capacity):
-            entries[i] = Entry(key=None, val=value.nil_val())
+        """Change size of table to given capacity, which must be a power of
+        two. Tombstones are dropped, so count becomes the number of live keys.
+        """
+        keys = memory.allocate(capacity)
+        values = memory.allocate(capacity)
 
         self.count = 0
+        self.tombstones = 0
 
         for j in range(self.capacity):
-            entry = self.entries[j]
+            key = self.keys[j]
 
-            if entry.key is None:
+            if key is None or key is TOMBSTONE:
                 continue
 
-            dest = self.find_entry(entry.key)
-            dest.key = entry.key
-            dest.value = entry.value
+            if self.robin_hood:
+                robin_hood_insert(keys, values, capacity, key, self.values[j])
+            else:
+                index = find_entry(keys, capacity, key)
+                keys[index] = key
+                values[index] = self.values[j]
+
             self.count += 1
 
-        self.entries = memory.free_array(self.entries, self.capacity)
-        self.entries = entries
+        self.keys = keys
+        self.values = values
         self.capacity = capacity
+        self.resize_count += 1
 
-    def table_get(self, key):
-        # type: (ObjectString) -> Optional[Any]
+    def table_get(self, key, default=None):
+        # type: (ObjectString, Any) -> Any
         """Retrieves value for matching key. Implementation differs from text
-        since text sets the return value to a pointer.
+        since text sets the return value to a pointer. Since nil is stored as
+        None, pass a sentinel default to tell a missing key from a nil value.
         """
         if self.count == 0:
-            return None
+            return default
 
-        entry = self.find_entry(key)
+        if self.robin_hood:
+            index = robin_hood_find(self.keys, self.capacity, key)
 
-        if entry.key is None:
-            return None
+            if index == -1:
+                return default
+
+            return self.values[index]
+
+        index = find_entry(self.keys, self.capacity, key)
+        existing = self.keys[index]
 
-        return entry.value
+        if existing is None or existing is TOMBSTONE:
+            return default
+
+        return self.values[index]
 
     def table_set(self, key, val):
         # type: (ObjectString, Any) -> bool
-        """Insert key-value pair as Entry in Table."""
-        if self.count + 1 > self.capacity * TABLE_MAX_LOAD:
-            capacity = memory.grow_capacity(self.capacity)
-            self.adjust_capacity(capacity)
+        """Insert key-value pair in Table. Returns True if key is new."""
+        if self.count + 1 > self.capacity * self.max_load:
+            live = self.count - self.tombstones
+
+            # Rehash at the same size if dropping tombstones leaves enough room
+            if live + 1 <= self.capacity * self.max_load / 2:
+                self.adjust_capacity(self.capacity)
+            else:
+                self.adjust_capacity(memory.grow_capacity(self.capacity))
+
+        if self.robin_hood:
+            is_new_key = robin_hood_insert(self.keys, self.values, self.capacity, key, val)
+
+            if is_new_key:
+                self.count += 1
+
+            return is_new_key
 
-        entry = self.find_entry(key)
-        is_new_key = entry.key == None
+        index = find_entry(self.keys, self.capacity, key)
+        existing = self.keys[index]
 
-        if is_new_key and entry.value.is_nil():
+        # Reusing a tombstone does not change count, as tombstones are counted
+        if existing is None:
             self.count += 1
+        elif existing is TOMBSTONE:
+            self.tombstones -= 1
 
-        entry.key = key
-        entry.value = val
+        self.keys[index] = key
+        self.values[index] = val
 
-        return is_new_key
+        return existing is None or existing is TOMBSTONE
 
     def table_delete(self, key):
         # type: (ObjectString) -> bool
-        """Removes Entry with given key and place a tombstone in the entry."""
+        """Removes key and places a tombstone in its slot."""
         if self.count == 0:
             return False
 
-        # Find the entry
-        entry = self.find_entry(key)
+        if self.robin_hood:
+            if not robin_hood_delete(self.keys, self.values, self.capacity, key):
+                return False
 
-        if entry.key is None:
+            self.count -= 1
+            self.shrink_if_sparse()
+            return True
+
+        index = find_entry(self.keys, self.capacity, key)
+        existing = self.keys[index]
+
+        if existing is None or existing is TOMBSTONE:
             return False
 
-        # Place a tombstone in the entry
-        entry.key = None
-        entry.value = value.bool_val(True)
+        # Place a tombstone in the slot
+        self.keys[index] = TOMBSTONE
+        self.values[index] = None
+        self.tombstones += 1
+
+        if not self.shrink_if_sparse() and self.tombstones > self.capacity * TABLE_MAX_TOMBSTONES:
+            self.adjust_capacity(self.capacity)
 
         return True
 
+    def fit_capacity(self, live):
+        # type: (int) -> int
+        """Smallest power of two capacity holding live keys at half the maximum
+        load, leaving room to grow before the next resize."""
+        capacity = TABLE_MIN_CAPACITY
+
+        while live > capacity * self.max_load / 2:
+            capacity = memory.grow_capacity(capacity)
+
+        return capacity
+
+    def shrink_if_sparse(self):
+        # type: () -> bool
+        """Shrinks the table once live keys drop below TABLE_MIN_LOAD, which
+        also drops tombstones. Returns True if the table was resized."""
+        live = self.count - self.tombstones
+
+        if self.capacity <= TABLE_MIN_CAPACITY or live >= self.capacity * TABLE_MIN_LOAD:
+            return False
+
+        self.adjust_capacity(self.fit_capacity(live))
+        return True
+
+    def compact(self):
+        # type: () -> None
+        """Drops all tombstones and shrinks capacity to fit the live keys.
+        Deletes already do this once tombstones or free slots pass a threshold,
+        so this is only needed to reclaim memory eagerly."""
+        live = self.count - self.tombstones
+
+        if live == 0:
+            self.free_table()
+            return None
+
+        self.adjust_capacity(min(self.fit_capacity(live), self.capacity))
+
+    def find_string(self, chars, length, hash_value):
+        # type: (str, int, int) -> Optional[ObjectString]
+        """Retrieves the interned key with matching characters, if any. Takes
+        the characters and hash rather than a string, so a string is only
+        created when it is not interned yet.
+        """
+        if self.count == 0:
+            self.misses += 1
+            return None
+
+        keys = self.keys
+        mask = self.capacity - 1
+        index = hash_value & mask
+
+        while True:
+            key = keys[index]
+
+            # Stop if we find an empty non-tombstone slot
+            if key is None:
+                self.misses += 1
+                return None
+
+            elif (key is not TOMBSTONE and key.length == length
+                  and key.hash_value == hash_value and key.chars == chars):
+                self.hits += 1
+                return key
+
+            index = (index + 1) & mask
+
+    def stats(self):
+        # type: () -> TableStats
+        """Scans the table to report probe lengths of the live keys, the share
+        of slots holding tombstones and the number of resizes so far."""
+        live = 0
+        tombstones = 0
+        total_probe_length = 0
+        max_probe_length = 0
+
+        for index in range(self.capacity):
+            key = self.keys[index]
+
+            if key is None:
+                continue
+            elif key is TOMBSTONE:
+                tombstones += 1
+                continue
+
+            probe_length = ((index - key.hash_value) & (self.capacity - 1)) + 1
+            total_probe_length += probe_length
+            max_probe_length = max(max_probe_length, probe_length)
+            live += 1
+
+        return TableStats(
+            count=live,
+            capacity=self.capacity,
+            average_probe_length=total_probe_length / live if live else 0.0,
+            max_probe_length=max_probe_length,
+            tombstone_ratio=tombstones / self.capacity if self.capacity else 0.0,
+            resize_count=self.resize_count,
+        )
+
     def table_add_all(self, other):
         # type: (Table) -> None
-        """Transfer all Entries in other Table to current table."""
+        """Transfer all entries in other Table to current table."""
         for i in range(other.capacity):
-            entry = other.entries[i]
+            key = other.keys[i]
+
+            if key is not None and key is not TOMBSTONE:
+                self.table_set(key, other.values[i])
+
+
+def find_entry(keys, capacity, key):
+    # type: (List[ObjectString], int, ObjectString) -> int
+    """Given ObjectString key, retrieve index of the slot holding the matching
+    key, or of the slot where it should be inserted. Separate function created
+    (instead of a class method) since adjust_capacity requires retrieval of
+    non-current Table.
+
+    Keys are compared by identity, and only a key that is not the same
+    object is compared by characters. Interned keys are never equal to
+    another interned key, but a key that is not interned may equal one that
+    is. Keys in the table already have their hash, so the lengths and hashes
+    are compared before the characters, which is only done for a likely
+    match."""
+    mask = capacity - 1
+    hash_value = key.hash_value
+    length = key.length
+    index = hash_value & mask
+    tombstone = -1
+
+    while True:
+        existing = keys[index]
+
+        if existing is None:
+            # Empty slot, reuse an earlier tombstone if any
+            return index if tombstone == -1 else tombstone
+
+        elif existing is key:
+            return index
+
+        elif existing is TOMBSTONE:
+            if tombstone == -1:
+                tombstone = index
+
+        elif (existing.length == length and existing._hash_value == hash_value
+              and existing.chars == key.chars):
+            return index
+
+        index = (index + 1) & mask
+
+
+def robin_hood_find(keys, capacity, key):
+    # type: (List[ObjectString], int, ObjectString) -> int
+    """Retrieves index of the slot holding key in a Robin Hood table, or -1.
+    The search stops early at a key closer to its home slot than key would be,
+    since key would have displaced it on insertion."""
+    mask = capacity - 1
+    hash_value = key.hash_value
+    length = key.length
+    index = hash_value & mask
+    distance = 0
+
+    while True:
+        existing = keys[index]
+
+        if existing is None:
+            return -1
+        elif existing is key or (existing.length == length and existing._hash_value == hash_value
+                                 and existing.chars == key.chars):
+            return index
+        elif (index - existing.hash_value) & mask < distance:
+            return -1
+
+        index = (index + 1) & mask
+        distance += 1
+
+
+def robin_hood_insert(keys, values, capacity, key, val):
+    # type: (List[ObjectString], List[Any], int, ObjectString, Any) -> bool
+    """Inserts key in a Robin Hood table, taking the slot of any key closer to
+    its home slot and carrying that key on. Returns True if key is new."""
+    mask = capacity - 1
+    hash_value = key.hash_value
+    length = key.length
+    index = hash_value & mask
+    distance = 0
+
+    while True:
+        existing = keys[index]
+
+        if existing is None:
+            keys[index] = key
+            values[index] = val
+            return True
+
+        elif existing is key or (existing.length == length and existing._hash_value == hash_value
+                                 and existing.chars == key.chars):
+            values[index] = val
+            return False
+
+        existing_distance = (index - existing.hash_value) & mask
+
+        if existing_distance < distance:
+            # Once key is placed it cannot also appear further along, so the
+            # displaced keys carried from here on are known to be new
+            keys[index], key = key, existing
+            values[index], val = val, values[index]
+            distance = existing_distance
+
+        index = (index + 1) & mask
+        distance += 1
+
 
-            if not entry.key is None:
-                self.table_set(entry.key, entry.value)
+def robin_hood_delete(keys, values, capacity, key):
+    # type: (List[ObjectString], List[Any], int, ObjectString) -> bool
+    """Removes key from a Robin Hood table by shifting the following keys back
+    one slot until one sits in its home slot, so no tombstone is needed."""
+    index = robin_hood_find(keys, capacity, key)
 
+    if index == -1:
+        return False
 
-def find_entry(entries, capacity, key):
-    # type: (List[Entry], int, ObjectString) -> Optional[Entry]
-    """Given ObjectString key, retrieve Entry in Table with the matching key.
-    Separate function created (instead of a class method) since adjust_capacity
-    requires retrieval of non-current Table."""
-    index = key.hash_value % capacity
-    tombstone = None
+    mask = capacity - 1
+    following = (index + 1) & mask
 
     while True:
-        entry = entries[index]
+        existing = keys[following]
 
-        if entry.key is None:
-            # Empty entry
-            if entry.value.is_nil():
-                return tombstone or entry
+        if existing is None or (following - existing.hash_value) & mask == 0:
+            break
 
-            # Tombstone found
-            if tombstone is None:
-                tombstone = entry
+        keys[index] = existing
+        values[index] = values[following]
+        index = following
+        following = (following + 1) & mask
 
-        # Key found
-        elif entry.key.chars == key.chars:
-            return entry
+    keys[index] = None
+    values[index] = None
 
-        index = (index + 1) % capacity
+    return True
@@ -0,0 +1,366 @@
+import array
+import bisect
+import concurrent.futures
+import json
+import re
+import string
+import struct
+import sys
+
+import scanner
+
+# Token types are stored by their position in TokenType, which fits in a byte
+token_types = list(scanner.TokenType)
+token_type_codes = {token_type: code for code, token_type in enumerate(token_types)}
+
+TOKEN_STREAM_MAGIC = b"LOXT"
+TOKEN_STREAM_VERSION = 1
+
+# Magic, version, byte order, token count and length of the error messages
+header_format = "<4sBBII"
+
+# Skipped text and token text of each token, see scan
+stream_pattern = re.compile(
+    "({})({})".format(scanner.skip_source, "|".join(scanner.token_sources)),
+    re.DOTALL,
+)
+
+# Codes of keywords and operators by their text, and of the other tokens
+# with a type fixed by their first character
+text_codes = {chars: token_type_codes[token_type] for chars, token_type in scanner.keyword_map.items()}
+text_codes.update({chars: token_type_codes[token_type] for chars, token_type in scanner.operator_map.items()})
+
+first_char_codes = dict.fromkeys(string.ascii_letters + "_", token_type_codes[scanner.TokenType.TOKEN_IDENTIFIER])
+first_char_codes.update(dict.fromkeys(string.digits, token_type_codes[scanner.TokenType.TOKEN_NUMBER]))
+
+STRING_CODE = token_type_codes[scanner.TokenType.TOKEN_STRING]
+ERROR_CODE = token_type_codes[scanner.TokenType.TOKEN_ERROR]
+
+# Sources shorter than this are not worth splitting across processes
+PARALLEL_MIN_SIZE = 1 << 20
+
+
+class TokenStream():
+    def __init__(self):
+        #
+        """Tokens of one source held column by column, in one array per field
+        rather than one Token per token. A token is identified by its index,
+        and error tokens keep their message in messages under that index.
+        """
+        self.count = 0
+        self.types = array.array("B")
+        self.starts = array.array("I")
+        self.lengths = array.array("I")
+        self.lines = array.array("I")
+        self.messages = {}  # type: Dict[int, str]
+
+    def append(self, token, message=None):
+        # type: (scanner.Token, Optional[str]) -> None
+        """Adds token at the end of the stream."""
+        if token.token_type == scanner.TokenType.TOKEN_ERROR:
+            self.messages[self.count] = message
+
+        self.types.append(token_type_codes[token.token_type])
+        self.starts.append(token.start)
+        self.lengths.append(token.length)
+        self.lines.append(token.line)
+        self.count += 1
+
+    def extend(self, other, first, last):
+        # type: (TokenStream, int, int) -> None
+        """Adds the tokens of other from index first up to last."""
+        for index, message in other.messages.items():
+            if first <= index < last:
+                self.messages[self.count + index - first] = message
+
+        self.types.extend(other.types[first:last])
+        self.starts.extend(other.starts[first:last])
+        self.lengths.extend(other.lengths[first:last])
+        self.lines.extend(other.lines[first:last])
+        self.count += last - first
+
+    def token(self, index):
+        # type: (int) -> scanner.Token
+        """Returns the token at index as a Token."""
+        return scanner.Token(
+            token_types[self.types[index]],
+            self.starts[index],
+            self.lengths[index],
+            self.lines[index],
+        )
+
+    def to_bytes(self):
+        # type: () -> bytes
+        """Serializes the stream as a header followed by the raw columns and
+        the error messages as JSON."""
+        messages = json.dumps({str(index): message for index, message in self.messages.items()})
+        messages = messages.encode("UTF-8")
+
+        header = struct.pack(
+            header_format,
+            TOKEN_STREAM_MAGIC,
+            TOKEN_STREAM_VERSION,
+            sys.byteorder == "big",
+            self.count,
+            len(messages),
+        )
+
+        return b"".join([
+            header,
+            self.types.tobytes(),
+            self.starts.tobytes(),
+            self.lengths.tobytes(),
+            self.lines.tobytes(),
+            messages,
+        ])
+
+    @classmethod
+    def from_bytes(cls, data):
+        # type: (bytes) -> TokenStream
+        """Reads a stream written by to_bytes, swapping byte order if it was
+        written on a machine of the other endianness."""
+        magic, version, big_endian, count, messages_length = struct.unpack_from(header_format, data)
+
+        if magic != TOKEN_STREAM_MAGIC or version != TOKEN_STREAM_VERSION:
+            raise ValueError("Not a version {} token stream.".format(TOKEN_STREAM_VERSION))
+
+        stream = cls()
+        stream.count = count
+        offset = struct.calcsize(header_format)
+
+        for column in [stream.types, stream.starts, stream.lengths, stream.lines]:
+            size = count * column.itemsize
+            column.frombytes(data[offset:offset + size])
+            offset += size
+
+            if big_endian != (sys.byteorder == "big"):
+                column.byteswap()
+
+        messages = json.loads(data[offset:offset + messages_length].decode("UTF-8"))
+        stream.messages = {int(index): message for index, message in messages.items()}
+
+        return stream
+
+
+def tokenize(source):
+    # type: (str) -> TokenStream
+    """Scans source to the end into a TokenStream."""
+    return scan(source)
+
+
+def scan(source, offset=0, line=1, keep_eof=True):
+    # type: (str, int, int, bool) -> TokenStream
+    """Scans source into a TokenStream, with the same tokens as
+    Scanner.scan_token. The regex returns the skipped text and the text of
+    each token as strings through findall, so the columns are filled with no
+    Token and no match object per token, which are most of the cost of
+    scanning one token at a time. The type of a token follows from its text.
+    Starts are shifted by offset and lines counted from line, for a chunk of a
+    larger source. The EOF token is left out unless keep_eof.
+    """
+    stream = TokenStream()
+    types = []  # type: List[int]
+    starts = []  # type: List[int]
+    lengths = []  # type: List[int]
+    lines = []  # type: List[int]
+
+    add_type = types.append
+    add_start = starts.append
+    add_length = lengths.append
+    add_line = lines.append
+    text_code = text_codes.get
+    first_code = first_char_codes.get
+    position = offset
+
+    for skipped, text in stream_pattern.findall(source):
+        if skipped:
+            position += len(skipped)
+            line += skipped.count("\n")
+
+        length = len(text)
+        code = text_code(text)
+
+        if code is None:
+            code = first_code(text[:1])
+
+            if code is None:
+                if length > 1:
+                    code = STRING_CODE
+                    line += text.count("\n")
+                elif length == 0:
+                    break
+                else:
+                    code = ERROR_CODE
+
+                    # An unterminated string runs to the end of the source
+                    if text == '"':
+                        stream.messages[len(types)] = "Unterminated string."
+                        line += source.count("\n", position - offset)
+                        length = len(source) - (position - offset)
+                    else:
+                        stream.messages[len(types)] = "Unexpected character."
+
+        add_type(code)
+        add_start(position)
+        add_length(length)
+        add_line(line)
+        position += length
+
+        if position - offset == len(source):
+            break
+
+    if keep_eof:
+        add_type(token_type_codes[scanner.TokenType.TOKEN_EOF])
+        add_start(len(source) + offset)
+        add_length(0)
+        add_line(line)
+
+    stream.types = array.array("B", types)
+    stream.starts = array.array("I", starts)
+    stream.lengths = array.array("I", lengths)
+    stream.lines = array.array("I", lines)
+    stream.count = len(types)
+
+    return stream
+
+
+def tokenize_parallel(source, workers=1, min_size=PARALLEL_MIN_SIZE):
+    # type: (str, int, int) -> TokenStream
+    """Scans source into the same TokenStream as tokenize, with the work split
+    across a pool of processes.
+
+    The source is split into chunks at line breaks, and each chunk is scanned
+    on the guess that it starts between tokens. Comments end at a line break,
+    so the guess only fails for a string spanning a chunk boundary, which the
+    chunk holding its opening quote sees as an unterminated string. From the
+    start of such a string, scanning continues serially until a token starts
+    where one of the guessed tokens started, from which point the guessed
+    tokens are correct, as scanner state between tokens is only the offset
+    and line.
+
+    Workers defaults to one, which scans serially: the pool has only been
+    measured on one CPU, where it is slower than tokenize.
+    """
+    if workers == 1 or len(source) < min_size:
+        return tokenize(source)
+
+    chunk_starts = split_lines(source, workers)
+    chunk_ends = chunk_starts[1:] + [len(source)]
+
+    jobs = [(
+        source[start:end],
+        start,
+        1 + source.count("\n", 0, start),
+        end == len(source),
+    ) for start, end in zip(chunk_starts, chunk_ends)]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        chunks = [TokenStream.from_bytes(data) for data in executor.map(tokenize_chunk, jobs)]
+
+    return join_chunks(source, chunk_starts, chunks)
+
+
+def split_lines(source, count):
+    # type: (str, int) -> List[int]
+    """Returns the start offsets of up to count chunks of source of about
+    equal size, each starting at the beginning of a line."""
+    starts = [0]
+    size = len(source) // count
+
+    for _ in range(count - 1):
+        start = source.find("\n", starts[-1] + max(size, 1)) + 1
+
+        if start == 0 or start >= len(source):
+            break
+
+        starts.append(start)
+
+    return starts
+
+
+def tokenize_chunk(job):
+    # type: (Tuple[str, int, int, bool]) -> bytes
+    """Scans one chunk in a worker process, returning the serialized stream.
+    Offsets and lines are made absolute here rather than in the parent. Only
+    the last chunk keeps its EOF token."""
+    text, offset, line, is_last = job
+    return scan(text, offset, line, is_last).to_bytes()
+
+
+def join_chunks(source, chunk_starts, chunks):
+    # type: (str, List[int], List[TokenStream]) -> TokenStream
+    """Joins the streams scanned from each chunk, rescanning serially from any
+    string that runs past the end of its chunk, see tokenize_parallel."""
+    result = TokenStream()
+    index = 0
+    first = 0
+    error_code = token_type_codes[scanner.TokenType.TOKEN_ERROR]
+
+    while index < len(chunks):
+        chunk = chunks[index]
+        last = chunk.count
+
+        is_broken = (index + 1 < len(chunks) and last > 0 and chunk.types[last - 1] == error_code
+                     and chunk.messages[last - 1] == "Unterminated string.")
+
+        if not is_broken:
+            result.extend(chunk, first, last)
+            index += 1
+            first = 0
+            continue
+
+        result.extend(chunk, first, last - 1)
+
+        broken = index
+        offset = chunk.starts[last - 1]
+        reader = scanner.Scanner(source)
+        reader.restore((offset, 1 + source.count("\n", 0, offset)))
+
+        while True:
+            token = reader.scan_token()
+
+            # Back in step once a token starts where a guessed token started
+            index = bisect.bisect_right(chunk_starts, token.start) - 1
+            first = bisect.bisect_left(chunks[index].starts, token.start)
+
+            if (index > broken and first < chunks[index].count
+                    and chunks[index].starts[first] == token.start):
+                break
+
+            result.append(token, reader.error_message)
+
+            if token.token_type == scanner.TokenType.TOKEN_EOF:
+                return result
+
+    return result
+
+
+class TokenReader(scanner.Scanner):
+    def __init__(self, stream, source):
+        # type: (TokenStream, str) -> None
+        """Replays a TokenStream through the Scanner interface, so the parser
+        can compile from tokens scanned earlier. Source must be the text the
+        stream was scanned from, as lexemes are read from it by offset.
+        """
+        super().__init__(source)
+        self.stream = stream
+        self.index = 0
+
+    def scan_token(self):
+        # type: () -> scanner.Token
+        """Returns the next token of the stream, repeating the final EOF."""
+        index = self.index
+
+        if index < self.stream.count - 1:
+            self.index += 1
+
+        token = self.stream.token(index)
+
+        if token.token_type == scanner.TokenType.TOKEN_ERROR:
+            self.error_message = self.stream.messages[index]
+
+        self.start = token.start
+        self.current = token.start + token.length
+        self.line = token.line
+
+        return token
@@ -3,10 +3,22 @@ from typing import Any, List, Optional, Union
 
 import memory
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 FNV_32_INIT = 2166136261
 FNV_32_PRIME = 16777619
 FNV_32_SIZE = 2**32
 
+# Concatenations shorter than this are joined eagerly rather than as a rope
+ROPE_MIN_LENGTH = 64
+
+# Below this many strings hash_strings uses the plain loop, as the NumPy path
+# has a fixed setup cost
+BULK_HASH_MIN_COUNT = 64
+
 
 class ObjectType(Enum):
     OBJ_FUNCTION = "OBJ_FUNCTION"
@@ -15,351 +27,371 @@ class ObjectType(Enum):
 
 
 class Object():
-    def __init__(self, object_type, obj):
-        # type: (ObjectType, Any)
-        """Initialize Object."""
-        self.object_type = object_type
-        self.obj = obj
+    """Base class of heap-allocated values. Numbers, booleans and nil are held
+    directly as Python float, bool and None instead."""
+    __slots__ = ()
+    object_type = None  # type: ObjectType
 
     def is_object_type(self, object_type):
         # type: (ObjectType) -> bool
         """Checks if Object type matches argument."""
         return self.object_type == object_type
 
-    def is_function(self):
-        # type: () -> bool
-        """Checks if Object version is a function."""
-        return self.is_object_type(ObjectType.OBJ_FUNCTION)
-
-    def is_native(self):
-        # type: () -> bool
-        """Checks if Object version is a native function."""
-        return self.is_object_type(ObjectType.OBJ_NATIVE)
-
-    def is_string(self):
-        # type: () -> bool
-        """Checks if Object version is a string."""
-        return self.is_object_type(ObjectType.OBJ_STRING)
 
+class ObjectFunction(Object):
+    object_type = ObjectType.OBJ_FUNCTION
 
-def allocate_object(size, object_type):
-    #
-    """
-    """
-    return Object(
-        object_type=object_type,
-        obj=memory.reallocate(None, 0, size),
-    )
-
-
-class ObjectFunction():
-    def __init__(self, obj):
+    def __init__(self):
         #
         """Initialize function version of Object.
 
         Not implement free_object for the moment due to dependency on chunk.py.
         """
-        self.obj = obj
         self.arity = 0
         self.bytecode = None
         self.name = None
 
 
-def new_function(length=8):
+def new_function():
     #
     """
     """
-    obj = allocate_object(length, ObjectType.OBJ_FUNCTION)
+    return ObjectFunction()
 
-    return ObjectFunction(obj)
 
+class ObjectNative(Object):
+    object_type = ObjectType.OBJ_NATIVE
 
-class ObjectNative():
-    def __init__(self, obj, function):
+    def __init__(self, function):
         #
         """
         """
-        self.obj = obj
         self.function = function
 
-def new_native(function, length=8):
+
+def new_native(function):
     #
     """
     """
-    obj = allocate_object(length, ObjectType.OBJ_NATIVE)
+    return ObjectNative(function)
+
 
-    return ObjectNative(obj, function)
+class ObjectString(Object):
+    __slots__ = ("length", "_chars", "_hash_value", "_left", "_right")
+    object_type = ObjectType.OBJ_STRING
 
+    def __init__(self, chars, length, hash_value=None):
+        # type: (Optional[str], int, Optional[int]) -> None
+        """Initialize string version of Object. Characters are held as an
+        immutable Python string. The hash is computed on first use and cached,
+        so strings never used as table keys are never hashed.
 
-class ObjectString():
-    def __init__(self, obj):
-        # type: (Object) -> None
-        """Initialize string version of Object.
+        A string created by new_rope has no characters yet, only the two
+        strings it concatenates. Its characters are joined on first access.
 
         Not implement free_object for the moment due to dependency on chunk.py.
         """
-        self.obj = obj
-        self.length = 0
-        self.chars = obj.obj
-        self.hash_value = None
-        # Reset array created by obj.obj
-        self.obj.obj = None
+        self.length = length
+        self._chars = chars
+        self._hash_value = hash_value
+        self._left = None  # type: Optional[ObjectString]
+        self._right = None  # type: Optional[ObjectString]
+
+    @property
+    def chars(self):
+        # type: () -> str
+        """Characters of the string, flattening a rope on first access."""
+        if self._chars is None:
+            self.flatten()
+
+        return self._chars
+
+    @property
+    def hash_value(self):
+        # type: () -> int
+        """FNV-1a hash of the characters, computed lazily."""
+        if self._hash_value is None:
+            self._hash_value = hash_string(self.chars, self.length)
+
+        return self._hash_value
+
+    def is_rope(self):
+        # type: () -> bool
+        """Checks if the characters of the string are still to be joined."""
+        return self._chars is None
+
+    def flatten(self):
+        # type: () -> None
+        """Joins the pieces of a rope in one pass. Uses an explicit stack since
+        ropes built in a loop are as deep as the number of iterations."""
+        pieces = []
+        stack = [self]
+
+        while stack:
+            node = stack.pop()
+
+            if node._chars is not None:
+                pieces.append(node._chars)
+            else:
+                stack.append(node._right)
+                stack.append(node._left)
 
+        self._chars = "".join(pieces)
+        self._left = None
+        self._right = None
 
-def allocate_string(chars, length, hash_value):
-    # type: (List[str], int, Any) -> ObjectString
-    """Creates ObjectString from Object and copies chars. Note length represents
-    length of characters excluding end of string token.
 
-    String internment not implemented due to circular dependencies."""
-    obj = allocate_object(length + 1, ObjectType.OBJ_STRING)
+def allocate_string(chars, length, hash_value=None, strings=None):
+    # type: (str, int, Optional[int], Optional[Table]) -> ObjectString
+    """Creates ObjectString from chars. Since Python strings are immutable the
+    characters are shared rather than copied, and no end of string token is
+    stored. The string is added to the intern table strings if given."""
+    string = ObjectString(chars, length, hash_value)
 
-    string = ObjectString(obj)
-    string.chars[:len(chars)] = chars
-    string.length = length
-    string.hash_value = hash_value
+    if strings is not None:
+        strings.table_set(string, None)
 
     return string
 
 
 def hash_string(chars, length):
-    # type: (List[str], int) -> int
-    """Applies FNV-1a to character string.
+    # type: (str, int) -> int
+    """Applies FNV-1a to the UTF-8 encoding of the first length characters.
     http://www.isthe.com/chongo/tech/comp/fnv/#FNV-1
     """
     hash_int = FNV_32_INIT
-    key = bytes("".join(chars), "UTF-8")
+    mask = FNV_32_SIZE - 1
 
-    for i in range(length):
-        hash_int = hash_int ^ key[i]
-        hash_int = (hash_int * FNV_32_PRIME) % FNV_32_SIZE
+    for byte in chars[:length].encode("UTF-8"):
+        hash_int = ((hash_int ^ byte) * FNV_32_PRIME) & mask
 
     return hash_int
 
 
-def take_string(chars, length):
-    # type: (List[str], int) -> ObjectString
-    """Applies for concatenation. Takes ownership of characters passed as
-    argument, since no need for copy of characters on the heap.
+def hash_strings(chars_list):
+    # type: (List[str]) -> List[int]
+    """Applies FNV-1a to many strings at once, giving the same results as
+    hash_string. With NumPy available and enough strings, the strings are
+    sorted by length and hashed one byte position at a time across all strings
+    still long enough, so the per-byte loop runs in NumPy rather than Python.
+    The bytes of a few much longer strings are left to the plain loop.
     """
-    hash_value = hash_string(chars, length)
+    if numpy is None or len(chars_list) < BULK_HASH_MIN_COUNT:
+        return [hash_string(chars, len(chars)) for chars in chars_list]
 
-    return allocate_string(chars, length, hash_value)
+    encoded = [chars.encode("UTF-8") for chars in chars_list]
+    lengths = numpy.fromiter((len(key) for key in encoded), dtype=numpy.int64, count=len(encoded))
 
+    order = numpy.argsort(lengths, kind="stable")
+    sorted_lengths = lengths[order]
 
-def copy_string(chars, length):
-    # type: (str, int) -> ObjectString
-    """Copies existing string and calls allocate_string. Assumes ownership of
-    characters passed as argument cannot be taken away, so creates a copy. This
-    is desired as characters may be in the middle of the source string"""
-    heap_chars = memory.allocate(length + 1)
+    # Start offset of each string within one contiguous byte buffer
+    offsets = numpy.zeros(len(encoded), dtype=numpy.int64)
+    numpy.cumsum(lengths[:-1], out=offsets[1:])
+    sorted_offsets = offsets[order]
 
-    heap_chars[:length] = chars[:length]
-    heap_chars[length] = "\0"
+    buffer = numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8)
+    hashes = numpy.full(len(encoded), FNV_32_INIT, dtype=numpy.uint32)
+    prime = numpy.uint32(FNV_32_PRIME)
 
-    hash_value = hash_string(heap_chars, length)
+    # Strings are sorted by length, so those with a byte at position i form a
+    # suffix of the sorted order starting at first. Positions held by fewer
+    # than BULK_HASH_MIN_COUNT strings cost more in NumPy than in Python, so
+    # the loop stops at the length of the longest strings but that many
+    count = len(encoded)
+    cutoff = int(sorted_lengths[count - BULK_HASH_MIN_COUNT])
 
-    return allocate_string(heap_chars, length, hash_value)
+    for i in range(cutoff):
+        first = int(numpy.searchsorted(sorted_lengths, i, side="right"))
+        active = hashes[first:]
+        active ^= buffer[sorted_offsets[first:] + i]
+        active *= prime
 
+    result = numpy.empty_like(hashes)
+    result[order] = hashes
+    result = result.tolist()
 
-class ValueType(Enum):
-    VAL_BOOL = "VAL_BOOL"
-    VAL_NIL = "VAL_NIL"
-    VAL_NUMBER = "VAL_NUMBER"
-    VAL_OBJ = "VAL_OBJ"
+    # The rest of the longest strings, from the hash of their first bytes
+    mask = FNV_32_SIZE - 1
 
+    for index in order[count - BULK_HASH_MIN_COUNT:].tolist():
+        hash_int = result[index]
 
-ValueAs = Union[bool, float, Object]
+        for byte in encoded[index][cutoff:]:
+            hash_int = ((hash_int ^ byte) * FNV_32_PRIME) & mask
 
+        result[index] = hash_int
 
-class Value():
-    def __init__(self, value_type, value_as):
-        # type: (ValueType, ValueAs) -> None
-        """
-        """
-        self.value_type = value_type
-        self.value_as = value_as
+    return result
 
-    def is_bool(self):
-        #
-        """
-        """
-        return self.value_type == ValueType.VAL_BOOL
 
-    def is_nil(self):
-        #
-        """
-        """
-        return self.value_type == ValueType.VAL_NIL
+def take_string(chars, length, strings=None):
+    # type: (str, int, Optional[Table]) -> ObjectString
+    """Applies for concatenation. Takes ownership of characters passed as
+    argument, since no need for copy of characters on the heap. If strings is
+    given, returns the interned string with equal characters instead.
+    Otherwise the string is not interned and its hash is left until first use.
+    """
+    if strings is None:
+        return allocate_string(chars, length)
 
-    def is_number(self):
-        #
-        """
-        """
-        return self.value_type == ValueType.VAL_NUMBER
+    hash_value = hash_string(chars, length)
+    interned = strings.find_string(chars, length, hash_value)
 
-    def is_obj(self):
-        # type: () -> bool
-        """Check if Value is an Object."""
-        return self.value_type == ValueType.VAL_OBJ
+    if interned is not None:
+        return interned
 
-    def is_function(self):
-        #
-        """
-        """
-        return self.is_obj() and self.value_as.obj.is_function()
+    return allocate_string(chars, length, hash_value, strings)
 
-    def is_native(self):
-        #
-        """
-        """
-        return self.is_obj() and self.value_as.obj.is_native()
 
-    def is_string(self):
-        #
-        """
-        """
-        return self.is_obj() and self.value_as.obj.is_string()
+def copy_string(chars, length, strings=None):
+    # type: (str, int, Optional[Table]) -> ObjectString
+    """Slices the first length characters and calls take_string. This is
+    desired as characters may be in the middle of the source string."""
+    return take_string(chars[:length], length, strings)
 
-    def as_bool(self):
-        # type: () -> bool
-        """
-        """
-        assert self.is_bool()
-        return self.value_as
 
-    def as_number(self):
-        # type: () -> float
-        """
-        """
-        assert self.is_number()
-        return self.value_as
+def new_rope(left, right):
+    # type: (ObjectString, ObjectString) -> ObjectString
+    """Concatenates two strings without copying their characters, which are
+    joined when first needed for hashing, printing or comparison. Short
+    results are joined immediately, since a rope node costs more than copying
+    a few characters."""
+    length = left.length + right.length
 
-    def as_obj(self):
-        # type: () -> Object
-        """
-        """
-        assert self.is_obj()
-        return self.value_as
+    if length < ROPE_MIN_LENGTH:
+        return take_string(left.chars + right.chars, length)
 
-    def as_function(self):
-        #
-        """
-        """
-        assert self.is_function()
-        return self.value_as
+    rope = ObjectString(None, length)
+    rope._left = left
+    rope._right = right
 
-    def as_native(self):
-        #
-        """
-        """
-        assert self.is_native()
-        return self.value_as
+    return rope
 
-    def as_string(self):
-        # type: () -> ObjectString
-        """Unwraps Value to return ObjectString."""
-        assert self.is_string()
-        return self.value_as
 
-    def as_obj_type(self):
-        #
-        """
-        """
-        assert self.is_obj()
-        return self.value_as.obj.object_type
+# Values are unboxed: Lox numbers, booleans and nil are Python float, bool and
+# None, while heap values are instances of Object subclasses.
+Value = Union[bool, float, None, Object]
 
-    def as_function_name(self):
-        #
-        """
-        """
-        assert self.is_function()
 
-        if self.value_as.name is None:
-            return "<script>"
+def is_bool(val):
+    # type: (Any) -> bool
+    """
+    """
+    return type(val) is bool
 
-        return "<fn {}>".format(self.value_as.name.chars)
 
-    def as_cstring(self):
-        # type: () -> str
-        """Unwraps Value to return raw string of ObjectString."""
-        assert self.is_string()
-        return self.value_as.chars
+def is_nil(val):
+    # type: (Any) -> bool
+    """
+    """
+    return val is None
 
-    def print_object(self):
-        #
-        """
-        """
-        if self.is_function():
-            print(self.as_function())
 
-        elif self.is_native():
-            print("<native fn>")
+def is_number(val):
+    # type: (Any) -> bool
+    """
+    """
+    return type(val) is float
 
-        elif self.is_string():
-            print(self.as_cstring())
 
-    def print_value(self):
-        # type: () -> None
-        """
-        """
-        if self.value_type == ValueType.VAL_BOOL:
-            val = self.as_bool()
-            print("true" if val else "false")
-        elif self.value_type == ValueType.VAL_NIL:
-            print("nil")
-        elif self.value_type == ValueType.VAL_NUMBER:
-            print("{}".format(self.as_number()))
-        elif self.value_type == ValueType.VAL_OBJ:
-            self.print_object()
-
-    def values_equal(self, other):
-        #
-        """
-        """
-        if self.value_type != other.value_type:
-            return False
+def is_obj(val):
+    # type: (Any) -> bool
+    """Check if value is an Object."""
+    return isinstance(val, Object)
 
-        if self.value_type == ValueType.VAL_BOOL:
-            return self.as_bool() == other.as_bool()
-        elif self.value_type == ValueType.VAL_NIL:
-            return True
-        elif self.value_type == ValueType.VAL_NUMBER:
-            return self.as_number() == other.as_number()
-        elif self.value_type == ValueType.VAL_OBJ:
-            self_string = self.as_string()
-            other_string = other.as_string()
-            return (self_string.length == other_string.length
-                    and self_string.chars == other_string.chars)
 
-        return False
+def is_function(val):
+    # type: (Any) -> bool
+    """
+    """
+    return type(val) is ObjectFunction
 
 
-def bool_val(val):
-    #
+def is_native(val):
+    # type: (Any) -> bool
     """
     """
-    return Value(ValueType.VAL_BOOL, val)
+    return type(val) is ObjectNative
 
 
-def nil_val():
-    #
+def is_string(val):
+    # type: (Any) -> bool
     """
     """
-    return Value(ValueType.VAL_NIL, 0)
+    return type(val) is ObjectString
 
 
-def number_val(val):
-    #
+def is_falsey(val):
+    # type: (Any) -> bool
+    """Only nil and false are falsey in Lox."""
+    return val is None or val is False
+
+
+def as_cstring(val):
+    # type: (ObjectString) -> str
+    """Unwraps ObjectString to return its characters as a Python string."""
+    return val.chars
+
+
+def function_name(function):
+    # type: (ObjectFunction) -> str
+    """
     """
+    if function.name is None:
+        return "<script>"
+
+    return "<fn {}>".format(as_cstring(function.name))
+
+
+def format_value(val):
+    # type: (Any) -> str
+    """Converts value to the text shown by print statements."""
+    if val is None:
+        return "nil"
+    elif val is True:
+        return "true"
+    elif val is False:
+        return "false"
+    elif type(val) is float:
+        return "{}".format(val)
+    elif type(val) is ObjectString:
+        return as_cstring(val)
+    elif type(val) is ObjectFunction:
+        return function_name(val)
+    elif type(val) is ObjectNative:
+        return "<native fn>"
+
+    return "{}".format(val)
+
+
+def print_value(val):
+    # type: (Any) -> None
     """
-    return Value(ValueType.VAL_NUMBER, val)
+    """
+    print(format_value(val))
+
+
+def values_equal(a, b):
+    # type: (Any, Any) -> bool
+    """Compares values with Lox semantics, so that for example true and 1 are
+    not equal even though they are in Python. Strings are not all interned,
+    as concatenations are left uninterned, so strings that are not the same
+    object are compared by characters, after their lengths and any hashes
+    already computed."""
+    if type(a) is ObjectString and type(b) is ObjectString:
+        if a is b:
+            return True
+
+        if a.length != b.length:
+            return False
+
+        if a._hash_value is not None and b._hash_value is not None and a._hash_value != b._hash_value:
+            return False
 
+        return a.chars == b.chars
 
-def obj_val(val):
-    # type: (Any) -> Value
-    """Wraps Object in a Value."""
-    return Value(ValueType.VAL_OBJ, val)
+    return type(a) is type(b) and a == b
 
 
 class ValueArray():
@@ -2,13 +2,16 @@ from enum import Enum
 
 import chunk
 import compiler
-import memory
+import register
 import table
 import value
 
 FRAMES_MAX = 64
 STACK_MAX = FRAMES_MAX * compiler.UINT8_COUNT
 
+# Returned by table lookups for missing globals, since nil is stored as None
+UNDEFINED = object()
+
 
 class CallFrame():
     def __init__(self):
@@ -28,9 +31,12 @@ class InterpretResult(Enum):
 
 
 class VM():
-    def __init__(self):
-        #
-        """
+    def __init__(self, superinstructions=None):
+        # type: (Optional[superinstructions.SuperinstructionSet]) -> None
+        """With superinstructions, scripts are compiled with the given
+        superinstructions and the handler of each is added to the dispatch
+        table. Setting profile to a superinstructions.Profile records the
+        instruction sequences run.
         """
         self.frames = [CallFrame() for _ in range(FRAMES_MAX)]  # type: List[CallFrame]
         self.stack = [None] * STACK_MAX
@@ -38,6 +44,23 @@ class VM():
         self.frame_count = 0
         self.globals = table.Table()
 
+        # Intern table, so that equal strings share one ObjectString
+        self.strings = table.Table()
+
+        # Handler for each opcode, indexed by the integer value of the opcode
+        self.dispatch = [getattr(self, opcode.name.lower()) for opcode in chunk.OpCode]
+        self.superinstructions = superinstructions
+
+        if superinstructions is not None:
+            handlers = superinstructions.make_handlers(self)
+            self.dispatch += [None] * (superinstructions.first_opcode - len(self.dispatch))
+            self.dispatch += handlers
+
+        self.profile = None  # type: Optional[superinstructions.Profile]
+
+        # Engine for scripts interpreted with engine "register"
+        self.registers = register.RegisterVM(self)
+
         # Custom attribute for testing
         self.result = None
         self.expose = True
@@ -54,21 +77,21 @@ class VM():
         """
         if self.expose:
             call_frame = self.frames[self.frame_count - 1]
-            line = call_frame.function.bytecode.lines[call_frame.ip]
+            line = call_frame.function.bytecode.get_line(call_frame.ip - 1)
 
             print(messages if isinstance(messages, str) else " ".join(messages))
-            print("[line {} in script]".format(line))
+            print("[line {} in script]".format("?" if line is None else line))
 
         self.reset_stack()
 
-    def define_native(name, function):
+    def define_native(self, name, function):
         #
         """
         """
-        self.push(value.obj_val(value.copy_string(name, len(name))))
-        self.push(value.obj_val(value.new_native(function)))
+        self.push(value.copy_string(name, len(name), self.strings))
+        self.push(value.new_native(function))
 
-        self.globals.table_set(self.stack[0].as_string(), self.stack[1])
+        self.globals.table_set(self.stack[0], self.stack[1])
         self.pop()
         self.pop()
 
@@ -77,6 +100,7 @@ class VM():
         """
         """
         self.globals.free_table()
+        self.strings.free_table()
 
     def push(self, value):
         #
@@ -100,8 +124,18 @@ class VM():
 
     def call(self, function, arg_count):
         #
+        """Pushes a frame for function, or reports a runtime error if
+        arg_count does not match its arity or all FRAMES_MAX frames are in
+        use, with the same messages as register.RegisterVM.
         """
-        """
+        if arg_count != function.arity:
+            self.runtime_error("Expected {} arguments but got {}.".format(function.arity, arg_count))
+            return False
+
+        if self.frame_count == FRAMES_MAX:
+            self.runtime_error("Stack overflow.")
+            return False
+
         frame = self.frames[self.frame_count]
         self.frame_count += 1
 
@@ -117,212 +151,484 @@ class VM():
         #
         """
         """
-        if callee.is_obj():
-            if callee.as_obj_type() == value.ObjectType.OBJ_FUNCTION:
-                return self.call(callee.as_function(), arg_count)
-
-            elif callee.as_obj_type() == value.ObjectType.OBJ_NATIVE:
-                native = callee.as_native()
+        if type(callee) is value.ObjectFunction:
+            return self.call(callee, arg_count)
 
-                result = native(arg_count, self.stack_top - arg_count)
-                self.stack_top -= arg_count + 1
-                self.push(result)
+        elif type(callee) is value.ObjectNative:
+            args = self.stack[self.stack_top - arg_count:self.stack_top]
+            result = callee.function(arg_count, args)
+            self.stack_top -= arg_count + 1
+            self.push(result)
 
-                return True
+            return True
 
         self.runtime_error("Can only call functions and classes.")
         return False
 
-    def is_falsey(self, val):
+    def concatenate(self):
         #
         """
         """
-        return val.is_nil() or (val.is_bool() and not val.as_bool())
+        b = self.pop()
+        a = self.pop()
+
+        # Result is a rope that is neither joined nor hashed until needed, so
+        # building a string piece by piece in a loop stays linear
+        self.push(value.new_rope(a, b))
+
+    def read_byte(self, frame):
+        # type: (CallFrame) -> int
+        """Reads the operand byte at the current instruction pointer."""
+        frame.ip += 1
+        return frame.function.bytecode.code[frame.ip - 1]
+
+    def read_short(self, frame):
+        # type: (CallFrame) -> int
+        """Reads the two-byte big-endian operand at the instruction pointer."""
+        code = frame.function.bytecode.code
+        frame.ip += 2
+        return code[frame.ip - 2] << 8 | code[frame.ip - 1]
+
+    def read_constant(self, frame):
+        # type: (CallFrame) -> value.Value
+        """Reads the constant referenced by the operand byte."""
+        return frame.function.bytecode.constants.values[self.read_byte(frame)]
+
+    def read_string(self, frame):
+        # type: (CallFrame) -> value.ObjectString
+        """Reads the string constant referenced by the operand byte."""
+        return self.read_constant(frame)
+
+    def read_constant_long(self, frame):
+        # type: (CallFrame) -> value.Value
+        """Reads the constant referenced by the three-byte operand of a wide
+        instruction."""
+        code = frame.function.bytecode.code
+        frame.ip += 3
+        index = code[frame.ip - 3] << 16 | code[frame.ip - 2] << 8 | code[frame.ip - 1]
+        return frame.function.bytecode.constants.values[index]
+
+    def read_long_jump(self, frame):
+        # type: (CallFrame) -> int
+        """Reads the offset of a wide jump, held in the chunk at the index given
+        by the two-byte operand."""
+        return frame.function.bytecode.long_jumps[self.read_short(frame)]
+
+    def check_number_operands(self):
+        # type: () -> bool
+        """Checks both operands of a binary operator are numbers, reporting a
+        runtime error otherwise."""
+        if type(self.peek(0)) is not float or type(self.peek(1)) is not float:
+            self.runtime_error("Operands must be numbers.")
+            return False
 
-    def concatenate(self):
+        return True
+
+    def op_constant(self, frame):
         #
         """
         """
-        b = self.pop().as_string()
-        a = self.pop().as_string()
+        self.push(self.read_constant(frame))
 
-        length = a.length + b.length
-        chars = memory.allocate(length + 1)
+    def op_nil(self, frame):
+        #
+        """
+        """
+        self.push(None)
 
-        chars[:a.length] = a.chars[:a.length]
-        chars[a.length:(a.length + b.length)] = b.chars[:b.length]
-        chars[length] = "\0"
+    def op_true(self, frame):
+        #
+        """
+        """
+        self.push(True)
 
-        result = value.take_string(chars, length)
-        self.push(value.obj_val(result))
+    def op_false(self, frame):
+        #
+        """
+        """
+        self.push(False)
 
-    def run(self):
+    def op_pop(self, frame):
         #
         """
         """
-        frame = self.frames[self.frame_count - 1]
-        bytecode = frame.function.bytecode
+        self.pop()
 
-        def read_byte():
-            frame.ip += 1
-            return bytecode.code[frame.ip - 1]
+    def op_popn(self, frame):
+        # type: (CallFrame) -> None
+        """Pops the number of values given by the operand byte, see
+        optimize.optimize_chunk."""
+        self.stack_top -= self.read_byte(frame)
 
-        def read_short():
-            frame.ip += 2
-            return bytecode.code[frame.ip - 2] << 8 or bytecode.code[frame.ip - 1]
+    def op_get_local(self, frame):
+        #
+        """
+        """
+        slot = self.read_byte(frame)
+        self.push(frame.slots[frame.slots_top + slot])
 
-        def read_constant():
-            return bytecode.constants.values[read_byte()]
+    def op_set_local(self, frame):
+        #
+        """
+        """
+        slot = self.read_byte(frame)
+        frame.slots[frame.slots_top + slot] = self.peek(0)
 
-        def read_string():
-            return read_constant().as_string()
+    def op_get_global(self, frame):
+        #
+        """
+        """
+        return self.get_global(self.read_string(frame))
 
-        def binary_op(value_type, op):
-            if not self.peek(0).is_number() or not self.peek(1).is_number():
-                self.runtime_error("Operands must be numbers.")
-                return InterpretResult.INTERPRET_RUNTIME_ERROR
+    def get_global(self, name):
+        # type: (value.ObjectString) -> Optional[InterpretResult]
+        """Pushes the value of global name, shared by the narrow and wide
+        instructions."""
+        val = self.globals.table_get(name, UNDEFINED)
 
-            b = self.pop().as_number()
-            a = self.pop().as_number()
+        if val is UNDEFINED:
+            self.runtime_error("Undefined variable '{}'.".format(value.as_cstring(name)))
+            return InterpretResult.INTERPRET_RUNTIME_ERROR
 
-            self.push(value_type(eval("a {} b".format(op))))
+        self.push(val)
 
-        while True:
-            instruction = read_byte()
+    def op_define_global(self, frame):
+        #
+        """
+        """
+        self.globals.table_set(self.read_string(frame), self.peek(0))
+        self.pop()
 
-            if instruction == chunk.OpCode.OP_CONSTANT:
-                constant = read_constant()
-                self.push(constant)
+    def op_set_global(self, frame):
+        #
+        """
+        """
+        return self.set_global(self.read_string(frame))
 
-            elif instruction == chunk.OpCode.OP_NIL:
-                self.push(value.nil_val())
+    def set_global(self, name):
+        # type: (value.ObjectString) -> Optional[InterpretResult]
+        """Assigns to global name, which must already be defined."""
+        if self.globals.table_set(name, self.peek(0)):
+            self.globals.table_delete(name)
+            self.runtime_error("Undefined variable '{}'.".format(value.as_cstring(name)))
+            return InterpretResult.INTERPRET_RUNTIME_ERROR
 
-            elif instruction == chunk.OpCode.OP_TRUE:
-                self.push(value.bool_val(True))
+    def op_equal(self, frame):
+        #
+        """
+        """
+        b = self.pop()
+        a = self.pop()
+        self.push(value.values_equal(a, b))
 
-            elif instruction == chunk.OpCode.OP_FALSE:
-                self.push(value.bool_val(False))
+    def op_greater(self, frame):
+        #
+        """
+        """
+        if not self.check_number_operands():
+            return InterpretResult.INTERPRET_RUNTIME_ERROR
 
-            elif instruction == chunk.OpCode.OP_POP:
-                self.pop()
+        b = self.pop()
+        a = self.pop()
+        self.push(a > b)
 
-            elif instruction == chunk.OpCode.OP_GET_LOCAL:
-                slot = read_byte()
-                self.push(frame.slots[slot])
+    def op_less(self, frame):
+        #
+        """
+        """
+        if not self.check_number_operands():
+            return InterpretResult.INTERPRET_RUNTIME_ERROR
 
-            elif instruction == chunk.OpCode.OP_SET_LOCAL:
-                slot = read_byte()
-                frame.slots[slot] = self.peek(0)
+        b = self.pop()
+        a = self.pop()
+        self.push(a < b)
 
-            elif instruction == chunk.OpCode.OP_GET_GLOBAL:
-                name = read_string()
-                val = self.globals.table_get(name)
+    def op_add(self, frame):
+        #
+        """
+        """
+        b = self.peek(0)
+        a = self.peek(1)
+
+        if type(a) is float and type(b) is float:
+            self.stack_top -= 2
+            self.push(a + b)
+        elif type(a) is value.ObjectString and type(b) is value.ObjectString:
+            self.concatenate()
+        else:
+            self.runtime_error("Operands must be two numbers or two strings.")
+            return InterpretResult.INTERPRET_RUNTIME_ERROR
+
+    def op_subtract(self, frame):
+        #
+        """
+        """
+        if not self.check_number_operands():
+            return InterpretResult.INTERPRET_RUNTIME_ERROR
 
-                if not val:
-                    self.runtime_error("Undefined variable '{}'.".format(name.chars))
-                    return InterpretResult.INTERPRET_RUNTIME_ERROR
+        b = self.pop()
+        a = self.pop()
+        self.push(a - b)
 
-                self.push(val)
+    def op_multiply(self, frame):
+        #
+        """
+        """
+        if not self.check_number_operands():
+            return InterpretResult.INTERPRET_RUNTIME_ERROR
 
-            elif instruction == chunk.OpCode.OP_DEFINE_GLOBAL:
-                name = read_string()
+        b = self.pop()
+        a = self.pop()
+        self.push(a * b)
 
-                self.globals.table_set(name, self.peek(0))
-                self.pop()
+    def op_divide(self, frame):
+        #
+        """
+        """
+        if not self.check_number_operands():
+            return InterpretResult.INTERPRET_RUNTIME_ERROR
 
-            elif instruction == chunk.OpCode.OP_SET_GLOBAL:
-                name = read_string()
+        b = self.pop()
+        a = self.pop()
+        self.push(a / b)
 
-                if self.globals.table_set(name, self.peek(0)):
-                    self.globals.table_delete(name)
-                    self.runtime_error("Undefined variable '{}'.", name.chars)
-                    return InterpretResult.INTERPRET_RUNTIME_ERROR
+    def op_not(self, frame):
+        #
+        """
+        """
+        val = self.pop()
+        self.push(val is None or val is False)
 
-            elif instruction == chunk.OpCode.OP_EQUAL:
-                b = self.pop()
-                a = self.pop()
-                self.push(value.bool_val(a.values_equal(b)))
+    def op_negate(self, frame):
+        #
+        """
+        """
+        if type(self.peek(0)) is not float:
+            self.runtime_error("Operand must be a number")
+            return InterpretResult.INTERPRET_RUNTIME_ERROR
 
-            elif instruction == chunk.OpCode.OP_GREATER:
-                binary_op(value.bool_val, ">")
+        self.push(-self.pop())
 
-            elif instruction == chunk.OpCode.OP_LESS:
-                binary_op(value.bool_val, "<")
+    def op_print(self, frame):
+        #
+        """
+        """
+        self.result = self.pop()
 
-            elif instruction == chunk.OpCode.OP_ADD:
-                if self.peek(0).is_string() and self.peek(1).is_string():
-                    self.concatenate()
-                elif self.peek(0).is_number() and self.peek(1).is_number():
-                    b = self.pop().as_number()
-                    a = self.pop().as_number()
-                    self.push(value.number_val(a + b))
-                else:
-                    self.runtime_error("Operands must be two numbers or two strings.")
-                    return InterpretResult.INTERPRET_RUNTIME_ERROR
+        if self.expose:
+            value.print_value(self.result)
 
-            elif instruction == chunk.OpCode.OP_SUBTRACT:
-                binary_op(value.number_val, "-")
+    def op_jump(self, frame):
+        #
+        """
+        """
+        offset = self.read_short(frame)
+        frame.ip += offset
 
-            elif instruction == chunk.OpCode.OP_MULTIPLY:
-                binary_op(value.number_val, "*")
+    def op_jump_if_false(self, frame):
+        #
+        """
+        """
+        offset = self.read_short(frame)
 
-            elif instruction == chunk.OpCode.OP_DIVIDE:
-                binary_op(value.number_val, "/")
+        val = self.peek(0)
 
-            elif instruction == chunk.OpCode.OP_NOT:
-                self.push(value.bool_val(self.is_falsey(self.pop())))
+        if val is None or val is False:
+            frame.ip += offset
 
-            elif instruction == chunk.OpCode.OP_NEGATE:
-                if not self.peek(0).is_number():
-                    self.runtime_error("Operand must be a number")
-                    return InterpretResult.INTERPRET_RUNTIME_ERROR
+    def op_loop(self, frame):
+        #
+        """
+        """
+        offset = self.read_short(frame)
+        frame.ip -= offset
 
-                self.push(value.number_val(-self.pop().as_number()))
+    def op_constant_long(self, frame):
+        #
+        """
+        """
+        self.push(self.read_constant_long(frame))
 
-            elif instruction == chunk.OpCode.OP_PRINT:
-                self.result = self.pop()
+    def op_get_global_long(self, frame):
+        #
+        """
+        """
+        return self.get_global(self.read_constant_long(frame))
 
-                if self.expose:
-                    self.result.print_value()
+    def op_define_global_long(self, frame):
+        #
+        """
+        """
+        self.globals.table_set(self.read_constant_long(frame), self.peek(0))
+        self.pop()
 
-            elif instruction == chunk.OpCode.OP_JUMP:
-                offset = read_short()
-                frame.ip += offset
+    def op_set_global_long(self, frame):
+        #
+        """
+        """
+        return self.set_global(self.read_constant_long(frame))
 
-            elif instruction == chunk.OpCode.OP_JUMP_IF_FALSE:
-                offset = read_short()
+    def op_jump_long(self, frame):
+        #
+        """
+        """
+        offset = self.read_long_jump(frame)
+        frame.ip += offset
 
-                if self.is_falsey(self.peek(0)):
-                    frame.ip += offset
+    def op_jump_if_false_long(self, frame):
+        #
+        """
+        """
+        offset = self.read_long_jump(frame)
 
-            elif instruction == chunk.OpCode.OP_LOOP:
-                offset = read_short()
-                frame.ip -= offset
+        val = self.peek(0)
 
-            elif instruction == chunk.OpCode.OP_CALL:
-                arg_count = read_byte()
+        if val is None or val is False:
+            frame.ip += offset
 
-                if not self.call_value(self.peek(arg_count), arg_count):
-                    return InterpretResult.INTERPRET_RUNTIME_ERROR
+    def op_loop_long(self, frame):
+        #
+        """
+        """
+        offset = self.read_long_jump(frame)
+        frame.ip -= offset
+
+    def op_less_equal(self, frame):
+        # type: (CallFrame) -> Optional[InterpretResult]
+        """Same as OP_GREATER followed by OP_NOT, which it replaces, so the
+        result for NaN operands is unchanged."""
+        if not self.check_number_operands():
+            return InterpretResult.INTERPRET_RUNTIME_ERROR
+
+        b = self.pop()
+        a = self.pop()
+        self.push(not a > b)
+
+    def op_greater_equal(self, frame):
+        # type: (CallFrame) -> Optional[InterpretResult]
+        """Same as OP_LESS followed by OP_NOT."""
+        if not self.check_number_operands():
+            return InterpretResult.INTERPRET_RUNTIME_ERROR
+
+        b = self.pop()
+        a = self.pop()
+        self.push(not a < b)
+
+    def op_not_equal(self, frame):
+        # type: (CallFrame) -> None
+        """Same as OP_EQUAL followed by OP_NOT."""
+        b = self.pop()
+        a = self.pop()
+        self.push(not value.values_equal(a, b))
+
+    def op_call(self, frame):
+        #
+        """
+        """
+        arg_count = self.read_byte(frame)
 
-                frame = self.frames[self.frame_count - 1]
+        if not self.call_value(self.peek(arg_count), arg_count):
+            return InterpretResult.INTERPRET_RUNTIME_ERROR
 
-            elif instruction == chunk.OpCode.OP_RETURN:
-                return InterpretResult.INTERPRET_OK
+    def op_return(self, frame):
+        # type: (CallFrame) -> Optional[InterpretResult]
+        """Returns from the current frame, discarding its slots and pushing the
+        result for the caller. Returning from the top-level script ends the run.
+        """
+        result = self.pop()
+        self.frame_count -= 1
+
+        if self.frame_count == 0:
+            self.pop()
+            return InterpretResult.INTERPRET_OK
 
-    def interpret(self, source, debug_level=0, expose=True):
-        # type: (str, int, bool) -> InterpretResult
+        self.stack_top = frame.slots_top
+        self.push(result)
+
+    def run(self):
+        # type: () -> InterpretResult
+        """Executes instructions until a handler returns an InterpretResult.
+        Each opcode indexes directly into the handler table, so dispatch costs
+        the same for every instruction.
         """
+        if self.profile is not None:
+            return self.run_profiled()
+
+        dispatch = self.dispatch
+        frames = self.frames
+
+        while True:
+            frame = frames[self.frame_count - 1]
+            code = frame.function.bytecode.code
+
+            instruction = code[frame.ip]
+            frame.ip += 1
+
+            result = dispatch[instruction](frame)
+
+            if result is not None:
+                return result
+
+    def run_profiled(self):
+        # type: () -> InterpretResult
+        """Same as run, recording each instruction in the profile."""
+        dispatch = self.dispatch
+        frames = self.frames
+        record = self.profile.record
+
+        while True:
+            frame = frames[self.frame_count - 1]
+            code = frame.function.bytecode.code
+
+            instruction = code[frame.ip]
+            record(frame, frame.ip, instruction)
+            frame.ip += 1
+
+            result = dispatch[instruction](frame)
+
+            if result is not None:
+                return result
+
+    def interpret(self, source, debug_level=0, expose=True, strip_lines=False, whole_script=False,
+                  engine="stack"):
+        # type: (Union[str, scanner.Scanner], int, bool, bool, bool, str) -> InterpretResult
+        """Compiles and runs source, which may also be a Scanner, see
+        compiler.compile. With whole_script, source is the whole program
+        rather than a line of the REPL, so unused global functions are
+        dropped. With engine "register", the script is translated to register
+        code and run by register.RegisterVM instead, without superinstructions.
         """
+        if engine not in ("stack", "register"):
+            raise ValueError("Unknown engine '{}'.".format(engine))
+
         bytecode = chunk.Chunk()
         self.expose = expose
-
-        function = compiler.compile(source, bytecode, debug_level)
+        fused = self.superinstructions if engine == "stack" else None
+
+        function = compiler.compile(
+            source,
+            bytecode,
+            debug_level,
+            self.strings,
+            strip_lines,
+            superinstructions=fused,
+            whole_script=whole_script,
+        )
 
         if function is None:
             return InterpretResult.INTERPRET_COMPILE_ERROR
 
-        self.push(value.obj_val(function))
+        if engine == "register":
+            return self.registers.interpret_function(function, debug_level)
+
+        return self.interpret_function(function)
+
+    def interpret_function(self, function):
+        # type: (value.ObjectFunction) -> InterpretResult
+        """Runs a script function that is already compiled, such as one linked
+        by incremental.IncrementalCompiler.
+        """
+        self.push(function)
 
         # frame = self.frames[self.frame_count]
         # self.frame_count += 1
@@ -330,6 +636,6 @@ class VM():
         # frame.function = function
         # frame.ip = 0
         # frame.slots = self.stack
-        self.call_value(value.obj_val(function), 0)
+        self.call_value(function, 0)
 
         return self.run()
@@ -1,6 +1,6 @@
 import pytest
 
-from src import chunk
+import chunk
 
 
 @pytest.fixture
@@ -16,9 +16,9 @@ def test_init(bytecode):
     """
     """
     assert bytecode.count == 0
-    assert bytecode.capacity == 0
-    assert bytecode.code is None
-    assert bytecode.lines is None
+    assert bytecode.code == bytearray()
+    assert len(bytecode.line_starts) == 0
+    assert not bytecode.frozen
     assert bytecode.constants.count == 0
     assert bytecode.constants.capacity == 0
     assert bytecode.constants.values is None
@@ -30,9 +30,9 @@ def test_write_chunk_op_return(bytecode):
     """
     bytecode.write_chunk(chunk.OpCode.OP_RETURN, 123)
     assert bytecode.count == 1
-    assert bytecode.capacity == 8
+    assert isinstance(bytecode.code, bytearray)
     assert bytecode.code[0] == chunk.OpCode.OP_RETURN
-    assert bytecode.lines[0] == 123
+    assert bytecode.get_line(0) == 123
 
 
 def test_free_chunk_op_return(bytecode):
@@ -42,9 +42,8 @@ def test_free_chunk_op_return(bytecode):
     bytecode.write_chunk(chunk.OpCode.OP_RETURN, 123)
     bytecode.free_chunk()
     assert bytecode.count == 0
-    assert bytecode.capacity == 0
-    assert bytecode.code is None
-    assert bytecode.lines is None
+    assert bytecode.code == bytearray()
+    assert len(bytecode.line_starts) == 0
 
 
 def test_write_chunk_op_constant(bytecode):
@@ -57,8 +56,101 @@ def test_write_chunk_op_constant(bytecode):
     bytecode.write_chunk(chunk.OpCode.OP_CONSTANT, 123)
     bytecode.write_chunk(constant, 456)
     assert bytecode.count == 2
-    assert bytecode.capacity == 8
     assert bytecode.code[0] == chunk.OpCode.OP_CONSTANT
     assert bytecode.code[1] == 0
-    assert bytecode.lines[0] == 123
-    assert bytecode.lines[1] == 456
+    assert bytecode.get_line(0) == 123
+    assert bytecode.get_line(1) == 456
+
+
+def test_freeze(bytecode):
+    #
+    """
+    """
+    constant = bytecode.add_constant(1.2)
+    bytecode.write_chunk(chunk.OpCode.OP_CONSTANT, 1)
+    bytecode.write_chunk(constant, 1)
+    bytecode.write_chunk(chunk.OpCode.OP_RETURN, 2)
+    bytecode.freeze()
+
+    assert bytecode.frozen
+    assert bytecode.code == bytes([chunk.OpCode.OP_CONSTANT, 0, chunk.OpCode.OP_RETURN])
+    assert memoryview(bytecode.code).readonly
+    assert bytecode.constants.values == (1.2,)
+
+    with pytest.raises(AssertionError):
+        bytecode.write_chunk(chunk.OpCode.OP_RETURN, 3)
+
+
+def test_line_runs(bytecode):
+    #
+    """
+    """
+    for line in [1, 1, 1, 2, 2, 5, 5, 5, 5, 6]:
+        bytecode.write_chunk(chunk.OpCode.OP_POP, line)
+
+    assert list(bytecode.line_starts) == [0, 3, 5, 9]
+    assert list(bytecode.line_numbers) == [1, 2, 5, 6]
+    assert [bytecode.get_line(offset) for offset in range(10)] == [1, 1, 1, 2, 2, 5, 5, 5, 5, 6]
+
+    bytecode.freeze(strip_lines=True)
+
+    assert bytecode.line_starts is None
+    assert bytecode.get_line(0) is None
+
+
+def test_get_line_empty(bytecode):
+    #
+    """
+    """
+    assert bytecode.get_line(0) is None
+
+
+def test_add_constant_dedup(bytecode):
+    #
+    """
+    """
+    assert bytecode.add_constant(1.0) == 0
+    assert bytecode.add_constant(2.0) == 1
+    assert bytecode.add_constant(1.0) == 0
+    assert bytecode.add_constant(True) == 2
+    assert bytecode.add_constant(0.0) == 3
+    assert bytecode.add_constant(-0.0) == 4
+    assert bytecode.constants.count == 5
+
+
+def test_checkpoint_restore(bytecode):
+    #
+    """
+    """
+    bytecode.write_chunk(chunk.OpCode.OP_CONSTANT, 1)
+    bytecode.write_chunk(bytecode.add_constant(1.0), 1)
+    checkpoint = bytecode.checkpoint()
+
+    bytecode.write_chunk(chunk.OpCode.OP_CONSTANT, 2)
+    bytecode.write_chunk(bytecode.add_constant(2.0), 2)
+    bytecode.write_chunk(chunk.OpCode.OP_CONSTANT, 2)
+    bytecode.write_chunk(bytecode.add_constant(1.0), 2)
+    bytecode.restore(checkpoint)
+
+    assert bytecode.count == 2
+    assert bytecode.code == bytearray([chunk.OpCode.OP_CONSTANT, 0])
+    assert list(bytecode.line_numbers) == [1]
+    assert bytecode.constants.count == 1
+    assert bytecode.add_constant(2.0) == 1
+
+
+def test_restore_long_jumps(bytecode):
+    #
+    """
+    """
+    bytecode.add_long_jump(70000)
+    checkpoint = bytecode.checkpoint()
+
+    bytecode.write_chunk(chunk.OpCode.OP_JUMP_LONG, 1)
+    index = bytecode.add_long_jump(80000)
+    bytecode.write_chunk(index >> 8, 1)
+    bytecode.write_chunk(index & 0xff, 1)
+    bytecode.restore(checkpoint)
+
+    assert list(bytecode.long_jumps) == [70000]
+    assert bytecode.add_long_jump(90000) == 1
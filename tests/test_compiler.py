@@ -0,0 +1,108 @@
+import chunk
+import compiler
+import scanner
+import value
+
+
+def test_rule_table():
+    #
+    """
+    """
+    assert set(compiler.rule_table) == set(scanner.TokenType)
+
+    rule = compiler.rule_table[scanner.TokenType.TOKEN_MINUS]
+    assert rule.prefix is compiler.Parser.unary
+    assert rule.infix is compiler.Parser.binary
+    assert type(rule.precedence) is int
+    assert rule.precedence == compiler.Precedence.PREC_TERM
+
+
+def test_deep_nesting():
+    #
+    """
+    """
+    depth = 5000
+
+    for source in [
+        "print " + "(" * depth + "1" + ")" * depth + ";",
+        "print " + "-" * depth + "1;",
+        "let a; " + "a = " * depth + "1;",
+        "print " + "1 + (" * depth + "1" + ")" * depth + ";",
+        "{" * depth + "print 1;" + "}" * depth,
+    ]:
+        assert compiler.compile(source, chunk.Chunk(), 0) is not None
+
+
+def test_dead_code_branches():
+    #
+    """
+    """
+    for source in [
+        "if (false) print 1;",
+        "if (1 > 2) { let a = 1; print a; }",
+        "while (false) print 1;",
+        "for (let i = 0; false; i = i + 1) print i;",
+        "if (true) print 1; else print 2;",
+    ]:
+        pruned = compiler.compile(source, chunk.Chunk(), 0)
+        full = compiler.compile(source, chunk.Chunk(), 0, dead_code=False)
+
+        assert pruned.bytecode.count < full.bytecode.count
+        assert chunk.OpCode.OP_JUMP_IF_FALSE not in pruned.bytecode.code
+
+    bytecode = compiler.compile("if (false) print 1; else print 2;", chunk.Chunk(), 0).bytecode
+
+    assert bytecode.code == bytes([
+        chunk.OpCode.OP_CONSTANT, 0,
+        chunk.OpCode.OP_PRINT,
+        chunk.OpCode.OP_NIL,
+        chunk.OpCode.OP_RETURN,
+    ])
+    assert bytecode.constants.values[0] == 2.0
+
+    # The loop stays, without its test
+    bytecode = compiler.compile("while (true) print 1;", chunk.Chunk(), 0).bytecode
+
+    assert chunk.OpCode.OP_LOOP in bytecode.code
+    assert chunk.OpCode.OP_JUMP_IF_FALSE not in bytecode.code
+
+
+def test_dead_code_after_return():
+    #
+    """
+    """
+    source = "fun f() { return 1; print 2; fun g() {} }"
+    script = compiler.compile(source, chunk.Chunk(), 0)
+    function = script.bytecode.constants.values[1]
+
+    assert value.is_function(function)
+    assert chunk.OpCode.OP_PRINT not in function.bytecode.code
+    assert function.bytecode.constants.count == 1
+
+
+def test_unused_functions():
+    #
+    """
+    """
+    def functions(script):
+        constants = script.bytecode.constants
+        return [constants.values[i].name.chars for i in range(constants.count)
+                if value.is_function(constants.values[i])]
+
+    source = """
+    fun used() { return helper(); }
+    fun helper() { return 1; }
+    fun unused() { return helper(); }
+    fun recursive(n) { return recursive(n); }
+    fun flag() {}
+    if (false) flag();
+    { fun local() {} fun called() {} called(); }
+    print used();
+    """
+
+    script = compiler.compile(source, chunk.Chunk(), 0, whole_script=True)
+    assert functions(script) == ["used", "helper", "called"]
+
+    # A later line of the REPL may still call global functions
+    script = compiler.compile(source, chunk.Chunk(), 0)
+    assert functions(script) == ["used", "helper", "unused", "recursive", "flag", "called"]
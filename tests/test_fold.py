@@ -0,0 +1,70 @@
+import math
+
+import chunk
+import compiler
+import fold
+import scanner
+import table
+import value
+
+
+def test_fold_binary():
+    #
+    """
+    """
+    strings = table.Table()
+    a = value.copy_string("a", 1, strings)
+    b = value.copy_string("b", 1, strings)
+    nan = float("nan")
+
+    assert fold.fold_binary(scanner.TokenType.TOKEN_PLUS, 1.0, 2.0, strings) == 3.0
+    assert fold.fold_binary(scanner.TokenType.TOKEN_SLASH, 1.0, 4.0, strings) == 0.25
+    assert fold.fold_binary(scanner.TokenType.TOKEN_PLUS, a, b, strings).chars == "ab"
+    assert fold.fold_binary(scanner.TokenType.TOKEN_EQUAL_EQUAL, None, None, strings) is True
+    assert fold.fold_binary(scanner.TokenType.TOKEN_BANG_EQUAL, 1.0, True, strings) is True
+    assert fold.fold_binary(scanner.TokenType.TOKEN_GREATER_EQUAL, nan, 1.0, strings) is True
+    assert fold.fold_binary(scanner.TokenType.TOKEN_LESS, 1.0, nan, strings) is False
+
+    # Runtime errors are left to the VM
+    assert fold.fold_binary(scanner.TokenType.TOKEN_SLASH, 1.0, 0.0, strings) is None
+    assert fold.fold_binary(scanner.TokenType.TOKEN_PLUS, 1.0, a, strings) is None
+    assert fold.fold_binary(scanner.TokenType.TOKEN_LESS, a, b, strings) is None
+
+
+def test_fold_unary():
+    #
+    """
+    """
+    assert fold.fold_unary(scanner.TokenType.TOKEN_BANG, None) is True
+    assert fold.fold_unary(scanner.TokenType.TOKEN_BANG, 0.0) is False
+    assert math.copysign(1.0, fold.fold_unary(scanner.TokenType.TOKEN_MINUS, 0.0)) == -1.0
+    assert fold.fold_unary(scanner.TokenType.TOKEN_MINUS, True) is None
+
+
+def test_compile_folded():
+    #
+    """
+    """
+    for source, expected in [
+        ("print (1 + 2) * -3 - 4 / 8;", -9.5),
+        ('print "a" + "b" + "c";', "abc"),
+    ]:
+        function = compiler.compile(source, chunk.Chunk(), 0)
+        constants = function.bytecode.constants
+
+        assert function.bytecode.code == bytes([
+            chunk.OpCode.OP_CONSTANT, 0,
+            chunk.OpCode.OP_PRINT,
+            chunk.OpCode.OP_NIL,
+            chunk.OpCode.OP_RETURN,
+        ])
+        assert constants.count == 1
+        assert value.format_value(constants.values[0]) == str(expected)
+
+    function = compiler.compile("print !(1 < 2) == false;", chunk.Chunk(), 0)
+    assert function.bytecode.code[0] == chunk.OpCode.OP_TRUE
+
+    # Only literal operands are folded
+    function = compiler.compile("let x = 1; print x + 2 * 3;", chunk.Chunk(), 0)
+    assert function.bytecode.code.count(chunk.OpCode.OP_ADD) == 1
+    assert function.bytecode.code.count(chunk.OpCode.OP_MULTIPLY) == 0
@@ -0,0 +1,117 @@
+import incremental
+import vm
+
+SOURCE = """\
+let total = 0;
+
+fun add(a, b) {
+    return a + b;
+}
+
+for (let i = 0; i < 3; i = i + 1) {
+    total = add(total, i);
+}
+
+print total;
+"""
+
+
+def run(compiler, source):
+    #
+    """
+    """
+    emulator = vm.VM()
+    emulator.strings = compiler.strings
+    emulator.expose = False
+
+    function = compiler.update(source)
+    assert function is not None
+
+    result = emulator.interpret_function(function)
+    assert result == vm.InterpretResult.INTERPRET_OK
+
+    return emulator.result
+
+
+def test_incremental_edit():
+    #
+    """
+    """
+    compiler = incremental.IncrementalCompiler()
+    assert run(compiler, SOURCE) == 3.0
+    assert compiler.compiled_count == 4
+
+    source = SOURCE.replace("i < 3", "i < 5")
+    assert run(compiler, source) == 10.0
+    assert compiler.compiled_count == 1
+
+    source = source.replace("a + b", "a * 2 + b")
+    assert run(compiler, source) == 26.0
+    assert compiler.compiled_count == 1
+
+    source = source + "print total + 1;\n"
+    assert run(compiler, source) == 27.0
+    assert compiler.compiled_count == 1
+
+    # Given as a diff, this edit would start after the common prefix "let "
+    assert compiler.edit(0, 0, "let other = 1;\n") is not None
+    assert compiler.compiled_count == 1
+    assert compiler.source == "let other = 1;\n" + source
+
+
+def test_incremental_lines(capsys):
+    #
+    """
+    """
+    compiler = incremental.IncrementalCompiler()
+    run(compiler, SOURCE)
+
+    compiler.update("\n\n" + SOURCE)
+    assert compiler.compiled_count == 1
+
+    function = compiler.update("\n\n" + SOURCE.replace("print total;", 'print total - "one";'))
+    assert compiler.compiled_count == 1
+
+    emulator = vm.VM()
+    emulator.strings = compiler.strings
+
+    assert emulator.interpret_function(function) == vm.InterpretResult.INTERPRET_RUNTIME_ERROR
+    assert "[line 13 in script]" in capsys.readouterr().out
+
+    # Declaration of add ends on line 7, and its body is on line 6
+    bytecode = compiler.functions[1].bytecode
+    assert bytecode.get_line(0) == 7
+    assert bytecode.constants.values[1].bytecode.get_line(0) == 6
+
+
+def test_incremental_error():
+    #
+    """
+    """
+    compiler = incremental.IncrementalCompiler()
+    run(compiler, SOURCE)
+
+    assert compiler.update(SOURCE.replace("print total;", "print total")) is None
+    assert run(compiler, SOURCE) == 3.0
+
+
+def test_incremental_lexer_error(capsys):
+    #
+    """
+    """
+    compiler = incremental.IncrementalCompiler()
+
+    assert compiler.update('"abc') is None
+    assert "Unterminated string." in capsys.readouterr().out
+
+    # After a declaration that is reused, and before one that is recompiled
+    compiler = incremental.IncrementalCompiler()
+    run(compiler, SOURCE)
+
+    assert compiler.update(SOURCE + '"abc') is None
+    assert run(compiler, SOURCE) == 3.0
+
+    source = "let a = 1;\nlet b = 2;\n"
+    assert compiler.update(source) is not None
+    assert compiler.update(source.replace("1;", "3; @")) is None
+    assert compiler.update(source) is not None
@@ -1,4 +1,4 @@
-from src import memory
+import memory
 
 
 def test_allocate():
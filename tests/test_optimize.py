@@ -0,0 +1,115 @@
+import pytest
+
+import chunk
+import compiler
+import optimize
+import vm
+
+
+def compile_code(source, peephole=True):
+    #
+    """
+    """
+    function = compiler.compile(source, chunk.Chunk(), 0, peephole=peephole)
+    return function.bytecode
+
+
+def test_fused_comparisons():
+    #
+    """
+    """
+    bytecode = compile_code("let a = 1; print a <= 2; print a >= 2; print a != 2;")
+    code = list(bytecode.code)
+
+    assert chunk.OpCode.OP_NOT not in code
+    assert code.count(chunk.OpCode.OP_LESS_EQUAL) == 1
+    assert code.count(chunk.OpCode.OP_GREATER_EQUAL) == 1
+    assert code.count(chunk.OpCode.OP_NOT_EQUAL) == 1
+
+    for source, expected in [
+        ("let a = 1; print a <= 1;", True),
+        ("let a = 1; print a >= 2;", False),
+        ('let a = "a"; print a != "a";', False),
+    ]:
+        emulator = vm.VM()
+        emulator.expose = False
+        assert emulator.interpret(source) == vm.InterpretResult.INTERPRET_OK
+        assert emulator.result is expected
+
+
+def test_popn():
+    #
+    """
+    """
+    bytecode = compile_code("{ let a = 1; let b = 2; let c = 3; }")
+
+    assert bytecode.code[-4:] == bytes([
+        chunk.OpCode.OP_POPN, 3,
+        chunk.OpCode.OP_NIL,
+        chunk.OpCode.OP_RETURN,
+    ])
+    assert chunk.OpCode.OP_POP not in bytecode.code
+
+
+def test_thread_jumps():
+    #
+    """
+    """
+    source = "let a = true; let b = false; let c = true; print (a and b) and c;"
+
+    # The jump for the first and lands on the jump for the second, unless
+    # threaded straight to the end
+    for peephole, expected in [(False, 17), (True, 23)]:
+        bytecode = compile_code(source, peephole)
+        first = bytecode.code.index(chunk.OpCode.OP_JUMP_IF_FALSE)
+
+        assert first + 3 + bytecode.code[first + 2] == expected
+
+    # A jump to a loop instruction becomes a loop
+    source = """
+    let n = 0;
+    for (let i = 0; i < 10; i = i + 1) if (i > 5) n = n + 1; else n = n - 1;
+    print n;
+    """
+    assert compile_code(source).code.count(chunk.OpCode.OP_LOOP) == 3
+
+    emulator = vm.VM()
+    emulator.expose = False
+    assert emulator.interpret(source) == vm.InterpretResult.INTERPRET_OK
+    assert emulator.result == -2.0
+
+
+def test_lines():
+    #
+    """
+    """
+    bytecode = compile_code("let a = 1;\n{\nlet b = 2;\nlet c = 3;\n}\nprint a <= 2;\n")
+
+    popn = bytecode.code.index(chunk.OpCode.OP_POPN)
+    less_equal = bytecode.code.index(chunk.OpCode.OP_LESS_EQUAL)
+
+    assert bytecode.get_line(popn) == 5
+    assert bytecode.get_line(less_equal) == 6
+
+
+def test_too_many_long_jumps():
+    #
+    """
+    """
+    # Each jump skips the padding after the jumps, so all of them are wide
+    count = compiler.UINT16_MAX + 2
+    padding = optimize.Instruction(3 * count, chunk.OpCode.OP_NIL, bytes(compiler.UINT16_MAX), None, 1)
+
+    bytecode = chunk.Chunk()
+    bytecode.count = padding.offset + 1 + len(padding.operand)
+    jumps = [
+        optimize.Instruction(3 * i, chunk.OpCode.OP_JUMP, b"\0\0", bytecode.count, 1, chunk.OpCode.OP_JUMP)
+        for i in range(count)
+    ]
+
+    with pytest.raises(ValueError, match="Too many long jumps in one chunk."):
+        optimize.encode(bytecode, jumps + [padding])
+
+    assert len(bytecode.long_jumps) == 0
+    optimize.encode(bytecode, jumps[1:] + [padding])
+    assert len(bytecode.long_jumps) == compiler.UINT16_MAX + 1
@@ -0,0 +1,131 @@
+import io
+import contextlib
+
+import chunk
+import compiler
+import register
+import vm
+
+
+def run(source, engine):
+    #
+    """
+    """
+    emulator = vm.VM()
+    output = io.StringIO()
+
+    with contextlib.redirect_stdout(output):
+        result = emulator.interpret(source, engine=engine)
+
+    return result, output.getvalue()
+
+
+def test_same_output():
+    #
+    """
+    """
+    source = """
+    fun fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+    print fib(10);
+    {
+        let a = 1;
+        let b = a;
+        a = 5;
+        print b;
+        b = a + b;
+        print b;
+        let s = "x";
+        s = s + "y";
+        print s;
+        print a == b or !a;
+        print -b >= -6 and nil;
+    }
+    let total = 0;
+    for (let i = 0; i < 10; i = i + 1) {
+        let x = i * 2 + 1;
+        if (x > 3 and x <= 15) total = total + x; else total = total - 1;
+    }
+    print total;
+    print fib;
+    """
+
+    assert run(source, "register") == run(source, "stack")
+    assert run(source, "register")[0] == vm.InterpretResult.INTERPRET_OK
+
+
+def test_runtime_errors():
+    #
+    """
+    """
+    for source in [
+        'print 1;\nprint "a" - 1;',
+        "print 1 < nil;",
+        "fun f() { let a = 1; if (a < true) print a; }\nf();",
+        "print missing;",
+        "missing = 1;",
+        "let a = 1; a();",
+    ]:
+        assert run(source, "register") == run(source, "stack")
+        assert run(source, "register")[0] == vm.InterpretResult.INTERPRET_RUNTIME_ERROR
+
+
+    # Both engines check calls the same way
+    for source, message in [
+        ("fun f(a) { return a; } print f();", "Expected 1 arguments but got 0."),
+        ("fun f(a) { return a; } print f(1, 2);", "Expected 1 arguments but got 2."),
+        ("fun f() { f(); } f();", "Stack overflow."),
+    ]:
+        assert run(source, "register") == run(source, "stack")
+        assert run(source, "stack")[0] == vm.InterpretResult.INTERPRET_RUNTIME_ERROR
+        assert run(source, "stack")[1].startswith(message)
+
+
+def test_translate():
+    #
+    """
+    """
+    source = "fun f(n) { let a = n + 1; a = a * 2; while (a < 10) a = a + n; return a; }"
+    script = compiler.compile(source, chunk.Chunk(), 0)
+    function = register.translate(script.bytecode.constants.values[1])
+
+    ops = [instruction[0] for instruction in function.code]
+
+    # Locals and constants are read where they are, results are written
+    # straight to locals, and the loop tests the comparison itself
+    assert register.RegisterOp.OP_MOVE not in ops
+    assert ops == [
+        register.RegisterOp.OP_ADD,
+        register.RegisterOp.OP_MULTIPLY,
+        register.RegisterOp.OP_JUMP_UNLESS_LESS,
+        register.RegisterOp.OP_ADD,
+        register.RegisterOp.OP_JUMP,
+        register.RegisterOp.OP_RETURN,
+    ]
+    assert function.code[0] == (register.RegisterOp.OP_ADD, 2, 1, function.size)
+    assert function.fill[function.size - 2] == 1.0
+
+
+def test_discarded_comparison():
+    #
+    """
+    """
+    source = '{ let a = 1; let b = 2; let x = false; a < b; if (x) print "wrong"; else print "right"; }'
+
+    assert run(source, "register") == run(source, "stack")
+    assert run(source, "register")[1] == "right\n"
+
+
+def test_strip_lines():
+    #
+    """
+    """
+    for engine in ["stack", "register"]:
+        emulator = vm.VM()
+        output = io.StringIO()
+
+        with contextlib.redirect_stdout(output):
+            assert emulator.interpret("print 1;", strip_lines=True, engine=engine) == vm.InterpretResult.INTERPRET_OK
+            assert emulator.interpret('print 1;\nprint -"a";', strip_lines=True, engine=engine) == \
+                vm.InterpretResult.INTERPRET_RUNTIME_ERROR
+
+        assert output.getvalue() == "1.0\n1.0\nOperand must be a number\n[line ? in script]\n"
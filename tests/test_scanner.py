@@ -0,0 +1,94 @@
+import scanner
+
+
+def scan_all(source):
+    #
+    """
+    """
+    reader = scanner.Scanner(source)
+    tokens = []
+
+    while True:
+        token = reader.scan_token()
+        tokens.append(token)
+
+        if token.token_type == scanner.TokenType.TOKEN_EOF:
+            return reader, tokens
+
+
+def test_scan_token():
+    #
+    """
+    """
+    source = 'let total = 1.5; // comment\nif (total >= 2) print "two\nlines";\nselfish'
+    reader, tokens = scan_all(source)
+
+    assert [token.token_type for token in tokens] == [
+        scanner.TokenType.TOKEN_VAR,
+        scanner.TokenType.TOKEN_IDENTIFIER,
+        scanner.TokenType.TOKEN_EQUAL,
+        scanner.TokenType.TOKEN_NUMBER,
+        scanner.TokenType.TOKEN_SEMICOLON,
+        scanner.TokenType.TOKEN_IF,
+        scanner.TokenType.TOKEN_LEFT_PAREN,
+        scanner.TokenType.TOKEN_IDENTIFIER,
+        scanner.TokenType.TOKEN_GREATER_EQUAL,
+        scanner.TokenType.TOKEN_NUMBER,
+        scanner.TokenType.TOKEN_RIGHT_PAREN,
+        scanner.TokenType.TOKEN_PRINT,
+        scanner.TokenType.TOKEN_STRING,
+        scanner.TokenType.TOKEN_SEMICOLON,
+        scanner.TokenType.TOKEN_IDENTIFIER,
+        scanner.TokenType.TOKEN_EOF,
+    ]
+
+    assert [reader.lexeme(token) for token in tokens[1:4]] == ["total", "=", "1.5"]
+    assert reader.lexeme(tokens[12]) == '"two\nlines"'
+    assert reader.lexeme(tokens[14]) == "selfish"
+    assert [token.line for token in tokens[4:6]] == [1, 2]
+    assert tokens[12].line == 3
+    assert tokens[-1].line == 4
+
+
+def test_scan_token_error():
+    #
+    """
+    """
+    _, tokens = scan_all("1 @ 2")
+    assert tokens[1].token_type == scanner.TokenType.TOKEN_ERROR
+
+    reader, tokens = scan_all('print "never\nclosed')
+    assert tokens[1].token_type == scanner.TokenType.TOKEN_ERROR
+    assert reader.error_message == "Unterminated string."
+    assert tokens[-1].token_type == scanner.TokenType.TOKEN_EOF
+
+
+def test_stream_scanner(tmp_path):
+    #
+    """
+    """
+    source = 'let s = "café";\n// comment\nprint s;'
+    path = tmp_path / "stream.lox"
+    path.write_bytes(source.encode("UTF-8"))
+
+    _, expected = scan_all(source)
+
+    with scanner.StreamScanner(str(path)) as reader:
+        tokens = []
+
+        while True:
+            token = reader.scan_token()
+            tokens.append(token)
+
+            if token.token_type == scanner.TokenType.TOKEN_EOF:
+                break
+
+        assert reader.lexeme(tokens[3]) == '"café"'
+
+    assert [token.token_type for token in tokens] == [token.token_type for token in expected]
+    assert [token.line for token in tokens] == [token.line for token in expected]
+
+    path.write_bytes(b"")
+
+    with scanner.StreamScanner(str(path)) as reader:
+        assert reader.scan_token().token_type == scanner.TokenType.TOKEN_EOF
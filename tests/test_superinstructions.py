@@ -0,0 +1,143 @@
+import io
+import contextlib
+
+import chunk
+import compiler
+import debug
+import superinstructions
+import vm
+
+LOOP = """
+let total = 0;
+for (let i = 0; i < 100; i = i + 1) { let x = i * 2 + 1; if (x > 10 and x < 150) total = total + x; }
+print total;
+"""
+
+
+def record(source):
+    #
+    """
+    """
+    profile = superinstructions.Profile()
+    emulator = vm.VM()
+    emulator.expose = False
+    emulator.profile = profile
+
+    assert emulator.interpret(source) == vm.InterpretResult.INTERPRET_OK
+    return profile, emulator.result
+
+
+def run(source, fused):
+    #
+    """
+    """
+    emulator = vm.VM(fused)
+    emulator.expose = False
+    return emulator.interpret(source), emulator.result
+
+
+def test_profile_round_trip(tmp_path):
+    #
+    """
+    """
+    profile, _ = record(LOOP)
+    path = str(tmp_path / "profile.json")
+    profile.save(path)
+
+    loaded = superinstructions.Profile.load(path)
+
+    assert loaded.dispatches == profile.dispatches
+    assert loaded.counts == profile.counts
+    assert all(2 <= len(sequence) <= superinstructions.MAX_LENGTH for sequence in loaded.counts)
+
+
+def test_from_profile():
+    #
+    """
+    """
+    profile, _ = record(LOOP)
+    fused = superinstructions.SuperinstructionSet.from_profile(profile)
+
+    assert fused.sequences
+    assert all(superinstructions.is_fusable(sequence) for sequence in fused.sequences)
+
+    # Shifted windows over the same instructions are not all chosen
+    for i, a in enumerate(fused.sequences):
+        for b in fused.sequences[i + 1:]:
+            assert a[1:] != b[:-1]
+
+
+def test_same_results():
+    #
+    """
+    """
+    profile, expected = record(LOOP)
+    fused = superinstructions.SuperinstructionSet.from_profile(profile)
+
+    assert run(LOOP, fused) == (vm.InterpretResult.INTERPRET_OK, expected)
+
+    fib = "fun fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); } print fib(10);"
+    assert run(fib, fused) == (vm.InterpretResult.INTERPRET_OK, 55.0)
+
+    # Strings take the same handlers as without superinstructions
+    strings = 'let s = "a"; for (let i = 0; i < 3; i = i + 1) { s = s + "b"; } print s;'
+    result, text = run(strings, fused)
+
+    assert result == vm.InterpretResult.INTERPRET_OK
+    assert text.chars == "abbb"
+
+
+def test_profile_fused():
+    #
+    """
+    """
+    profile, _ = record(LOOP)
+    fused = superinstructions.SuperinstructionSet.from_profile(profile)
+
+    fused_profile = superinstructions.Profile()
+    emulator = vm.VM(fused)
+    emulator.expose = False
+    emulator.profile = fused_profile
+
+    assert emulator.interpret(LOOP) == vm.InterpretResult.INTERPRET_OK
+    assert fused_profile.dispatches == profile.dispatches
+    assert fused_profile.counts == profile.counts
+
+
+def test_runtime_error():
+    #
+    """
+    """
+    sequence = (chunk.OpCode.OP_GET_LOCAL, chunk.OpCode.OP_CONSTANT, chunk.OpCode.OP_LESS)
+    fused = superinstructions.SuperinstructionSet([sequence])
+
+    source = '{\nlet a = "a";\nprint a < 1;\n}'
+    bytecode = compiler.compile(source, chunk.Chunk(), 0, superinstructions=fused).bytecode
+    assert fused.first_opcode in bytecode.code
+
+    emulator = vm.VM(fused)
+    output = io.StringIO()
+
+    with contextlib.redirect_stdout(output):
+        assert emulator.interpret(source) == vm.InterpretResult.INTERPRET_RUNTIME_ERROR
+
+    assert output.getvalue() == "Operands must be numbers.\n[line 3 in script]\n"
+
+
+def test_disassemble():
+    #
+    """
+    """
+    sequence = (chunk.OpCode.OP_GET_LOCAL, chunk.OpCode.OP_CONSTANT, chunk.OpCode.OP_LESS,
+                chunk.OpCode.OP_JUMP_IF_FALSE)
+    fused = superinstructions.SuperinstructionSet([sequence])
+
+    source = "{ let a = 1; if (a < 2) print a; }"
+    bytecode = compiler.compile(source, chunk.Chunk(), 0, superinstructions=fused).bytecode
+    output = io.StringIO()
+
+    with contextlib.redirect_stdout(output):
+        debug.disassemble_chunk(bytecode, "test")
+
+    assert "OP_GET_LOCAL+OP_CONSTANT+OP_LESS+OP_JUMP_IF_FALSE" in output.getvalue()
+    assert run(source, fused) == (vm.InterpretResult.INTERPRET_OK, 1.0)
@@ -1,7 +1,9 @@
+import random
+
 import pytest
 
-from src import table
-from src import value
+import table
+import value
 
 
 def test_init_table():
@@ -9,25 +11,27 @@ def test_init_table():
     """
     """
     hash_table = table.Table()
+    strings = table.Table()
 
     assert hash_table.count == 0
     assert hash_table.capacity == 0
-    assert hash_table.entries is None
+    assert hash_table.keys is None
+    assert hash_table.values is None
 
-    k1 = value.copy_string("key", 3)
-    v1 = value.copy_string("value", 5)
+    k1 = value.copy_string("key", 3, strings)
+    v1 = value.copy_string("value", 5, strings)
     hash_table.table_set(k1, v1)
 
     assert hash_table.count == 1
     assert hash_table.capacity == 8
-    assert hash_table.entries is not None
+    assert len(hash_table.keys) == len(hash_table.values) == 8
     
-    k2 = value.copy_string("key", 3)
+    k2 = value.copy_string("key", 3, strings)
     result = hash_table.table_get(k2)
 
-    assert result.obj.is_string()
+    assert value.is_string(result)
     assert result.length == 5
-    assert result.chars == ['v', 'a', 'l', 'u', 'e', '\x00']
+    assert result.chars == "value"
 
     hash_table.table_delete(k2)
 
@@ -39,4 +43,160 @@ def test_init_table():
 
     assert hash_table.count == 0
     assert hash_table.capacity == 0
-    assert hash_table.entries is None
+    assert hash_table.keys is None
+    assert hash_table.values is None
+
+
+def test_intern_strings():
+    #
+    """
+    """
+    strings = table.Table()
+
+    a = value.copy_string("key", 3, strings)
+    b = value.copy_string("a key", 5, strings)
+    c = value.take_string("key", 3, strings)
+
+    assert a is c
+    assert a is not b
+    assert strings.count == 2
+    assert strings.hits == 1
+    assert strings.misses == 2
+    assert strings.find_string("value", 5, value.hash_string("value", 5)) is None
+    assert strings.misses == 3
+
+
+def test_table_grow():
+    #
+    """
+    """
+    hash_table = table.Table()
+    strings = table.Table()
+    keys = [value.copy_string("key{}".format(i), len("key{}".format(i)), strings) for i in range(1000)]
+
+    for i, key in enumerate(keys):
+        assert hash_table.table_set(key, float(i))
+
+    assert hash_table.count == 1000
+    assert hash_table.capacity == 2048
+
+    for key in keys[::2]:
+        assert hash_table.table_delete(key)
+
+    assert not hash_table.table_delete(keys[0])
+    assert hash_table.table_get(keys[0]) is None
+    assert hash_table.table_get(keys[1]) == 1.0
+    assert not hash_table.table_set(keys[1], None)
+    assert hash_table.table_get(keys[1], "missing") is None
+    assert hash_table.table_set(keys[0], 0.0)
+
+    other = table.Table()
+    other.table_add_all(hash_table)
+
+    assert other.table_get(keys[0]) == 0.0
+    assert other.table_get(keys[2]) is None
+    assert other.count == 501
+
+
+@pytest.mark.parametrize("strategy", list(table.ProbeStrategy))
+def test_table_strategy(strategy):
+    #
+    """
+    """
+    random.seed(0)
+    hash_table = table.Table(strategy)
+    strings = table.Table()
+    keys = [value.copy_string("k{}".format(i), len("k{}".format(i)), strings) for i in range(300)]
+    expected = {}
+
+    for _ in range(3000):
+        key = random.choice(keys)
+
+        if random.random() < 0.4:
+            assert hash_table.table_delete(key) == (key in expected)
+            expected.pop(key, None)
+        else:
+            assert hash_table.table_set(key, key.length) == (key not in expected)
+            expected[key] = key.length
+
+    for key in keys:
+        assert hash_table.table_get(key, "missing") == expected.get(key, "missing")
+
+    stats = hash_table.stats()
+
+    assert stats.count == len(expected)
+    assert stats.max_probe_length >= stats.average_probe_length >= 1.0
+    assert stats.resize_count > 0
+
+    if strategy == table.ProbeStrategy.PROBE_ROBIN_HOOD:
+        assert stats.tombstone_ratio == 0.0
+        assert hash_table.count == len(expected)
+
+
+@pytest.mark.parametrize("strategy", list(table.ProbeStrategy))
+def test_table_shrink(strategy):
+    #
+    """
+    """
+    hash_table = table.Table(strategy)
+    strings = table.Table()
+    keys = [value.copy_string("k{}".format(i), len("k{}".format(i)), strings) for i in range(1000)]
+
+    for key in keys:
+        hash_table.table_set(key, None)
+
+    assert hash_table.capacity == 2048
+
+    for key in keys[:990]:
+        hash_table.table_delete(key)
+
+    assert hash_table.capacity <= 64
+    assert hash_table.stats().count == 10
+    assert all(hash_table.table_get(key, "missing") is None for key in keys[990:])
+
+    hash_table.compact()
+
+    assert hash_table.capacity == 32
+    assert hash_table.tombstones == 0
+    assert hash_table.count == 10
+
+
+def test_table_churn():
+    #
+    """
+    """
+    hash_table = table.Table()
+    strings = table.Table()
+    keys = [value.copy_string("k{}".format(i), len("k{}".format(i)), strings) for i in range(4000)]
+
+    for i in range(100):
+        hash_table.table_set(keys[i], None)
+
+    # Replace each key by a new one, so every insert lands in a fresh slot
+    for i in range(100, 4000):
+        hash_table.table_delete(keys[i - 100])
+        hash_table.table_set(keys[i], None)
+
+        assert hash_table.tombstones <= hash_table.capacity * table.TABLE_MAX_TOMBSTONES
+
+    assert hash_table.capacity == 256
+    assert hash_table.stats().count == 100
+
+
+@pytest.mark.parametrize("strategy", [table.ProbeStrategy.PROBE_LINEAR, table.ProbeStrategy.PROBE_ROBIN_HOOD])
+def test_uninterned_keys(strategy):
+    #
+    """
+    """
+    hash_table = table.Table(strategy)
+    key = value.copy_string("key", 3, table.Table())
+    other = value.take_string("k" + "ey", 3)
+
+    assert other is not key
+
+    hash_table.table_set(key, 1.0)
+    assert hash_table.table_get(other) == 1.0
+    assert not hash_table.table_set(other, 2.0)
+    assert hash_table.table_get(key) == 2.0
+    assert hash_table.table_delete(other)
+    assert hash_table.table_get(key) is None
@@ -0,0 +1,108 @@
+import scanner
+import tokens
+import vm
+
+SOURCE = """\
+fun add(a, b) {
+    return a + b; // sum
+}
+
+let s = "multi
+line";
+print add(1, 2.5);"""
+
+
+def test_tokenize():
+    #
+    """
+    """
+    stream = tokens.tokenize(SOURCE)
+    reader = scanner.Scanner(SOURCE)
+
+    for index in range(stream.count):
+        expected = reader.scan_token()
+        token = stream.token(index)
+
+        assert token.token_type == expected.token_type
+        assert (token.start, token.length, token.line) == (expected.start, expected.length, expected.line)
+
+    assert token.token_type == scanner.TokenType.TOKEN_EOF
+
+
+def test_tokenize_errors():
+    #
+    """
+    """
+    for source in ['print "" + "a";\n@ 1.5.x', 'let a = 1;\n"never\nclosed', "let \u00e9 = 1;", ""]:
+        stream = tokens.tokenize(source)
+        reader = scanner.Scanner(source)
+
+        for index in range(stream.count):
+            expected = reader.scan_token()
+            token = stream.token(index)
+
+            assert token.token_type == expected.token_type
+            assert (token.start, token.length, token.line) == (expected.start, expected.length, expected.line)
+
+            if token.token_type == scanner.TokenType.TOKEN_ERROR:
+                assert stream.messages[index] == reader.error_message
+
+        assert token.token_type == scanner.TokenType.TOKEN_EOF
+
+
+def test_token_stream_bytes():
+    #
+    """
+    """
+    stream = tokens.tokenize(SOURCE + " @")
+    copy = tokens.TokenStream.from_bytes(stream.to_bytes())
+
+    assert copy.count == stream.count
+    assert copy.types == stream.types
+    assert copy.starts == stream.starts
+    assert copy.lengths == stream.lengths
+    assert copy.lines == stream.lines
+    assert copy.messages == {stream.count - 2: "Unexpected character."}
+
+
+def test_token_reader():
+    #
+    """
+    """
+    stream = tokens.TokenStream.from_bytes(tokens.tokenize(SOURCE).to_bytes())
+
+    emulator = vm.VM()
+    result = emulator.interpret(tokens.TokenReader(stream, SOURCE), 0, False)
+
+    assert result == vm.InterpretResult.INTERPRET_OK
+    assert emulator.result == 3.5
+
+
+def assert_same_stream(stream, expected):
+    #
+    """
+    """
+    assert stream.count == expected.count
+    assert stream.types == expected.types
+    assert stream.starts == expected.starts
+    assert stream.lengths == expected.lengths
+    assert stream.lines == expected.lines
+    assert stream.messages == expected.messages
+
+
+def test_tokenize_parallel():
+    #
+    """
+    """
+    lines = ["let a{} = {}; // comment \"".format(i, i) for i in range(40)]
+    lines[10] = 'let s = "starts here'
+    lines[25] = 'and ends here";'
+    lines[30] = 'print "spans\n\n\n\nmany lines";'
+    source = "\n".join(lines) + '\nprint "never closed\n'
+
+    for workers in [2, 3, 4, 7]:
+        stream = tokens.tokenize_parallel(source, workers, min_size=0)
+        assert_same_stream(stream, tokens.tokenize(source))
+
+    assert tokens.split_lines(source, 4)[0] == 0
+    assert_same_stream(tokens.tokenize_parallel("", 4, min_size=0), tokens.tokenize(""))
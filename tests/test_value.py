@@ -1,15 +1,44 @@
 import pytest
 
-from src import value
+import table
+import value
 
 
-def test_allocate_object():
+def test_unboxed_values():
     # type: () -> None
-    """Checks allocate_objects creates a container as intended."""
-    item = value.allocate_object(size=8, object_type=value.ObjectType.OBJ_STRING)
-
+    """Checks primitives are held as Python values and objects as their own
+    classes."""
+    item = value.copy_string("hi", 2)
+
+    assert value.is_number(1.0) and not value.is_number(True)
+    assert value.is_bool(False) and not value.is_bool(0.0)
+    assert value.is_nil(None)
+    assert value.is_obj(item) and value.is_string(item)
     assert item.object_type == value.ObjectType.OBJ_STRING
-    assert item.obj == [None] * 8
+    assert value.is_function(value.new_function())
+
+
+def test_values_equal():
+    # type: () -> None
+    """Checks equality follows Lox rather than Python semantics."""
+    assert value.values_equal(1.0, 1.0)
+    assert not value.values_equal(True, 1.0)
+    assert not value.values_equal(None, False)
+    strings = table.Table()
+
+    assert value.values_equal(
+        value.copy_string("hi", 2, strings),
+        value.copy_string("hi", 2, strings),
+    )
+
+
+def test_format_value():
+    # type: () -> None
+    """Checks values print as Lox values."""
+    assert value.format_value(None) == "nil"
+    assert value.format_value(True) == "true"
+    assert value.format_value(2.5) == "2.5"
+    assert value.format_value(value.copy_string("hi", 2)) == "hi"
 
 
 def test_copy_string():
@@ -17,23 +46,22 @@ def test_copy_string():
     """Checks copy_string converts strings as intended."""
     item = value.copy_string("", 0)
 
-    assert value.copy_string("hi", 2).chars == ['h', 'i', '\x00']
-    assert value.copy_string("hi", 1).chars == ['h', '\x00']
-    assert value.copy_string("hi", 0).chars == ['\x00']
-
-    with pytest.raises(IndexError):
-        assert value.copy_string("hi", 3).chars == ['h', 'i','\x00']
+    assert item.chars == ""
+    assert item.length == 0
+    assert value.copy_string("hi", 2).chars == "hi"
+    assert value.copy_string("hi", 1).chars == "h"
+    assert value.copy_string("hi", 1).length == 1
 
 
 def test_allocate_string():
     # type: () -> None
     """Checks allocate_string stores arguments in a ObjectString as
     intended."""
-    item = value.allocate_string(['\x00'], 0,  value.FNV_32_INIT)
+    item = value.allocate_string("", 0, value.FNV_32_INIT)
 
-    assert item.obj.is_string()
+    assert value.is_string(item)
     assert item.length == 0
-    assert item.chars == ['\x00']
+    assert item.chars == ""
     assert item.hash_value == value.FNV_32_INIT
 
 
@@ -41,7 +69,36 @@ def test_hash_string():
     #
     """
     """
-    assert value.hash_string(['f', 'n', 'v', '\x00'], 3) == 0xb2f5cb99
+    assert value.hash_string("fnv", 3) == 0xb2f5cb99
+    assert value.copy_string("fnv", 3).hash_value == 0xb2f5cb99
+
+
+def test_hash_lazy():
+    #
+    """
+    """
+    item = value.take_string("fnv", 3)
+
+    assert item._hash_value is None
+    assert item.hash_value == 0xb2f5cb99
+    assert item._hash_value == 0xb2f5cb99
+
+
+def test_hash_strings():
+    #
+    """
+    """
+    chars_list = ["", "fnv", "a longer string", "caf\u00e9"] * 20
+    expected = [value.hash_string(chars, len(chars)) for chars in chars_list]
+
+    assert value.hash_strings(chars_list) == expected
+    assert value.hash_strings(chars_list[:3]) == expected[:3]
+
+    # Long strings past the bulk loop
+    chars_list += ["x" * 1000, "y" * 5000, "caf\u00e9" * 300]
+    expected = [value.hash_string(chars, len(chars)) for chars in chars_list]
+
+    assert value.hash_strings(chars_list) == expected
 
 
 @pytest.fixture
@@ -80,3 +137,25 @@ def test_free_value_array(array):
     assert array.count == 0
     assert array.capacity == 0
     assert array.values is None
+
+
+def test_new_rope():
+    #
+    """
+    """
+    short = value.new_rope(value.copy_string("ab", 2), value.copy_string("cd", 2))
+
+    assert not short.is_rope()
+    assert short.chars == "abcd"
+
+    piece = value.copy_string("x" * 40, 40)
+    rope = piece
+
+    for _ in range(5000):
+        rope = value.new_rope(rope, piece)
+
+    assert rope.is_rope()
+    assert rope.length == 40 * 5001
+    assert rope.chars == "x" * 40 * 5001
+    assert not rope.is_rope()
+    assert rope.hash_value == value.hash_string(rope.chars, rope.length)
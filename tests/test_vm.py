@@ -1,15 +1,16 @@
-from src import chunk
-from src import compiler
-from src import value
-from src import vm
+import chunk
+import compiler
+import scanner
+import value
+import vm
 
 
 def test_concatenate():
     #
     """
     """
-    a = value.obj_val(value.take_string("str", 3))
-    b = value.obj_val(value.take_string("ing", 3))
+    a = value.take_string("str", 3)
+    b = value.take_string("ing", 3)
 
     emulator = vm.VM()
     emulator.push(a)
@@ -18,4 +19,205 @@ def test_concatenate():
     emulator.concatenate()
 
     result = emulator.pop()
-    assert result.as_cstring() == ['s', 't', 'r', 'i', 'n', 'g', '\x00']
+    assert result.chars == "string"
+    assert result.length == 6
+    assert result.hash_value == value.hash_string("string", 6)
+
+
+def test_dispatch_table():
+    #
+    """
+    """
+    emulator = vm.VM()
+
+    assert len(emulator.dispatch) == len(chunk.OpCode)
+    assert emulator.dispatch[chunk.OpCode.OP_RETURN] == emulator.op_return
+
+
+def test_interpret_call():
+    #
+    """
+    """
+    source = """\
+fun add(a, b) {
+    return a + b;
+}
+
+print add(1, 2) + add(3, 4);"""
+
+    emulator = vm.VM()
+    result = emulator.interpret(source, 0, False)
+
+    assert result == vm.InterpretResult.INTERPRET_OK
+    assert emulator.result == 10.0
+
+
+def test_interpret_long_jump():
+    #
+    """
+    """
+    source = "{\nlet total = 1;\nif (true) {\n" + "total = total + total;\n" * 40 + "}\nprint total;\n}"
+
+    emulator = vm.VM()
+    result = emulator.interpret(source, 0, False)
+
+    assert result == vm.InterpretResult.INTERPRET_OK
+    assert emulator.result == 2.0**40
+
+
+def test_interpret_wide_constants():
+    #
+    """
+    """
+    source = "".join("let g{} = {};\n".format(i, i) for i in range(300)) + "g299 = g299 + g1;\nprint g299;"
+
+    emulator = vm.VM()
+    result = emulator.interpret(source, 0, False)
+
+    assert result == vm.InterpretResult.INTERPRET_OK
+    assert emulator.result == 300.0
+
+
+def test_interpret_wide_jump():
+    #
+    """
+    """
+    body = "total = total + 1;\n" * 9000
+    source = "{\nlet total = 0;\nlet i = 0;\nwhile (i < 2) {\n" + body + "i = i + 1;\n}\nif (false) {\n" + body + "}\nprint total;\n}"
+
+    emulator = vm.VM()
+    result = emulator.interpret(source, 0, False)
+
+    assert result == vm.InterpretResult.INTERPRET_OK
+    assert emulator.result == 18000.0
+
+
+def test_interpret_arithmetic():
+    #
+    """
+    """
+    emulator = vm.VM()
+    emulator.interpret("print (7 - 3) * 2 / 4;", 0, False)
+    assert emulator.result == 2.0
+
+    emulator.interpret("print 3 < 7;", 0, False)
+    assert emulator.result is True
+
+    emulator.interpret("print 3 > 7;", 0, False)
+    assert emulator.result is False
+
+
+def test_interpret_arithmetic_type_error():
+    #
+    """
+    """
+    emulator = vm.VM()
+    result = emulator.interpret('print 1 - "one";', 0, False)
+
+    assert result == vm.InterpretResult.INTERPRET_RUNTIME_ERROR
+
+
+def test_interpret_nil_global():
+    #
+    """
+    """
+    emulator = vm.VM()
+    result = emulator.interpret("let nothing;\nprint nothing;", 0, False)
+
+    assert result == vm.InterpretResult.INTERPRET_OK
+    assert emulator.result is None
+
+
+def test_interpret_interned_strings():
+    #
+    """
+    """
+    source = """\
+let breakfast = "beignets";
+let copy = "beig" + "nets";
+print breakfast == copy;"""
+
+    emulator = vm.VM()
+    emulator.interpret(source, 0, False)
+
+    assert emulator.result is True
+    assert emulator.strings.hits > 0
+
+
+def test_interpret_other_intern_table():
+    #
+    """
+    """
+    # Global names compiled without the intern table of the VM
+    emulator = vm.VM()
+    emulator.expose = False
+
+    for source in ["let total = 1;", "total = total + 1;", "print total;"]:
+        function = compiler.compile(source, chunk.Chunk(), 0)
+        assert emulator.interpret_function(function) == vm.InterpretResult.INTERPRET_OK
+
+    assert emulator.result == 2.0
+
+
+def test_interpret_concatenate_loop():
+    #
+    """
+    """
+    source = """\
+let breakfast = "beignets";
+
+for (let counter = 0; counter < 200; counter = counter + 1) {
+    breakfast = breakfast + " and beignets";
+}
+
+print breakfast;"""
+
+    emulator = vm.VM()
+    emulator.interpret(source, 0, False)
+
+    assert value.format_value(emulator.result) == "beignets" + " and beignets" * 200
+
+
+def test_runtime_error_line(capsys):
+    #
+    """
+    """
+    source = 'let a = 1;\nlet b = "two";\nprint a - b;'
+
+    emulator = vm.VM()
+    assert emulator.interpret(source) == vm.InterpretResult.INTERPRET_RUNTIME_ERROR
+    assert "[line 3 in script]" in capsys.readouterr().out
+
+    emulator = vm.VM()
+    assert emulator.interpret(source, strip_lines=True) == vm.InterpretResult.INTERPRET_RUNTIME_ERROR
+    assert "[line ? in script]" in capsys.readouterr().out
+
+
+def test_call_errors(capsys):
+    #
+    """
+    """
+    for source, message in [
+        ("fun f(a, b) { return a; }\nprint f(1);", "Expected 2 arguments but got 1."),
+        ("fun f() { f(); }\nf();", "Stack overflow."),
+    ]:
+        emulator = vm.VM()
+        assert emulator.interpret(source) == vm.InterpretResult.INTERPRET_RUNTIME_ERROR
+        assert capsys.readouterr().out.startswith(message + "\n")
+
+
+def test_interpret_stream_scanner(tmp_path):
+    #
+    """
+    """
+    path = tmp_path / "script.lox"
+    path.write_bytes('let s = "café";\nprint s + "!";'.encode("UTF-8"))
+
+    emulator = vm.VM()
+
+    with scanner.StreamScanner(str(path)) as reader:
+        result = emulator.interpret(reader, 0, False)
+
+    assert result == vm.InterpretResult.INTERPRET_OK
+    assert value.format_value(emulator.result) == "café!"
+    assert emulator.result.length == 5